@@ -5,6 +5,7 @@ Usage:
 
 Commands:
     enhance         Calculate cost of enhancing gear
+    stats           Display operational metrics of the calculation engine
 
 See 'crone <command> --help' for more information on a specific command.                 
                     
@@ -19,12 +20,14 @@ import subprocess
 
 from docopt import docopt 
 
+import lib.daemon.client
+
 def main() :
     args = docopt (__doc__,
                     version="crone version 0.0.1",
                     options_first=True)
 
-    if args["<command>"] in "enhance".split(" "):
+    if args["<command>"] in "enhance stats".split(" "):
         # In case <command> is a valid command
         # The choice is to import the required parser module and pass the options to it
         # Motivation: decouple implementation of the parser from the implementation
@@ -33,6 +36,16 @@ def main() :
         imported = importlib.import_module(full_module_name)
         args_for_imported_module = [args["<command>"]] + args["<args>"]
         new_args = docopt(imported.__doc__, argv=args_for_imported_module)
+        # Parser modules list their options holding paths in PATH_OPTIONS. The paths are relative
+        # to the current folder, but the daemon runs in the package folder, so they are made absolute
+        for _option in getattr(imported, "PATH_OPTIONS", []):
+            if new_args.get(_option) is not None:
+                new_args[_option] = os.path.abspath(new_args[_option])
+        # Hand the parsed options over to the background daemon if there is one,
+        # so that the calculation engine does not need to be imported on every call
+        status = lib.daemon.client.forward(args["<command>"], new_args)
+        if status is not None:
+            exit(status)
         imported.main(**new_args)
     elif args["<command>"] in ["help", None]:
         # In case there are no
@@ -0,0 +1,5 @@
+"""Short description of the module daemon
+This module keeps a warm crone process around, so that repeated crone calls
+from shell loops do not pay for importing the calculation engine each time.
+
+"""
@@ -0,0 +1,74 @@
+import os
+import socket
+import stat
+import struct
+import tempfile
+
+# Set to a non-empty value to always run commands in the calling process
+NO_DAEMON_ENV = "CRONE_NO_DAEMON"
+# Path of the Unix domain socket the daemon listens on
+SOCKET_PATH_ENV = "CRONE_SOCKET"
+# Number of seconds without a request after which the daemon exits
+IDLE_TIMEOUT_ENV = "CRONE_DAEMON_TIMEOUT"
+
+DEFAULT_IDLE_TIMEOUT = 600
+CONNECT_TIMEOUT = 0.5
+# Seconds a client has to send its request, so an idle client does not hold a connection
+REQUEST_TIMEOUT = 5.0
+
+
+def daemon_supported() -> bool:
+    """Returns True if the daemon can be used on this platform and is not disabled."""
+    return hasattr(socket, "AF_UNIX") and not os.environ.get(NO_DAEMON_ENV)
+
+
+def runtime_dir() -> str:
+    """Returns the private directory of the daemon socket and lock, created if needed.
+
+    The directory is in $XDG_RUNTIME_DIR or, without it, in the temporary directory.
+    It must be a real directory owned by the current user and accessible only by them,
+    so that other local users cannot replace the socket or the lock with their own.
+
+    Returns:
+        Path of the directory or None, if it cannot be created or is not private.
+    """
+    base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    path = os.path.join(base, "crone-{}".format(os.getuid()))
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    except OSError:
+        return None
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) & 0o077:
+        return None
+    return path
+
+
+def socket_path() -> str:
+    """Returns the path of the daemon socket for the current user, None if there is no safe one."""
+    if os.environ.get(SOCKET_PATH_ENV):
+        return os.environ[SOCKET_PATH_ENV]
+    directory = runtime_dir()
+    if directory is None:
+        return None
+    return os.path.join(directory, "crone.sock")
+
+
+def peer_trusted(connection: socket.socket) -> bool:
+    """Returns True if the other end of the Unix socket 'connection' runs as the current user.
+
+    Where the platform does not report the peer (no SO_PEERCRED), the private directory
+    of the socket, see runtime_dir(), is the only protection and the peer is trusted.
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return True
+    credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    _pid, uid, _gid = struct.unpack("3i", credentials)
+    return uid == os.getuid()
+
+
+def idle_timeout() -> float:
+    """Returns the idle timeout of the daemon in seconds."""
+    return float(os.environ.get(IDLE_TIMEOUT_ENV, DEFAULT_IDLE_TIMEOUT))
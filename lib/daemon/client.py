@@ -0,0 +1,94 @@
+"""Client side of the crone daemon.
+
+The client never imports the calculation engine. It sends the already parsed
+command line arguments to the daemon and prints whatever the daemon replies with.
+If there is no daemon yet, one is started in the background and the current
+call is left to run in the calling process. The same happens when the daemon
+asks for a restart, because the code or the tables changed since it started.
+
+The daemon runs in the package folder, so relative paths in the arguments have
+to be made absolute before forwarding them (see PATH_OPTIONS in crone.py).
+
+"""
+import json
+import os
+import pathlib
+import socket
+import subprocess
+import sys
+
+from lib.daemon._utils import CONNECT_TIMEOUT
+from lib.daemon._utils import daemon_supported
+from lib.daemon._utils import peer_trusted
+from lib.daemon._utils import socket_path
+
+PACKAGE_ROOT = pathlib.Path(pathlib.Path(__file__).parent.parent.parent)
+
+
+def forward(command: str, args: dict):
+    """Runs a crone command in the daemon.
+
+    Args:
+        command: name of the crone command, e.g. "enhance"
+        args: arguments of the command as parsed by docopt
+
+    Returns:
+        Exit status of the command or None, if the command could not be run
+        in the daemon and needs to be run in the calling process.
+    """
+    if not daemon_supported():
+        return None
+    path = socket_path()
+    if path is None:
+        return None
+
+    try:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(CONNECT_TIMEOUT)
+        connection.connect(path)
+    except OSError:
+        connection.close()
+        _start_daemon()
+        return None
+
+    if not peer_trusted(connection):
+        # The socket is served by another user, its output cannot be trusted
+        connection.close()
+        return None
+
+    with connection:
+        # Commands may take a while, so only the connection attempt is time limited
+        connection.settimeout(None)
+        request = json.dumps({"command": command, "args": args}) + "\n"
+        try:
+            connection.sendall(request.encode("utf-8"))
+            reply = connection.makefile("rb").readline()
+        except OSError:
+            return None
+
+    if not reply:
+        # Daemon exited (e.g. idle timeout) between accepting and answering
+        return None
+
+    response = json.loads(reply.decode("utf-8"))
+    if response.get("restart"):
+        # The daemon exits, the next call starts a new one
+        return None
+    sys.stdout.write(response["stdout"])
+    sys.stdout.flush()
+    sys.stderr.write(response["stderr"])
+    sys.stderr.flush()
+    return response["status"]
+
+
+def _start_daemon() -> None:
+    """Starts the daemon in a detached background process."""
+    try:
+        subprocess.Popen([sys.executable, "-m", "lib.daemon.server"],
+                         cwd=str(PACKAGE_ROOT),
+                         stdin=subprocess.DEVNULL,
+                         stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL,
+                         start_new_session=True)
+    except OSError:
+        pass
@@ -0,0 +1,216 @@
+"""Server side of the crone daemon.
+
+Usage:
+    python -m lib.daemon.server
+
+The daemon imports the calculation engine once and then answers requests sent
+by lib.daemon.client over a Unix domain socket, each in its own thread, so a
+long command (e.g. a session simulation) does not hold up the others. Each
+request is run through the same main() function the command would use
+in-process, with its standard output and standard error captured, so the
+printed output does not depend on where the command was run. The daemon exits
+after being idle for CRONE_DAEMON_TIMEOUT seconds.
+
+The daemon only serves the code and data it was started with. When the sources
+in lib or the tables and the answer cube in data change, it answers the next
+request with a restart, so the client runs the command itself, and exits.
+
+The socket and its lock are kept in a directory only the user can access (see
+lib.daemon._utils.runtime_dir()) and connections from other users are refused.
+
+"""
+import contextlib
+import fcntl
+import importlib
+import io
+import json
+import os
+import pathlib
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+
+from lib.daemon._utils import REQUEST_TIMEOUT
+from lib.daemon._utils import idle_timeout
+from lib.daemon._utils import peer_trusted
+from lib.daemon._utils import socket_path
+
+PACKAGE_ROOT = pathlib.Path(pathlib.Path(__file__).parent.parent.parent)
+# Files the answers depend on. The strategy cost cache is left out, the daemon writes it itself.
+SOURCE_PATTERNS = ["lib/**/*.py", "data/*.h5", "data/*.npz", "data/answer-cube/index.json"]
+# Seconds between checks of the idle timeout
+POLL_INTERVAL = 1.0
+
+
+class _ThreadOutput(object):
+    def __init__(self, stream) -> None:
+        """Stands in for sys.stdout or sys.stderr and writes to the buffer of the current thread, if it has one
+
+        Attributes:
+            self._stream: the stream written to by threads without a buffer
+            self._local: thread local storage of the buffers
+
+        """
+        self._stream = stream
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def capture(self):
+        """Captures everything the current thread writes in the block into the yielded io.StringIO"""
+        self._local.buffer = io.StringIO()
+        try:
+            yield self._local.buffer
+        finally:
+            self._local.buffer = None
+
+    def __getattr__(self, name):
+        return getattr(getattr(self._local, "buffer", None) or self._stream, name)
+
+
+_STDOUT = _ThreadOutput(sys.stdout)
+_STDERR = _ThreadOutput(sys.stderr)
+
+
+def run_command(command: str, args: dict) -> dict:
+    """Runs a crone command and captures its output.
+
+    The output is only captured while serve() has the thread aware streams installed.
+
+    Args:
+        command: name of the crone command, e.g. "enhance"
+        args: arguments of the command as parsed by docopt
+
+    Returns:
+        Dictionary with the captured "stdout" and "stderr" and the exit "status".
+    """
+    status = 0
+    with _STDOUT.capture() as stdout, _STDERR.capture() as stderr:
+        try:
+            imported = importlib.import_module(".".join(["lib", command, command + "_parser"]))
+            imported.main(**args)
+        except SystemExit as exit_:
+            # Mirror the way the interpreter turns SystemExit into an exit status
+            if exit_.code is None:
+                status = 0
+            elif isinstance(exit_.code, int):
+                status = exit_.code
+            else:
+                print(exit_.code, file=sys.stderr)
+                status = 1
+        except Exception:
+            traceback.print_exc()
+            status = 1
+    return {"stdout": stdout.getvalue(), "stderr": stderr.getvalue(), "status": status}
+
+
+def sources_fingerprint() -> list:
+    """Returns the paths, modification times and sizes of the files the answers depend on"""
+    fingerprint = []
+    for _pattern in SOURCE_PATTERNS:
+        for _path in sorted(PACKAGE_ROOT.glob(_pattern)):
+            info = _path.stat()
+            fingerprint.append((str(_path), info.st_mtime_ns, info.st_size))
+    return fingerprint
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        if not peer_trusted(self.connection):
+            return
+        # Only reading the request is time limited, commands may take a while
+        self.connection.settimeout(REQUEST_TIMEOUT)
+        try:
+            line = self.rfile.readline()
+        except socket.timeout:
+            return
+        self.connection.settimeout(None)
+        if not line:
+            return
+
+        if sources_fingerprint() != self.server.fingerprint:
+            self.server.stale = True
+            response = {"restart": True}
+        else:
+            with self.server.request_started():
+                request = json.loads(line.decode("utf-8"))
+                response = run_command(request["command"], request["args"])
+        self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+
+
+class _DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        """Unix socket server answering every request in a new thread
+
+        Attributes:
+            self.fingerprint: sources_fingerprint() at the start of the daemon
+            self.stale: True once the sources changed and the daemon has to exit
+            self.last_active: time.monotonic() of the end of the last request
+            self._running: number of requests being run
+            self._lock: lock of self._running and self.last_active
+
+        """
+        super(_DaemonServer, self).__init__(*args, **kwargs)
+        self.fingerprint = sources_fingerprint()
+        self.stale = False
+        self.last_active = time.monotonic()
+        self._running = 0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def request_started(self):
+        """Counts the block as a running request, the daemon is not idle while it runs"""
+        with self._lock:
+            self._running += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running -= 1
+                self.last_active = time.monotonic()
+
+    def idle_for(self) -> float:
+        """Returns the number of seconds since the last request ended, 0 while one is running"""
+        with self._lock:
+            return 0.0 if self._running else time.monotonic() - self.last_active
+
+
+def serve(path: str, timeout: float) -> None:
+    """Serves requests on 'path' until no request arrives for 'timeout' seconds or the sources change.
+
+    Only one daemon per socket path is allowed. If another daemon holds the
+    lock next to the socket, this function returns immediately.
+    """
+    # O_NOFOLLOW: the lock is never a symlink planted to truncate another file
+    lock_descriptor = os.open(path + ".lock", os.O_WRONLY | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0), 0o600)
+    with os.fdopen(lock_descriptor, "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return
+
+        # The lock is ours, so any existing socket file is left over by a dead daemon
+        if os.path.exists(path):
+            os.unlink(path)
+
+        # Build the engine up front so the first forwarded request is already fast
+        importlib.import_module("lib.enhance.enhance")
+        importlib.import_module("lib.stats.metrics").SERVING = True
+        sys.stdout, sys.stderr = _STDOUT, _STDERR
+
+        with _DaemonServer(path, _RequestHandler) as server:
+            server.timeout = POLL_INTERVAL
+            try:
+                while not server.stale and server.idle_for() < timeout:
+                    server.handle_request()
+            finally:
+                os.unlink(path)
+
+
+if __name__ == "__main__":
+    if socket_path() is not None:
+        serve(socket_path(), idle_timeout())
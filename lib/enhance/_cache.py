@@ -0,0 +1,109 @@
+"""Arrays calculated once and kept on disk until their inputs change.
+
+Every cached array is saved in a .npz archive together with the fingerprint of
+everything it was calculated from: prices, a digest of the source tables and
+the version of the code. An archive with another fingerprint is stale and is
+calculated and written again on the next read.
+
+Writers hold an exclusive lock on "<archive>.lock", so parallel crone processes
+finding a stale archive calculate it once: the others wait for the lock and read
+the fresh archive. Archives are replaced atomically, readers never see a half
+written one. Locking needs fcntl, without it (e.g. on Windows) processes may
+calculate the same array at once, which is only wasted work. If the archive
+cannot be written at all (e.g. read-only data directory), the array is calculated
+in every process.
+
+"""
+import contextlib
+import hashlib
+import json
+import os
+import pathlib
+
+import numpy as np
+
+import lib.stats.metrics
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def array_digest(array) -> str:
+    """Returns a digest of the contents of 'array', to be used in fingerprints"""
+    array = np.ascontiguousarray(array)
+    digest = hashlib.sha256(str((array.dtype.str, array.shape)).encode("utf-8"))
+    digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def fingerprint(inputs : dict) -> str:
+    """Returns the fingerprint of the dictionary 'inputs' of JSON serializable values"""
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def cached_array(path, fingerprint : str, calculate) -> np.ndarray:
+    """Returns the array saved in 'path', calculating and saving it with 'calculate' if it is stale.
+
+    Args:
+        path: path of the .npz archive
+        fingerprint: fingerprint of the inputs of the array, see fingerprint()
+        calculate: function without arguments returning the array
+
+    Returns:
+        np.ndarray
+    """
+    path = pathlib.Path(path)
+    array = _read(path, fingerprint)
+    if array is not None:
+        lib.stats.metrics.CACHE_REQUESTS.increment("disk_arrays", "hit")
+        return array
+    lib.stats.metrics.CACHE_REQUESTS.increment("disk_arrays", "miss")
+    try:
+        with _locked(path):
+            # Another process might have written the array while this one was waiting for the lock
+            array = _read(path, fingerprint)
+            if array is None:
+                array = calculate()
+                _write(path, fingerprint, array)
+    except OSError:
+        if array is None:
+            array = calculate()
+    return array
+
+
+def _read(path : pathlib.Path, fingerprint : str) -> np.ndarray:
+    """Returns the array saved in 'path', None if there is none or it is stale"""
+    try:
+        with np.load(path) as archive:
+            if str(archive["fingerprint"]) != fingerprint:
+                return None
+            return archive["array"]
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _write(path : pathlib.Path, fingerprint : str, array : np.ndarray) -> None:
+    temporary_path = path.with_name("{}.{}.tmp".format(path.name, os.getpid()))
+    try:
+        with open(temporary_path, "wb") as archive_file:
+            np.savez(archive_file, fingerprint=np.array(fingerprint), array=array)
+        os.replace(temporary_path, path)
+    finally:
+        if temporary_path.exists():
+            temporary_path.unlink()
+
+
+@contextlib.contextmanager
+def _locked(path : pathlib.Path):
+    """Holds an exclusive lock shared by all processes writing 'path'"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(path.name + ".lock"), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,107 @@
+"""Kernel simulating enhancement attempts click by click.
+
+If numba is installed, the per-click loop is compiled to machine code and
+releases the GIL, so several threads can run simulations at the same time.
+Without numba the same simulation runs as vectorized NumPy operations over
+all simulated enhancements.
+
+Both implementations return the number of clicks needed by every simulated
+enhancement and a control variate: the number of clicks needed if the
+enhancement chance stayed at the starting failstack (see
+lib/utils/calculate-expected-clicks.py).
+
+"""
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def _simulate_clicks_loop(probabilities, row, column, failstack_increase, size, seed, clicks, control):
+    np.random.seed(seed)
+    last_row = probabilities.shape[0] - 1
+    starting_chance = probabilities[row, column]
+    for _sample in range(size):
+        simulation_row = row
+        sample_clicks = 0
+        sample_control = 0
+        while True:
+            random_number = np.random.random()
+            sample_clicks += 1
+            if sample_control == 0 and random_number <= starting_chance:
+                sample_control = sample_clicks
+            if random_number <= probabilities[simulation_row, column]:
+                break
+            simulation_row = min(simulation_row + failstack_increase, last_row)
+        if sample_control == 0 and starting_chance > 0:
+            sample_control = sample_clicks + np.random.geometric(starting_chance)
+        clicks[_sample] = sample_clicks
+        control[_sample] = sample_control
+
+
+if numba is not None:
+    _compiled_loop = numba.njit(nogil=True, cache=True)(_simulate_clicks_loop)
+else:
+    _compiled_loop = None
+
+
+def is_compiled() -> bool:
+    """Returns True if simulations run in the compiled kernel."""
+    return _compiled_loop is not None
+
+
+def simulate_clicks(probabilities : np.ndarray, row : int, column : int, failstack_increase : int, size : int,
+                    rng : np.random.Generator) -> tuple:
+    """Simulates 'size' enhancements of 'column' starting at failstack 'row'.
+
+    Args:
+        probabilities: contiguous np.ndarray of shape (failstacks, levels) with enhancement chances
+        row: starting failstack
+        column: enhancement level (column of 'probabilities')
+        failstack_increase: number of failstacks gained after each failure
+        size: number of enhancements to simulate
+        rng: source of random numbers. The compiled kernel draws a seed from it.
+
+    Returns:
+        Tuple
+        [0]: np.ndarray with number of clicks needed by each enhancement
+        [1]: np.ndarray with number of clicks needed by each control enhancement
+    """
+    if _compiled_loop is not None:
+        clicks = np.empty(size)
+        control = np.empty(size)
+        _compiled_loop(probabilities, row, column, failstack_increase, size,
+                       rng.integers(np.iinfo(np.int32).max), clicks, control)
+        return clicks, control
+    return _simulate_clicks_numpy(probabilities[:, column], row, failstack_increase, size, rng)
+
+
+def _simulate_clicks_numpy(chances : np.ndarray, row : int, failstack_increase : int, size : int,
+                           rng : np.random.Generator) -> tuple:
+    """Simulates all enhancements at once, one click of every unfinished enhancement per iteration."""
+    starting_chance = chances[row]
+    rows = np.full(size, row)
+    clicks = np.zeros(size)
+    control = np.zeros(size)
+    control_done = np.zeros(size, dtype=bool)
+
+    active = np.arange(size)
+    while active.shape[0] > 0:
+        random_numbers = rng.random(active.shape[0])
+        clicks[active] += 1
+
+        control_success = ~control_done[active] & (random_numbers <= starting_chance)
+        control[active[control_success]] = clicks[active[control_success]]
+        control_done[active[control_success]] = True
+
+        success = random_numbers <= chances[rows[active]]
+        rows[active] = np.minimum(rows[active] + failstack_increase, chances.shape[0] - 1)
+        active = active[~success]
+
+    # Control enhancements still going on after the real ones finished continue on fresh random numbers
+    pending = ~control_done
+    if starting_chance > 0:
+        control[pending] = clicks[pending] + rng.geometric(starting_chance, np.count_nonzero(pending))
+    return clicks, control
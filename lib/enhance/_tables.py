@@ -0,0 +1,144 @@
+"""Reading the enhancement and mean clicks tables with NumPy only.
+
+The tables are built by the tools in lib/utils as HDF5 files with pandas and
+PyTables. export_tables() saves every table of such a file next to it as a
+.npz archive, which is what the engine reads, so pandas is not needed to
+calculate. Without the .npz archive the HDF5 file is read with pandas.
+
+In the archive each table is stored as its index ("<key>/__index__"), the
+labels of its columns ("<key>/__columns__") and one array per column
+("<key>/<label>"). Column labels made of digits (enhancement levels +1 - +15)
+are turned back into ints, like in the original tables. Tables ingested from
+the spreadsheets (see lib.enhance.ingest) also carry a JSON dictionary of
+metadata ("<key>/__metadata__"), e.g. the source file and its digest.
+
+"""
+import hashlib
+import json
+import pathlib
+
+import numpy as np
+
+import lib.stats.metrics
+
+_TABLES = {}
+
+
+class Table(object):
+    def __init__(self, index : np.ndarray, columns : dict, metadata : dict = None) -> None:
+        """Columns of a table kept as np.ndarrays
+
+        Attributes:
+            self.index: np.ndarray with the labels of the rows (failstack numbers)
+            self._columns: dictionary of np.ndarrays keyed by the column labels, in the order of the table
+            self.metadata: dictionary describing where the table comes from, empty if unknown
+
+        """
+        self.index = index
+        self._columns = columns
+        self.metadata = metadata if metadata is not None else {}
+
+    @property
+    def columns(self) -> list:
+        return list(self._columns)
+
+    def __getitem__(self, label) -> np.ndarray:
+        return self._columns[label]
+
+    def __contains__(self, label) -> bool:
+        return label in self._columns
+
+    def stack(self, labels : list) -> np.ndarray:
+        """Returns np.ndarray of shape (len(labels), rows) with the 'labels' columns as floats"""
+        return np.array([self._columns[_label] for _label in labels], dtype=float)
+
+
+def npz_path(hdf_path) -> pathlib.Path:
+    """Returns the path of the .npz archive exported from 'hdf_path'"""
+    return pathlib.Path(hdf_path).with_suffix(".npz")
+
+
+def tables_digest(hdf_path) -> str:
+    """Returns a digest of the tables file 'hdf_path' as the engine reads it, from the .npz archive if there is one"""
+    path = npz_path(hdf_path) if npz_path(hdf_path).exists() else pathlib.Path(hdf_path)
+    with open(path, "rb") as tables_file:
+        return hashlib.sha256(tables_file.read()).hexdigest()
+
+
+def has_table(hdf_path, key : str) -> bool:
+    """Returns True if the tables file 'hdf_path' contains the 'key' table"""
+    if npz_path(hdf_path).exists():
+        with np.load(npz_path(hdf_path)) as archive:
+            return key + "/__columns__" in archive.files
+
+    import pandas as pd
+    with pd.HDFStore(hdf_path, "r") as hdf:
+        return "/" + key in hdf.keys()
+
+
+def read_table(hdf_path, key : str) -> Table:
+    """Returns the 'key' table of the tables file 'hdf_path', read once per process
+
+    Raises:
+        KeyError: when there is no such table
+    """
+    cache_key = (str(hdf_path), key)
+    if cache_key not in _TABLES:
+        lib.stats.metrics.CACHE_REQUESTS.increment("tables", "miss")
+        with lib.stats.metrics.TABLE_LOAD_SECONDS.time(pathlib.Path(hdf_path).stem):
+            if npz_path(hdf_path).exists():
+                _TABLES[cache_key] = _read_npz_table(npz_path(hdf_path), key)
+            else:
+                _TABLES[cache_key] = _read_hdf_table(hdf_path, key)
+    else:
+        lib.stats.metrics.CACHE_REQUESTS.increment("tables", "hit")
+    return _TABLES[cache_key]
+
+
+def _read_npz_table(path : pathlib.Path, key : str) -> Table:
+    with np.load(path) as archive:
+        if key + "/__columns__" not in archive.files:
+            raise KeyError("No table named {} in {}".format(key, path))
+        labels = [int(_label) if _label.isdigit() else str(_label) for _label in archive[key + "/__columns__"]]
+        columns = {_label : archive["{}/{}".format(key, _label)] for _label in labels}
+        metadata = None
+        if key + "/__metadata__" in archive.files:
+            metadata = json.loads(str(archive[key + "/__metadata__"]))
+        return Table(archive[key + "/__index__"], columns, metadata)
+
+
+def _read_hdf_table(hdf_path, key : str) -> Table:
+    try:
+        import pandas as pd
+    except ImportError:
+        raise ImportError("Reading {} needs pandas and PyTables. Export the tables with "
+                          "lib/utils/export-tables.py to calculate without them.".format(hdf_path))
+    table = pd.read_hdf(hdf_path, key)
+    return Table(table.index.to_numpy(), {_label : table[_label].to_numpy() for _label in table.columns})
+
+
+def export_tables(hdf_path) -> None:
+    """Saves all tables of the HDF5 file 'hdf_path' in a .npz archive next to it"""
+    import pandas as pd
+
+    with pd.HDFStore(hdf_path, "r") as hdf:
+        keys = [_key.lstrip("/") for _key in hdf.keys()]
+    save_tables(hdf_path, {_key : _read_hdf_table(hdf_path, _key) for _key in keys})
+
+
+def save_tables(hdf_path, tables : dict) -> None:
+    """Saves the dictionary of Tables 'tables' as the .npz archive of the tables file 'hdf_path'
+
+    The archive is replaced as a whole, tables which are not in 'tables' are dropped.
+    """
+    arrays = {}
+    for _key, _table in tables.items():
+        arrays[_key + "/__index__"] = _table.index
+        arrays[_key + "/__columns__"] = np.array([str(_label) for _label in _table.columns])
+        for _label in _table.columns:
+            arrays["{}/{}".format(_key, _label)] = _table[_label]
+        if _table.metadata:
+            arrays[_key + "/__metadata__"] = np.array(json.dumps(_table.metadata, sort_keys=True))
+    np.savez_compressed(npz_path(hdf_path), **arrays)
+    for _cache_key in [_cache_key for _cache_key in _TABLES if _cache_key[0] == str(hdf_path)]:
+        del _TABLES[_cache_key]
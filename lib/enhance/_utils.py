@@ -57,5 +57,20 @@ CONCENT_WEAPON_PRICE = 2e6
 BLACK_GEM_PRICE = 1.4e6
 CONCENT_BLACK_GEM_PRICE = 1.4e7
 MEMORY_FRAGMENT_PRICE = 1.3e6
+ARTISAN_MEMORY_PRICE = 4.5e6
 
-REBLATH_FAILSTACK_COSTS_TABLE_KEY = "reblathfscosts"
+# Directory with the failstack costs of the strategies, cached by lib.enhance._cache
+STRATEGY_COSTS_PATH = pathlib.Path(pathlib.Path(__file__).parent.parent.parent, "data", "strategy-costs")
+
+# Number of failstacks gained after a failed attempt at enhancing weapons and armor
+# to the given level. Any other attempt (including all accessories) gains one failstack.
+GEAR_FAILSTACK_INCREASE = {
+    "PRI" : 2,
+    "DUO" : 3,
+    "TRI" : 4,
+    "TET" : 5,
+    "PEN" : 6,
+}
+
+# Key suffix of the tables with standard errors of the simulated mean clicks
+STANDARD_ERROR_TABLE_SUFFIX = "-se"
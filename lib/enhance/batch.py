@@ -0,0 +1,227 @@
+"""Pricing many enhancement scenarios at once.
+
+Many gear types share an enhancement table and its mean clicks table (white,
+blue and yellow weapons and life tools, for example) and differ only in the
+cost of repairs. BatchPlanner groups scenarios by the enhancer and the table
+they use and runs the cost cascade once per group, vectorized over all
+scenarios of the group. The price-independent parts of the cascade are
+calculated once per table (see ItemEnhancer._cascade_terms()), the repair
+and base cost terms are broadcast over the scenarios.
+
+Usage::
+    planner = BatchPlanner(strategy="reblath")
+    results = planner.enhance_cost([("white-weapon", "PRI", 1e5), ("blue-weapon", "PRI", 2e7)])
+
+"""
+import numpy as np
+
+import lib.enhance.enhance
+import lib.enhance.repair
+from lib.enhance._utils import GEAR_TYPE
+from lib.enhance._utils import ENHANCEMENT_LEVEL
+from lib.enhance._utils import MEMORY_FRAGMENT_PRICE
+
+
+class BatchPlanner(object):
+    def __init__(self, strategy : str) -> None:
+        """Prices scenarios in batches using the failstacking 'strategy'
+
+        Attributes:
+            self._strategy: name of the failstacking strategy
+            self._enhancers: instances of ItemEnhancer child classes keyed by the class
+            self._priceable: results of self.can_price() keyed by (gear type, goal level)
+
+        """
+        self._strategy = strategy
+        self._enhancers = {}
+        self._priceable = {}
+
+    def can_price(self, gear_type : str, goal_level : str) -> bool:
+        """Returns True if the engine can price enhancing 'gear_type' to 'goal_level'"""
+        key = (gear_type, goal_level)
+        if key not in self._priceable:
+            self._priceable[key] = self._can_price(gear_type, goal_level)
+        return self._priceable[key]
+
+    def _can_price(self, gear_type : str, goal_level : str) -> bool:
+        enhancer_class = lib.enhance.enhance.ENHANCERS.get(GEAR_TYPE.get(gear_type))
+        if enhancer_class is None or goal_level not in ENHANCEMENT_LEVEL:
+            return False
+        if (issubclass(enhancer_class, lib.enhance.enhance.GearEnhancer)
+                and gear_type not in enhancer_class._MEMORY_DURABILITY_MULTIPLIER):
+            return False
+        enhancer = self._enhancer(enhancer_class)
+        return ENHANCEMENT_LEVEL[goal_level] in enhancer._table_levels(GEAR_TYPE[gear_type])
+
+    def enhance_cost(self, scenarios : list, fragment_price=MEMORY_FRAGMENT_PRICE, artisan_memory=False,
+                     fragment_share=None) -> list:
+        """Returns costs of self-enhancing gear for every scenario.
+
+        With the default repair arguments equivalent to calling Enhancer.enhance_cost() for
+        each scenario separately. Repair arguments are either scalars or sequences with one
+        value per scenario, see lib.enhance.repair.one_durability_cost().
+
+        Args:
+            scenarios: list of (gear type, goal enhancement level, base cost) tuples
+            fragment_price: price of a memory fragment
+            artisan_memory: whether memory fragments are used with an Artisan's Memory
+            fragment_share: share of the durability restored with memory fragments,
+                None to use whichever of memory fragments and item copies is cheaper
+
+        Returns:
+            List of tuples, one for each scenario, in the order of 'scenarios'
+            [0]: number of failstacks at which enhancement is least expensive
+            [1]: number of silvers needed to enhance
+
+        """
+        results = [None] * len(scenarios)
+        for _group, _enhancer, _costs, _min_indices, _goal_indices in self._cascades(scenarios, fragment_price, artisan_memory,
+                                                                                       fragment_share):
+            rows = np.arange(len(_group))
+            for _index, _min_index, _cost in zip(_group, _min_indices[rows, _goal_indices], _costs[rows, _goal_indices]):
+                results[_index] = (_min_index, _cost)
+        return results
+
+    def enhance_cost_arrays(self, scenarios : list, fragment_price=MEMORY_FRAGMENT_PRICE, artisan_memory=False,
+                            fragment_share=None) -> tuple:
+        """Returns the same as enhance_cost() as np.ndarrays instead of a list of tuples.
+
+        Takes the same arguments as enhance_cost().
+
+        Returns:
+            Tuple of np.ndarrays with one element for each scenario, in the order of 'scenarios'
+            [0]: number of failstacks at which enhancement is least expensive
+            [1]: number of silvers needed to enhance
+        """
+        failstacks = np.zeros(len(scenarios), dtype=int)
+        results = np.zeros(len(scenarios))
+        for _group, _enhancer, _costs, _min_indices, _goal_indices in self._cascades(scenarios, fragment_price, artisan_memory,
+                                                                                       fragment_share):
+            rows = np.arange(len(_group))
+            failstacks[_group] = _min_indices[rows, _goal_indices]
+            results[_group] = _costs[rows, _goal_indices]
+        return failstacks, results
+
+    def accessory_cost(self, scenarios : list, sacrifice_cost=None, purchase_cost=None) -> tuple:
+        """Returns costs of getting accessories, sourcing every level the cheapest way.
+
+        Runs AccEnhancer.enhance_cost_sourced() once for each group of scenarios, see it for
+        the meaning of the arguments and of the results.
+
+        Args:
+            scenarios: list of (accessory type, goal enhancement level, base cost) tuples
+            sacrifice_cost: np.ndarray of shape (len(scenarios), 5) with the price of the accessory
+                sacrificed at each level, or a single row for all scenarios [default: base costs]
+            purchase_cost: np.ndarray of shape (len(scenarios), 5) with the price of buying each
+                level, or a single row for all scenarios [default: never bought]
+
+        Returns:
+            Tuple of np.ndarrays in the order of 'scenarios'
+            [0]: failstack to enhance to the goal level on, -1 where buying it is cheaper
+            [1]: cost of the goal level
+            [2]: array of shape (len(scenarios), 5) with True for levels which are bought
+
+        Raises:
+            ValueError: when some scenario is not an accessory
+        """
+        levels = 5
+        if sacrifice_cost is not None:
+            sacrifice_cost = np.broadcast_to(np.asarray(sacrifice_cost, dtype=float), (len(scenarios), levels))
+        if purchase_cost is not None:
+            purchase_cost = np.broadcast_to(np.asarray(purchase_cost, dtype=float), (len(scenarios), levels))
+
+        failstacks = np.zeros(len(scenarios), dtype=int)
+        results = np.zeros(len(scenarios))
+        bought = np.zeros((len(scenarios), levels), dtype=bool)
+        for (_enhancer_class, _table), _group in self._group(scenarios).items():
+            if not issubclass(_enhancer_class, lib.enhance.enhance.AccEnhancer):
+                raise ValueError("{} is not an accessory.".format(scenarios[_group[0]][0]))
+            enhancer = self._enhancer(_enhancer_class)
+            # Scenarios of one call share the goal level
+            by_goal = {}
+            for _index in _group:
+                by_goal.setdefault(scenarios[_index][1], []).append(_index)
+            for _goal_level, _indices in by_goal.items():
+                group_failstacks, group_costs, group_bought = enhancer.enhance_cost_sourced(
+                    gear_type=_table, gear_goal_level=_goal_level,
+                    base_cost=[scenarios[_index][2] for _index in _indices],
+                    sacrifice_cost=None if sacrifice_cost is None else sacrifice_cost[_indices],
+                    purchase_cost=None if purchase_cost is None else purchase_cost[_indices])
+                failstacks[_indices] = group_failstacks
+                results[_indices] = group_costs
+                bought[_indices, :group_bought.shape[1]] = group_bought
+        return failstacks, results, bought
+
+    def total_cost(self, scenarios : list, fragment_price=MEMORY_FRAGMENT_PRICE, artisan_memory=False,
+                   fragment_share=None) -> np.ndarray:
+        """Returns expected costs of getting items of the goal level by self-enhancing +0 items.
+
+        Includes the +0 item. For accessories this is what enhance_cost() returns, for weapons
+        and armor it is the base cost plus the costs of all levels up to the goal one.
+        Takes the same arguments as enhance_cost().
+
+        Returns:
+            np.ndarray with one cost for each scenario, in the order of 'scenarios'
+        """
+        results = np.zeros(len(scenarios))
+        for _group, _enhancer, _costs, _min_indices, _goal_indices in self._cascades(scenarios, fragment_price, artisan_memory,
+                                                                                       fragment_share):
+            rows = np.arange(len(_group))
+            if isinstance(_enhancer, lib.enhance.enhance.GearEnhancer):
+                # Each level of gear costs only the enhancement from the previous level
+                cumulative_costs = np.cumsum(_costs, axis=1)
+                results[_group] = cumulative_costs[rows, _goal_indices]
+            else:
+                results[_group] = _costs[rows, _goal_indices]
+        return results
+
+    def _cascades(self, scenarios : list, fragment_price, artisan_memory, fragment_share):
+        """Runs one cost cascade for each group of scenarios sharing an enhancer and a table.
+
+        Yields:
+            Tuple for each group
+            [0]: list of indices of the scenarios in the group
+            [1]: the enhancer of the group
+            [2]: np.ndarray of shape (scenarios in the group, levels) with minimal cost of each level
+            [3]: np.ndarray of the same shape with failstack numbers of the minimal costs
+            [4]: np.ndarray with the index of the goal level of each scenario
+        """
+        fragment_price = np.broadcast_to(np.asarray(fragment_price, dtype=float), (len(scenarios),))
+        artisan_memory = np.broadcast_to(np.asarray(artisan_memory, dtype=bool), (len(scenarios),))
+        if fragment_share is not None:
+            fragment_share = np.broadcast_to(np.asarray(fragment_share, dtype=float), (len(scenarios),))
+
+        for (_enhancer_class, _table), _group in self._group(scenarios).items():
+            enhancer = self._enhancer(_enhancer_class)
+            goal_indices = np.array([enhancer._enhancement_levels.index(ENHANCEMENT_LEVEL[scenarios[_index][1]])
+                                     for _index in _group])
+            base_cost = np.array([scenarios[_index][2] for _index in _group], dtype=float)
+
+            if isinstance(enhancer, lib.enhance.enhance.GearEnhancer):
+                memory_multiplier = np.array([enhancer._MEMORY_DURABILITY_MULTIPLIER[scenarios[_index][0]]
+                                              for _index in _group])
+                one_durability_cost = lib.enhance.repair.one_durability_cost(
+                    base_cost, memory_multiplier, fragment_price=fragment_price[_group],
+                    artisan_memory=artisan_memory[_group],
+                    fragment_share=None if fragment_share is None else fragment_share[_group])
+                costs, min_indices, _slices = enhancer._enhance_cost_cascade(gear_type=_table, goal_index=goal_indices.max(),
+                                                                             base_cost=base_cost,
+                                                                             one_durability_cost=one_durability_cost)
+            else:
+                costs, min_indices, _slices = enhancer._enhance_cost_cascade(gear_type=_table, goal_index=goal_indices.max(),
+                                                                             base_cost=base_cost)
+            yield _group, enhancer, costs, min_indices, goal_indices
+
+    def _group(self, scenarios : list) -> dict:
+        """Groups indices of scenarios by the enhancer class and enhancement table they use"""
+        groups = {}
+        for _index, (_gear_type, _goal_level, _base_cost) in enumerate(scenarios):
+            table = GEAR_TYPE[_gear_type]
+            key = (lib.enhance.enhance.ENHANCERS[table], table)
+            groups.setdefault(key, []).append(_index)
+        return groups
+
+    def _enhancer(self, enhancer_class : type) -> lib.enhance.enhance.ItemEnhancer:
+        if enhancer_class not in self._enhancers:
+            self._enhancers[enhancer_class] = enhancer_class(self._strategy)
+        return self._enhancers[enhancer_class]
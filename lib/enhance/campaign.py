@@ -0,0 +1,263 @@
+"""Planning the enhancement of a whole set of gear at once.
+
+Enhancer prices every item as if its failstacks were built from scratch for
+each enhancement level and lost after the level is reached. When a set of gear
+is enhanced together, a stack grown by a failed attempt on one item can be used
+for an attempt on another item instead. CampaignPlanner finds the order of the
+enhancement attempts and the failstacks to click at which minimise the expected
+cost of the whole set.
+
+Usage::
+    planner = CampaignPlanner(strategy="reblath")
+    total, standalone, schedule = planner.plan([("gold-acc", "TRI", 1e7), ("green-armor", "PRI", 5e5)])
+
+"""
+import numpy as np
+
+import lib.enhance.enhance
+from lib.enhance import _tables
+from lib.enhance._utils import ENHANCE_TABLES_PATH
+from lib.enhance._utils import GEAR_TYPE
+from lib.enhance._utils import ENHANCEMENT_LEVEL
+
+
+class _Task(object):
+    """A single enhancement level of a single item.
+
+    Attributes:
+        item: index of the item in the list passed to CampaignPlanner.plan()
+        gear_type: type of the gear
+        level: enhancement level the task enhances the item to
+        chances: np.ndarray with the enhancement chance at each failstack
+        failstack_increase: number of failstacks gained after a failed attempt
+        click_cost: cost paid on every attempt (materials)
+        fail_cost: additional cost paid after a failed attempt (repairs, downgrades, lost items)
+        last: True if this is the last level of the item
+    """
+    def __init__(self, item, gear_type, level, chances, failstack_increase, click_cost, fail_cost, last):
+        self.item = item
+        self.gear_type = gear_type
+        self.level = level
+        self.chances = chances
+        self.failstack_increase = failstack_increase
+        self.click_cost = click_cost
+        self.fail_cost = fail_cost
+        self.last = last
+
+
+class CampaignPlanner(object):
+    def __init__(self, strategy : str) -> None:
+        """Plans enhancing a set of items sharing failstacks built with 'strategy'
+
+        Attributes:
+            self._strategy: name of the failstacking strategy
+            self._failstack_cost: np.ndarray with the cost of building each failstack
+
+        """
+        self._strategy = strategy
+        self._failstack_cost = lib.enhance.enhance.STRATEGIES[strategy].failstack_costs()
+
+    def plan(self, items : list) -> tuple:
+        """Returns the cheapest way of enhancing all 'items' with shared failstacks.
+
+        Every level of every item is a task. Tasks of one item are done in the order
+        of enhancement levels and tasks of different items are interleaved so that the
+        ones preferring lower failstacks go first. A successful attempt uses up the
+        failstack. A failed attempt grows it and the grown stack can either be used to
+        retry the same task or, if the task is the last level of its item, be handed
+        over to the next task. In the latter case the item is finished at the end of the
+        campaign at its standalone cost.
+
+        The expected cost is found by dynamic programming over the tasks (last to first)
+        and the shared failstack (highest to lowest). For every failstack the cheaper of
+        clicking right away and building one more stack is taken. Each failstack needs the
+        value of the ones above it, so the failstacks are solved one by one, but the tasks
+        solved on their own (for the order of tasks and the deferred costs) are solved
+        all at once, see self._solve_standalone().
+
+        Costs cover every level from +0 to the goal level. For accessories this is what
+        Enhancer.enhance_cost() returns, for weapons and armor it is the sum of the costs
+        Enhancer.enhance_cost() returns for each level.
+
+        Args:
+            items: list of (gear type, goal enhancement level, base cost) tuples
+
+        Returns:
+            Tuple
+            [0]: expected cost of enhancing all items with shared failstacks
+            [1]: expected cost of enhancing all items one by one, without sharing failstacks
+            [2]: list of (item index, gear type, enhancement level, failstack) tuples with
+                the order of tasks and the failstack to build up to if the task starts
+                without any failstack
+
+        """
+        if len(items) == 0:
+            raise ValueError("At least one item is needed to plan a campaign.")
+
+        tasks_by_item = []
+        purchase_cost = 0
+        for _index, _item in enumerate(items):
+            tasks, item_purchase_cost = self._item_tasks(_index, *_item)
+            tasks_by_item.append(tasks)
+            purchase_cost += item_purchase_cost
+
+        all_tasks = [_task for _tasks in tasks_by_item for _task in _tasks]
+        values, targets = self._solve_standalone(all_tasks)
+        standalone_values = dict(zip(map(id, all_tasks), values[:, 0].tolist()))
+        standalone_targets = dict(zip(map(id, all_tasks), targets[:, 0].tolist()))
+
+        schedule = self._merge(tasks_by_item, standalone_targets)
+
+        # Backward induction over tasks, next_values[s] is the expected cost of the
+        # remaining tasks when they are started holding s failstacks
+        next_values = None
+        for _task in reversed(schedule):
+            defer_cost = standalone_values[id(_task)] if _task.last else None
+            next_values, _targets = self._solve_task(_task, next_values=next_values, defer_cost=defer_cost)
+
+        standalone_cost = sum(standalone_values.values()) + purchase_cost
+        return next_values[0] + purchase_cost, standalone_cost, [(_task.item, _task.gear_type, _task.level, standalone_targets[id(_task)])
+                                                 for _task in schedule]
+
+    def _solve_task(self, task : _Task, next_values : list, defer_cost : float) -> tuple:
+        """Solves the dynamic programming step of a single task.
+
+        Args:
+            task: the task to solve
+            next_values: expected cost of the following tasks for each failstack number.
+                None if there are no following tasks.
+            defer_cost: cost of finishing the task on its own at the end of the campaign.
+                None if the task cannot be deferred.
+
+        Returns:
+            Tuple
+            [0]: list with the expected cost of this and the following tasks for each failstack
+            [1]: list with the failstack to build up to before clicking for each failstack
+        """
+        stacks = self._failstack_cost.shape[0]
+        chances = task.chances[:stacks]
+        build_cost = np.diff(self._failstack_cost).tolist()
+        next_values = np.zeros(stacks) if next_values is None else np.asarray(next_values, dtype=float)
+
+        # Everything not depending on the values of this task is calculated for all failstacks at once
+        immediate_costs = task.click_cost + chances * next_values[0] + (1 - chances) * task.fail_cost
+        failed_stacks = np.minimum(np.arange(stacks) + task.failstack_increase, stacks - 1)
+        if defer_cost is not None:
+            deferred_values = (immediate_costs + (1 - chances) * (defer_cost + next_values[failed_stacks])).tolist()
+        chances = chances.tolist()
+        immediate_costs = immediate_costs.tolist()
+        failed_stacks = failed_stacks.tolist()
+
+        values = [0.0] * stacks
+        targets = [0] * stacks
+        for _stack in range(stacks - 1, -1, -1):
+            chance = chances[_stack]
+            failed_stack = failed_stacks[_stack]
+            if failed_stack == _stack:
+                # The highest failstack does not grow any more, so retrying stays in this state
+                click_value = (immediate_costs[_stack] / chance) if chance > 0 else np.inf
+            else:
+                click_value = immediate_costs[_stack] + (1 - chance) * values[failed_stack]
+            if defer_cost is not None:
+                click_value = min(click_value, deferred_values[_stack])
+
+            values[_stack] = click_value
+            targets[_stack] = _stack
+            if _stack < stacks - 1 and build_cost[_stack] + values[_stack + 1] < click_value:
+                values[_stack] = build_cost[_stack] + values[_stack + 1]
+                targets[_stack] = targets[_stack + 1]
+        return values, targets
+
+    def _solve_standalone(self, tasks : list) -> tuple:
+        """Solves the dynamic programming step of every task on its own, without following tasks.
+
+        Equivalent to self._solve_task(_task, next_values=None, defer_cost=None) for each task,
+        with the tasks solved together, one failstack at a time.
+
+        Returns:
+            Tuple of np.ndarrays of shape (tasks, failstacks)
+            [0]: expected cost of the task for each failstack
+            [1]: failstack to build up to before clicking for each failstack
+        """
+        stacks = self._failstack_cost.shape[0]
+        top = stacks - 1
+        rows = np.arange(len(tasks))
+        chances = np.array([_task.chances[:stacks] for _task in tasks], dtype=float)
+        click_cost = np.array([_task.click_cost for _task in tasks], dtype=float)[:, np.newaxis]
+        fail_cost = np.array([_task.fail_cost for _task in tasks], dtype=float)[:, np.newaxis]
+        failstack_increase = np.array([_task.failstack_increase for _task in tasks])
+        build_cost = np.diff(self._failstack_cost)
+        immediate_costs = click_cost + (1 - chances) * fail_cost
+
+        values = np.zeros((len(tasks), stacks))
+        targets = np.zeros((len(tasks), stacks), dtype=int)
+        # The highest failstack does not grow any more, so retrying stays in this state
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values[:, top] = np.where(chances[:, top] > 0, immediate_costs[:, top] / chances[:, top], np.inf)
+        targets[:, top] = top
+        for _stack in range(top - 1, -1, -1):
+            failed_stacks = np.minimum(_stack + failstack_increase, top)
+            click_values = immediate_costs[:, _stack] + (1 - chances[:, _stack]) * values[rows, failed_stacks]
+            build_values = build_cost[_stack] + values[:, _stack + 1]
+            build = build_values < click_values
+            values[:, _stack] = np.where(build, build_values, click_values)
+            targets[:, _stack] = np.where(build, targets[:, _stack + 1], _stack)
+        return values, targets
+
+    def _item_tasks(self, item : int, gear_type : str, goal_level : str, base_cost : float) -> list:
+        """Splits enhancing a single item into tasks, one per enhancement level.
+
+        Costs of downgrades and lost items are taken from the standalone cost cascade
+        of Enhancer, so that they match the costs reported by Enhancer.enhance_cost().
+
+        Returns:
+            Tuple
+            [0]: list of tasks
+            [1]: cost of the item itself included in Enhancer.enhance_cost() (the +0
+                accessory being enhanced, nothing for weapons and armor)
+
+        """
+        enhancer = lib.enhance.enhance.Enhancer(strategy=self._strategy, gear_type=gear_type,
+                                                goal_level=goal_level, base_cost=base_cost)
+        enhancer.enhance_cost()
+        item_enhancer = enhancer._enhancer
+        table = _tables.read_table(ENHANCE_TABLES_PATH, GEAR_TYPE[gear_type])
+
+        levels = item_enhancer._enhancement_levels
+        goal_index = levels.index(ENHANCEMENT_LEVEL[goal_level])
+        is_accessory = isinstance(item_enhancer, lib.enhance.enhance.AccEnhancer)
+        if not is_accessory:
+            one_durability_cost = item_enhancer._one_durability_cost(gear_type, base_cost)
+
+        tasks = []
+        for _index in range(1, goal_index + 1):
+            _level = levels[_index]
+            previous_level_cost = item_enhancer._enhancement_cost_dict[levels[_index - 1]]
+            failstack_increase = item_enhancer._failstack_increase(_level)
+            if is_accessory:
+                # The sacrificed +0 accessory is used up each time, the enhanced one is lost on failure
+                click_cost = base_cost
+                fail_cost = previous_level_cost
+            else:
+                click_cost = (item_enhancer._BLACK_STONE_PRICE if isinstance(_level, int)
+                              else item_enhancer._CONCENT_PRICE)
+                fail_cost = (5 if isinstance(_level, int) else 10) * one_durability_cost
+                if _level in "TRI TET PEN".split():
+                    fail_cost += previous_level_cost
+            tasks.append(_Task(item, gear_type, _level, np.asarray(table[_level], dtype=float), failstack_increase,
+                               click_cost, fail_cost, _index == goal_index))
+        return tasks, (base_cost if is_accessory else 0)
+
+    @staticmethod
+    def _merge(tasks_by_item : list, targets : dict) -> list:
+        """Interleaves tasks of all items by their preferred failstack, keeping the order within items."""
+        positions = [0] * len(tasks_by_item)
+        schedule = []
+        while True:
+            candidates = [(targets[id(_tasks[positions[_item]])], _item)
+                          for _item, _tasks in enumerate(tasks_by_item) if positions[_item] < len(_tasks)]
+            if not candidates:
+                return schedule
+            _target, item = min(candidates)
+            schedule.append(tasks_by_item[item][positions[item]])
+            positions[item] += 1
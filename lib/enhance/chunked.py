@@ -0,0 +1,162 @@
+"""Pricing scenario files too large for memory, chunk by chunk.
+
+A scenario file is a text file with one "<gear-type>,<goal-level>,<base-cost>"
+line for each scenario, e.g. market history exported from a spreadsheet. An
+optional header line is skipped. ChunkedJob streams it in chunks of a fixed
+number of lines, prices every chunk with BatchPlanner.enhance_cost_arrays() and
+saves the results of each chunk in its own columnar file in the output
+directory, so the memory used does not depend on the size of the file.
+
+Output directory:
+    chunk-<n>.npz: columns of chunk n, one element for each line of the chunk
+        "failstack": number of failstacks at which enhancement is least expensive
+        "cost": number of silvers needed to enhance, see Enhancer.enhance_cost()
+        Lines the engine cannot price get failstack -1 and cost NaN. The header
+        is not a part of the results.
+    manifest.json: the job and the finished chunks, with the byte range of the
+        scenario file each of them covers
+
+The manifest is the checkpoint. It is rewritten after every chunk, so an
+interrupted job started again with the same arguments continues after the last
+finished chunk. Chunk files and the manifest are replaced atomically.
+
+Usage::
+    job = ChunkedJob("reblath", "history.csv", "history-costs")
+    job.run()
+    for _failstack, _cost in read_results("history-costs"):
+        ...
+
+"""
+import json
+import os
+import pathlib
+
+import numpy as np
+
+import lib.enhance.batch
+
+# Number of scenarios priced at once. The cost cascade needs about 1 kB per scenario.
+CHUNK_SIZE = 65536
+MANIFEST_NAME = "manifest.json"
+
+
+class ChunkedJob(object):
+    def __init__(self, strategy : str, scenarios_path, output_path, chunk_size : int = CHUNK_SIZE) -> None:
+        """Prices the scenario file 'scenarios_path' into the directory 'output_path'
+
+        Attributes:
+            self._strategy: name of the failstacking strategy
+            self._scenarios_path: pathlib.Path of the scenario file
+            self._output_path: pathlib.Path of the output directory
+            self._chunk_size: number of scenarios in a chunk
+            self._planner: BatchPlanner pricing the chunks
+
+        """
+        if chunk_size <= 0:
+            raise ValueError("Chunk size must be positive.")
+        self._strategy = strategy
+        self._scenarios_path = pathlib.Path(scenarios_path)
+        self._output_path = pathlib.Path(output_path)
+        self._chunk_size = chunk_size
+        self._planner = lib.enhance.batch.BatchPlanner(strategy)
+
+    def run(self) -> dict:
+        """Prices all chunks not finished yet.
+
+        Returns:
+            The manifest, see the module documentation
+
+        Raises:
+            ValueError: when the output directory holds a job with other arguments or another scenario file
+        """
+        self._output_path.mkdir(parents=True, exist_ok=True)
+        manifest = self._manifest()
+        with open(self._scenarios_path, "rb") as scenarios_file:
+            if manifest["chunks"]:
+                scenarios_file.seek(manifest["chunks"][-1]["end"])
+            else:
+                header = scenarios_file.readline()
+                if _parse(header) is not None:
+                    scenarios_file.seek(0)
+            while True:
+                start = scenarios_file.tell()
+                lines = [_line for _line in (scenarios_file.readline() for _index in range(self._chunk_size)) if _line]
+                if not lines:
+                    break
+                name = "chunk-{:06d}.npz".format(len(manifest["chunks"]))
+                self._write_chunk(name, *self._price(lines))
+                manifest["chunks"].append({"file" : name, "start" : start, "end" : scenarios_file.tell(),
+                                           "rows" : len(lines)})
+                self._write_manifest(manifest)
+        manifest["finished"] = True
+        self._write_manifest(manifest)
+        return manifest
+
+    def _manifest(self) -> dict:
+        """Returns the manifest of the job, the saved one if the job was started before"""
+        stat = self._scenarios_path.stat()
+        job = {
+            "strategy" : self._strategy,
+            "scenarios" : str(self._scenarios_path.resolve()),
+            "scenarios_size" : stat.st_size,
+            "scenarios_mtime_ns" : stat.st_mtime_ns,
+            "chunk_size" : self._chunk_size,
+        }
+        manifest_path = self._output_path / MANIFEST_NAME
+        if not manifest_path.exists():
+            return dict(job, chunks=[], finished=False)
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+        if any(manifest.get(_key) != _value for _key, _value in job.items()):
+            raise ValueError("{} holds results of another job. Use an empty output directory.".format(self._output_path))
+        return manifest
+
+    def _price(self, lines : list) -> tuple:
+        """Returns the failstacks and the costs of the scenarios on 'lines'"""
+        scenarios = []
+        rows = []
+        for _row, _line in enumerate(lines):
+            scenario = _parse(_line)
+            if scenario is not None and self._planner.can_price(scenario[0], scenario[1]):
+                scenarios.append(scenario)
+                rows.append(_row)
+
+        failstacks = np.full(len(lines), -1, dtype=np.int16)
+        costs = np.full(len(lines), np.nan)
+        if scenarios:
+            failstacks[rows], costs[rows] = self._planner.enhance_cost_arrays(scenarios)
+        return failstacks, costs
+
+    def _write_chunk(self, name : str, failstacks : np.ndarray, costs : np.ndarray) -> None:
+        temporary_path = self._output_path / (name + ".tmp")
+        with open(temporary_path, "wb") as chunk_file:
+            np.savez(chunk_file, failstack=failstacks, cost=costs)
+        os.replace(temporary_path, self._output_path / name)
+
+    def _write_manifest(self, manifest : dict) -> None:
+        temporary_path = self._output_path / (MANIFEST_NAME + ".tmp")
+        with open(temporary_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=4)
+        os.replace(temporary_path, self._output_path / MANIFEST_NAME)
+
+
+def _parse(line : bytes) -> tuple:
+    """Returns the (gear type, goal level, base cost) scenario on 'line', None if it is not one"""
+    fields = line.decode("utf-8").strip().split(",")
+    if len(fields) != 3:
+        return None
+    try:
+        return fields[0].strip(), fields[1].strip(), float(fields[2])
+    except ValueError:
+        # Header or a malformed line
+        return None
+
+
+def read_results(output_path):
+    """Yields (failstacks, costs) np.ndarrays of every finished chunk in 'output_path', in the order of the lines"""
+    output_path = pathlib.Path(output_path)
+    with open(output_path / MANIFEST_NAME) as manifest_file:
+        manifest = json.load(manifest_file)
+    for _chunk in manifest["chunks"]:
+        with np.load(output_path / _chunk["file"]) as chunk:
+            yield chunk["failstack"], chunk["cost"]
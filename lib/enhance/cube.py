@@ -0,0 +1,267 @@
+"""Precomputed answers to enhancement cost queries.
+
+Most queries differ only in the base cost of the item. The answer cube holds
+the result of Enhancer.enhance_cost() for every gear type and goal level on a
+geometric grid of base costs. It is built offline (lib/utils/build-answer-cube.py)
+and stored as .npy files, which are memory-mapped, so a lookup reads only the
+few grid points it needs.
+
+Costs between grid points are interpolated with a bound on the error. The cost
+of enhancing is a concave function of the base cost: every level costs the
+minimum over failstacks of sums of concave functions (costs of the previous
+levels and the cost of repairs) with positive weights. Linear interpolation
+between two grid points is therefore a lower bound on the cost, and the
+extensions of the neighbouring segments are upper bounds. A lookup returns the
+middle of the two bounds along with half of their distance.
+
+Queries the cube cannot answer within the requested error (base cost outside
+the grid, optimal failstack changing between grid points, cube built for
+other prices, strategy, tables or version of the engine) are passed on to the engine.
+
+Usage::
+    failstack, cost = lib.enhance.cube.enhance_cost("reblath", "gold-acc", "TRI", 1.5e7)
+
+"""
+import json
+import pathlib
+import warnings
+
+import numpy as np
+
+from lib.enhance import _cache
+from lib.enhance import _tables
+from lib.enhance import _utils
+
+ANSWER_CUBE_PATH = pathlib.Path(pathlib.Path(__file__).parent.parent.parent, "data", "answer-cube")
+
+MIN_BASE_COST = 1e3
+MAX_BASE_COST = 1e11
+BASE_COST_POINTS_PER_DECADE = 64
+# Default maximum relative error of answers taken from the cube, well below
+# the precision of the simulated mean clicks tables
+MAX_RELATIVE_ERROR = 1e-4
+
+GOAL_LEVELS = "1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 PRI DUO TRI TET PEN".split()
+# Prices the cube depends on, a cube built with other prices is not used
+PRICE_NAMES = ["BLACK_STONE_ARMOR_PRICE", "BLACK_STONE_WEAPON_PRICE", "CONCENT_ARMOR_PRICE",
+               "CONCENT_WEAPON_PRICE", "MEMORY_FRAGMENT_PRICE", "CLEANSING_COST"]
+
+# Version of the cost calculations, part of the fingerprint of the cube.
+# Increase it after changing how the engine calculates costs.
+CUBE_VERSION = 1
+
+_FLOAT32_ERROR = 4 * np.finfo(np.float32).eps
+_CUBES = {}
+# Fingerprints of the current inputs, calculated once per process and strategy
+_FINGERPRINTS = {}
+
+
+def _prices() -> dict:
+    import lib.enhance.strategy
+    # CLEANSING_COST belongs to the strategy module, the rest to lib.enhance._utils
+    return {_name : float(getattr(lib.enhance.strategy if _name == "CLEANSING_COST" else _utils, _name))
+            for _name in PRICE_NAMES}
+
+
+def _fingerprint(strategy : str) -> str:
+    """Returns the fingerprint of everything the cube for 'strategy' is calculated from"""
+    if strategy not in _FINGERPRINTS:
+        import lib.enhance.enhance
+        _FINGERPRINTS[strategy] = _cache.fingerprint({
+            "version" : CUBE_VERSION,
+            "strategy" : strategy,
+            "prices" : _prices(),
+            "enhance_tables" : _tables.tables_digest(_utils.ENHANCE_TABLES_PATH),
+            "mean_clicks_tables" : _tables.tables_digest(_utils.MEAN_CLICKS_TABLES_PATH),
+            "failstack_costs" : lib.enhance.enhance.STRATEGIES[strategy]._failstack_costs_fingerprint(),
+        })
+    return _FINGERPRINTS[strategy]
+
+
+def _base_cost_grid() -> np.ndarray:
+    decades = np.log10(MAX_BASE_COST) - np.log10(MIN_BASE_COST)
+    return np.logspace(np.log10(MIN_BASE_COST), np.log10(MAX_BASE_COST),
+                       int(round(decades * BASE_COST_POINTS_PER_DECADE)) + 1)
+
+
+def _cube_gear_types() -> list:
+    """Returns the gear types the engine can price"""
+    import lib.enhance.enhance
+    gear_types = []
+    for _gear_type, _table in _utils.GEAR_TYPE.items():
+        enhancer_class = lib.enhance.enhance.ENHANCERS.get(_table)
+        if enhancer_class is None:
+            continue
+        if (issubclass(enhancer_class, lib.enhance.enhance.GearEnhancer)
+                and _gear_type not in enhancer_class._MEMORY_DURABILITY_MULTIPLIER):
+            continue
+        gear_types.append(_gear_type)
+    return gear_types
+
+
+def build_cube(path=ANSWER_CUBE_PATH, strategy : str = "reblath") -> None:
+    """Evaluates the engine on the whole grid and saves the cube in the 'path' directory.
+
+    Writes three files:
+        costs.npy: float32 array of shape (gear types, goal levels, base costs), NaN where
+            the goal level does not exist for the gear type
+        failstacks.npy: int16 array of the same shape with the optimal failstacks
+        index.json: gear types, goal levels, the base cost grid, the strategy, the prices used
+            and the fingerprint of all inputs, see _fingerprint()
+    """
+    import lib.enhance.batch
+    import lib.enhance.enhance
+
+    gear_types = _cube_gear_types()
+    base_costs = _base_cost_grid()
+    costs = np.full((len(gear_types), len(GOAL_LEVELS), base_costs.shape[0]), np.nan, dtype=np.float32)
+    failstacks = np.full(costs.shape, -1, dtype=np.int16)
+
+    planner = lib.enhance.batch.BatchPlanner(strategy)
+    cells = []
+    scenarios = []
+    for _type_index, _gear_type in enumerate(gear_types):
+        for _level_index, _level in enumerate(GOAL_LEVELS):
+            if not planner.can_price(_gear_type, _level):
+                # Accessories below PRI and levels missing from the tables, left NaN
+                continue
+            cells.append((_type_index, _level_index))
+            scenarios.extend((_gear_type, _level, _base_cost) for _base_cost in base_costs)
+
+    results = planner.enhance_cost(scenarios)
+    for _cell_index, (_type_index, _level_index) in enumerate(cells):
+        cell_results = results[_cell_index * base_costs.shape[0]:(_cell_index + 1) * base_costs.shape[0]]
+        failstacks[_type_index, _level_index] = [_result[0] for _result in cell_results]
+        costs[_type_index, _level_index] = [_result[1] for _result in cell_results]
+
+    path = pathlib.Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    np.save(path / "costs.npy", costs)
+    np.save(path / "failstacks.npy", failstacks)
+    with open(path / "index.json", "w") as index_file:
+        json.dump({
+            "gear_types" : gear_types,
+            "goal_levels" : GOAL_LEVELS,
+            "min_base_cost" : MIN_BASE_COST,
+            "max_base_cost" : MAX_BASE_COST,
+            "points_per_decade" : BASE_COST_POINTS_PER_DECADE,
+            "strategy" : strategy,
+            "prices" : _prices(),
+            "fingerprint" : _fingerprint(strategy),
+        }, index_file, indent=4)
+
+
+class AnswerCube(object):
+    def __init__(self, path=ANSWER_CUBE_PATH) -> None:
+        """Answers enhancement cost queries from a cube saved by build_cube()
+
+        Attributes:
+            self._index: contents of index.json
+            self._costs: memory-mapped np.ndarray with the costs
+            self._failstacks: memory-mapped np.ndarray with the optimal failstacks
+            self._base_costs: np.ndarray with the base cost grid
+
+        """
+        path = pathlib.Path(path)
+        with open(path / "index.json") as index_file:
+            self._index = json.load(index_file)
+        self._costs = np.load(path / "costs.npy", mmap_mode="r")
+        self._failstacks = np.load(path / "failstacks.npy", mmap_mode="r")
+        self._gear_types = {_gear_type : _index for _index, _gear_type in enumerate(self._index["gear_types"])}
+        self._goal_levels = {_level : _index for _index, _level in enumerate(self._index["goal_levels"])}
+        self._log_min_base_cost = np.log10(self._index["min_base_cost"])
+        self._base_costs = np.logspace(self._log_min_base_cost, np.log10(self._index["max_base_cost"]),
+                                       self._costs.shape[2])
+
+    def is_current(self, strategy : str) -> bool:
+        """Returns True if the cube was built for 'strategy', the current prices, tables and engine"""
+        return self._index["strategy"] == strategy and self._index.get("fingerprint") == _fingerprint(strategy)
+
+    def lookup(self, gear_type : str, goal_level : str, base_cost : float) -> tuple:
+        """Returns the cost of enhancing from +0 to 'goal_level' taken from the cube.
+
+        Args:
+            gear_type: type of the gear
+            goal_level: level of enhancement desired
+            base_cost: price of the item at +0 enhancement level
+
+        Returns:
+            Tuple, or None if the cube cannot answer the query
+            [0]: number of failstacks at which enhancement is least expensive
+            [1]: number of silvers needed to enhance
+            [2]: bound on the absolute error of [1]
+        """
+        type_index = self._gear_types.get(gear_type)
+        level_index = self._goal_levels.get(goal_level)
+        if type_index is None or level_index is None:
+            return None
+        base_cost = float(base_cost)
+        if not self._base_costs[0] <= base_cost <= self._base_costs[-1]:
+            return None
+
+        points = self._base_costs.shape[0]
+        position = (np.log10(base_cost) - self._log_min_base_cost) * self._index["points_per_decade"]
+        left = min(int(position), points - 2)
+        x = self._base_costs
+        y = self._costs[type_index, level_index, max(left - 1, 0):left + 3].astype(float)
+        failstacks = self._failstacks[type_index, level_index, left:left + 2]
+        if np.isnan(y).any():
+            return None
+        # y starts at x[left - 1] when there is a point on the left
+        y_left, y_right = (y[1], y[2]) if left > 0 else (y[0], y[1])
+
+        if base_cost == x[left]:
+            return int(failstacks[0]), y_left, _FLOAT32_ERROR * abs(y_left)
+        if failstacks[0] != failstacks[1]:
+            return None
+
+        lower = y_left + (base_cost - x[left]) * (y_right - y_left) / (x[left + 1] - x[left])
+        upper = []
+        if left > 0:
+            upper.append(y_left + (base_cost - x[left]) * (y[1] - y[0]) / (x[left] - x[left - 1]))
+        if left + 2 < points:
+            upper.append(y_right - (x[left + 1] - base_cost) * (y[-1] - y[-2]) / (x[left + 2] - x[left + 1]))
+        if not upper:
+            return None
+        upper = max(min(upper), lower)
+        return int(failstacks[0]), (lower + upper) / 2, (upper - lower) / 2 + _FLOAT32_ERROR * np.abs(y).max()
+
+
+def load_cube(path=ANSWER_CUBE_PATH) -> AnswerCube:
+    """Returns the cube saved in 'path', loaded once per process. None if there is no cube."""
+    path = pathlib.Path(path)
+    if path not in _CUBES:
+        _CUBES[path] = AnswerCube(path) if (path / "index.json").exists() else None
+    return _CUBES[path]
+
+
+def enhance_cost(strategy : str, gear_type : str, goal_level : str, base_cost : float,
+                 max_relative_error : float = MAX_RELATIVE_ERROR, path=ANSWER_CUBE_PATH) -> tuple:
+    """Returns the same as Enhancer.enhance_cost(), from the cube where it is accurate enough.
+
+    Args:
+        strategy: failstacking strategy
+        gear_type: type of the gear
+        goal_level: level of enhancement desired
+        base_cost: price of the item at +0 enhancement level
+        max_relative_error: the largest error, relative to the cost, accepted from the cube
+        path: directory with the cube
+
+    Returns:
+        Tuple
+        [0]: number of failstacks at which enhancement is least expensive
+        [1]: number of silvers needed to enhance
+    """
+    cube = load_cube(path)
+    if cube is not None:
+        if cube.is_current(strategy):
+            answer = cube.lookup(gear_type, goal_level, base_cost)
+            if answer is not None and answer[2] <= max_relative_error * abs(answer[1]):
+                return answer[0], answer[1]
+        elif cube._index["strategy"] == strategy:
+            warnings.warn("The answer cube in {} is out of date, rebuild it with "
+                          "lib/utils/build-answer-cube.py.".format(path))
+
+    import lib.enhance.enhance
+    return lib.enhance.enhance.Enhancer(strategy=strategy, gear_type=gear_type, goal_level=goal_level,
+                                        base_cost=base_cost).enhance_cost()
@@ -1,7 +1,10 @@
-import pandas as pd
 import numpy as np
 
+import lib.enhance.markov
+import lib.enhance.repair
 import lib.enhance.strategy
+import lib.stats.metrics
+from lib.enhance import _tables
 from lib.enhance._utils import ENHANCE_TABLES_PATH
 from lib.enhance._utils import MEAN_CLICKS_TABLES_PATH
 from lib.enhance._utils import GEAR_TYPE
@@ -11,7 +14,7 @@ from lib.enhance._utils import BLACK_GEM_PRICE
 from lib.enhance._utils import CONCENT_ARMOR_PRICE
 from lib.enhance._utils import CONCENT_WEAPON_PRICE
 from lib.enhance._utils import BLACK_STONE_WEAPON_PRICE
-from lib.enhance._utils import MEMORY_FRAGMENT_PRICE
+from lib.enhance._utils import GEAR_FAILSTACK_INCREASE
 
 
 STRATEGIES = {
@@ -20,20 +23,91 @@ STRATEGIES = {
 
 
 class ItemEnhancer(object):
+    # Parts of the cost cascade which do not depend on prices, shared by all enhancers
+    # Keys are (enhancer class, enhancement table, strategy)
+    _CASCADE_TERMS = {}
+    # Prices from lib.enhance._utils covered by enhance_cost_sensitivities()
+    _PRICE_NAMES = ["BLACK_STONE_ARMOR_PRICE", "BLACK_STONE_WEAPON_PRICE", "CONCENT_ARMOR_PRICE",
+                    "CONCENT_WEAPON_PRICE", "MEMORY_FRAGMENT_PRICE", "CLEANSING_COST"]
+
     def __init__(self,
                  strategy : str) -> None:
         self._strategy = STRATEGIES[strategy]
+        self._strategy_name = strategy
 
     # Cost functions
     def enhance_cost(self, gear_type : str, gear_goal_level : str, base_cost : int, failstack : int = 0) -> float:
         raise NotImplementedError("enhance_cost needs to be implemented in child classes")
 
-    def _enhance_cost_all_failstacks(self, gear_type : str, gear_goal_level : str, base_cost : int, failstack : int = 0) -> pd.DataFrame:
+    def enhance_cost_sourced(self, gear_type : str, gear_goal_level : str, base_cost, sacrifice_cost=None,
+                             purchase_cost=None) -> tuple:
+        raise NotImplementedError("enhance_cost_sourced is implemented only for accessories")
+
+    def enhance_cost_exact(self, gear_type : str, gear_goal_level : str, base_cost : int) -> tuple:
+        raise NotImplementedError("enhance_cost_exact needs to be implemented in child classes")
+
+    def enhance_cost_strategies(self, gear_type : str, gear_goal_level : str, base_cost : int, strategies : list) -> tuple:
+        raise NotImplementedError("enhance_cost_strategies needs to be implemented in child classes")
+
+    @staticmethod
+    def _strategies_failstack_cost(strategies : list, failstacks : int) -> np.ndarray:
+        """Returns np.ndarray of shape (len(strategies), failstacks) with the failstack costs of every strategy"""
+        return np.stack([STRATEGIES[_strategy].fs_cost(np.arange(failstacks)) for _strategy in strategies])
+
+    def _enhance_cost_all_failstacks(self, gear_type : str, gear_goal_level : str, base_cost : int, failstack : int = 0) -> np.ndarray:
         raise NotImplementedError("enhance_cost needs to be implemented in child classes")
 
     def single_enhancement_cost(self, gear_type : str, gear_goal_level : str, base_cost : int,
-                                current_level_cost : int, failstack : int = 0, verbose : bool = False) -> float:
-        raise NotImplementedError("single_enhancement_cost needs to be implemented in child classes")
+                                current_level_cost : int, failstack : int = 0, verbose : bool = False):
+        """Returns cost of enhancing gear in a scenario of a single enhancement.
+
+        Assumes the gear has a price of 'current_level_cost' and is enhanced to the 'gear_goal_level'
+        holding 'failstack' number of failstacks. The cost at every failstack is calculated at once,
+        with the same model as a single level of the cost cascade of self.enhance_cost(), see
+        self._single_enhancement_costs() of the child classes. It includes the cost of building the
+        failstacks missing up to the one clicked at, taken as the difference of the costs of building
+        both failstacks from zero.
+
+        Args:
+            gear_type: type of the gear
+            gear_goal_level: level of enhancement desired, one higher than the current one
+            base_cost: price of the item at +0 enhancement level
+            current_level_cost: price of the item at the current enhancement level
+            failstack: number of failstacks held [default: 0]
+            verbose: whether to return the cost at every failstack
+
+        Returns:
+            If 'verbose', np.ndarray with the cost of clicking at each failstack, inf below 'failstack'.
+            Otherwise tuple
+            [0]: number of failstacks at which enhancement is least expensive
+            [1]: number of silvers needed to enhance
+        """
+        failstack = int(failstack)
+        if (failstack < 0):
+            raise ValueError("Failstack number must be non-negative.")
+
+        failstack_cost = self._cascade_terms(gear_type)["failstack_cost"]
+        costs = (failstack_cost - failstack_cost[failstack]
+                 + self._single_enhancement_costs(gear_type, gear_goal_level, base_cost, current_level_cost))
+        costs[:failstack] = np.inf
+        if verbose:
+            return costs
+        min_index = int(np.argmin(costs))
+        return min_index, costs[min_index]
+
+    def _single_enhancement_costs(self, gear_type : str, gear_goal_level : str, base_cost : int,
+                                  current_level_cost : int) -> np.ndarray:
+        raise NotImplementedError("_single_enhancement_costs needs to be implemented in child classes")
+
+    def enhance_cost_sensitivities(self, gear_type : str, gear_goal_level : str, base_cost : int) -> tuple:
+        raise NotImplementedError("enhance_cost_sensitivities needs to be implemented in child classes")
+
+    def enhance_ladder(self, gear_type : str, gear_goal_level : str, base_cost : int) -> list:
+        raise NotImplementedError("enhance_ladder needs to be implemented in child classes")
+
+    def _failstack_increase(self, level) -> int:
+        """Returns the number of failstacks gained after a failed attempt at enhancing to 'level'"""
+        return 1
 
     # Probability functions
     def enhance_chance(self, gear_type : str, gear_goal_level : str, failstack : int = 0) -> float:
@@ -54,10 +128,10 @@ class ItemEnhancer(object):
         gear_type = GEAR_TYPE[gear_type]
         gear_goal_level = ENHANCEMENT_LEVEL[gear_goal_level]
 
-        enhancement_table = pd.read_hdf(ENHANCE_TABLES_PATH, gear_type)
-        return enhancement_table.loc[failstack, gear_goal_level]
+        enhancement_table = _tables.read_table(ENHANCE_TABLES_PATH, gear_type)
+        return enhancement_table[gear_goal_level][failstack]
 
-    def _enhance_chance_all_failstacks(self, gear_type : str, gear_goal_level : str, failstack : int = 0) -> pd.DataFrame:
+    def _enhance_chance_all_failstacks(self, gear_type : str, gear_goal_level : str, failstack : int = 0) -> np.ndarray:
         """Returns enhance chance for all possible failstacks for a given goal enhancement level
 
         Args:
@@ -66,27 +140,171 @@ class ItemEnhancer(object):
             failstack: number of current failstacks
 
         Returns:
-            A column of pd.DataFrame table with enhancement chances
+            np.ndarray with enhancement chances, one for each failstack
         """
         gear_type = GEAR_TYPE[gear_type]
         gear_goal_level = ENHANCEMENT_LEVEL[gear_goal_level]
 
-        enhancement_table = pd.read_hdf(ENHANCE_TABLES_PATH, gear_type)
+        enhancement_table = _tables.read_table(ENHANCE_TABLES_PATH, gear_type)
+
+        return enhancement_table[gear_goal_level]
+
+    def _cascade_terms(self, gear_type : str, goal_index : int = None) -> dict:
+        """Returns the parts of the cost cascade which do not depend on the price of the item
+
+        Gear types sharing an enhancement table (e.g. white, blue and yellow weapons)
+        share the terms, so they are calculated once per enhancement table, strategy and prices.
+        The terms include failstack building costs and gem prices, so the prices of the strategy
+        and self._cascade_prices() are part of the cache key. The terms cover the levels in
+        self._table_levels(), which may stop before the last enhancement level.
+
+        Args:
+            gear_type: type of the gear
+            goal_index: index in self._enhancement_levels of the level the terms are needed up to,
+                ValueError is raised if the tables of 'gear_type' stop before it [default: not checked]
+
+        Returns:
+            Dictionary of np.ndarrays, as returned by self._calculate_cascade_terms()
+        """
+        key = (type(self), GEAR_TYPE[gear_type], self._strategy_name, self._strategy._price_snapshot(),
+               self._cascade_prices())
+        if key not in ItemEnhancer._CASCADE_TERMS:
+            lib.stats.metrics.CACHE_REQUESTS.increment("cascade_terms", "miss")
+            ItemEnhancer._CASCADE_TERMS[key] = self._calculate_cascade_terms(gear_type)
+        else:
+            lib.stats.metrics.CACHE_REQUESTS.increment("cascade_terms", "hit")
+        terms = ItemEnhancer._CASCADE_TERMS[key]
+        if goal_index is not None and goal_index > terms["mean_clicks"].shape[0]:
+            raise ValueError("Tables of {} have no enhancement chances for {}.".format(
+                GEAR_TYPE[gear_type], self._enhancement_levels[goal_index]))
+        return terms
+
+    def _table_levels(self, gear_type : str) -> list:
+        """Returns the enhancement levels after the base one in the tables of 'gear_type', up to the first missing one"""
+        mean_clicks_table = self._mean_clicks_to_enchant(gear_type)
+        enhancement_table = _tables.read_table(ENHANCE_TABLES_PATH, GEAR_TYPE[gear_type])
+        levels = []
+        for _level in self._enhancement_levels[1:]:
+            if _level not in mean_clicks_table or _level not in enhancement_table:
+                break
+            levels.append(_level)
+        return levels
+
+    def _cascade_prices(self) -> tuple:
+        """Returns the prices, other than those of the strategy, the cascade terms depend on"""
+        return ()
+
+    def _calculate_cascade_terms(self, gear_type : str) -> dict:
+        raise NotImplementedError("_calculate_cascade_terms needs to be implemented in child classes")
 
-        return enhancement_table.loc[:, gear_goal_level]
+    def _store_cascade(self, costs : np.ndarray, min_indices : np.ndarray, cost_slices : list) -> None:
+        """Saves the cost cascade of a single scenario in the attributes of self
 
-    def _mean_clicks_to_enchant(self, gear_type : str) -> pd.DataFrame:
+        Args:
+            costs: minimal cost of each enhancement level, starting with the base level
+            min_indices: failstack numbers of the minimal costs
+            cost_slices: cost of every failstack for every enhancement level after the base one
+        """
+        for _index, _level in enumerate(self._enhancement_levels[:costs.shape[0]]):
+            self._enhancement_cost_dict[_level] = costs[_index]
+            self._enhancement_min_index_dict[_level] = min_indices[_index]
+        self._enhancement_cost_table = _tables.Table(np.arange(cost_slices[0].shape[0]),
+                                                     dict(zip(self._enhancement_levels[1:], cost_slices)))
+
+    def _zero_gradients(self, terms : dict, failstack_gradients : dict) -> dict:
+        """Returns a dictionary of derivatives, as returned by enhance_cost_sensitivities(), filled with zeros"""
+        gradients = {_name : 0.0 for _name in ["base_cost"] + self._PRICE_NAMES}
+        gradients["enhancement_probabilities"] = np.zeros(terms["chances"].shape[::-1])
+        gradients["failstack_probabilities"] = np.zeros(failstack_gradients["failstack_probabilities"].shape[1])
+        return gradients
+
+    def _failstack_cost_gradients_at(self, terms : dict, failstack_gradients : dict, failstack : int) -> dict:
+        """Returns derivatives of the cost of building 'failstack' failstacks"""
+        gradients = self._zero_gradients(terms, failstack_gradients)
+        for _name, _gradient in failstack_gradients.items():
+            gradients[_name] = gradients[_name] + _gradient[failstack]
+        return gradients
+
+    @staticmethod
+    def _add_gradients(gradients : dict, other : dict, scale : float) -> None:
+        """Adds 'other' derivatives multiplied by 'scale' to 'gradients' in place"""
+        for _name, _gradient in other.items():
+            gradients[_name] = gradients[_name] + scale * _gradient
+
+    @staticmethod
+    def _mean_clicks_gradient(chances : np.ndarray, failstack : int, failstack_increase : int) -> np.ndarray:
+        """Returns derivatives of the mean number of clicks with respect to the enhancement chances.
+
+        The mean clicks tables are simulations of E(f) = 1 + (1 - p(f)) * E(f + failstack_increase),
+        where p(f) is the chance at failstack f. The failstack does not grow past the last row,
+        so there E = 1 / p. Differentiating along the failstacks f_0, f_1, ... visited from 'failstack' gives
+            dE / dp(f_i) = -S_i * E(f_(i+1)), with S_i the chance of failing all attempts before f_i
+            dE / dp(last) = -S_last / p(last) ** 2
+
+        Args:
+            chances: np.ndarray with the enhancement chance at each failstack
+            failstack: failstack at which enhancing starts
+            failstack_increase: number of failstacks gained after a failed attempt
+
+        Returns:
+            np.ndarray with one derivative for each failstack
+        """
+        last = chances.shape[0] - 1
+        path = list(range(failstack, last, failstack_increase)) + [last]
+
+        # Mean clicks when starting from each failstack of the path
+        mean_clicks = [1 / chances[last]]
+        for _row in reversed(path[:-1]):
+            mean_clicks.insert(0, 1 + (1 - chances[_row]) * mean_clicks[0])
+
+        gradient = np.zeros(chances.shape[0])
+        survival = 1.0
+        for _step, _row in enumerate(path[:-1]):
+            gradient[_row] -= survival * mean_clicks[_step + 1]
+            survival *= 1 - chances[_row]
+        gradient[last] -= survival / chances[last] ** 2
+        return gradient
+
+    def _format_gradients(self, gear_type : str, gradients : dict) -> dict:
+        """Labels the derivatives with respect to enhancement chances like the enhancement table"""
+        enhancement_table = _tables.read_table(ENHANCE_TABLES_PATH, GEAR_TYPE[gear_type])
+        gradients["enhancement_probabilities"] = _tables.Table(
+            enhancement_table.index, dict(zip(self._enhancement_levels[1:], gradients["enhancement_probabilities"].T)))
+        return gradients
+
+    def _ladder_failstacks(self, goal_index : int) -> np.ndarray:
+        """Returns failstacks chosen by the last cost cascade for every level up to self._enhancement_levels[goal_index]"""
+        return np.array([self._enhancement_min_index_dict[_level] for _level in self._enhancement_levels[1:goal_index + 1]])
+
+    def _ladder(self, goal_index : int, breakdown : dict) -> list:
+        """Collects the breakdown of the last cost cascade into one dictionary per enhancement level
+
+        Args:
+            goal_index: index of the goal enhancement level in self._enhancement_levels
+            breakdown: dictionary of np.ndarrays with one value for each enhancement level
+                from the first one up to the goal one
+
+        Returns:
+            List of dictionaries with the "level", its "cost" and the values from 'breakdown'
+        """
+        ladder = []
+        for _index, _level in enumerate(self._enhancement_levels[1:goal_index + 1]):
+            step = {"level" : _level, "cost" : self._enhancement_cost_dict[_level]}
+            step.update({_name : _values[_index] for _name, _values in breakdown.items()})
+            ladder.append(step)
+        return ladder
+
+    def _mean_clicks_to_enchant(self, gear_type : str) -> _tables.Table:
         """Returns mean number of tries required to expect one succesful enchantment
 
         Args:
             gear_type: type of the gear
 
         Returns:
-            pd.DataFrame covering all enhancement levels (columns) and failstack chances (verses)
+            lib.enhance._tables.Table covering all enhancement levels (columns) and failstack chances (verses)
 
         """
-        mean_clicks_df = pd.read_hdf(MEAN_CLICKS_TABLES_PATH, GEAR_TYPE[gear_type])
-        return mean_clicks_df
+        return _tables.read_table(MEAN_CLICKS_TABLES_PATH, GEAR_TYPE[gear_type])
 
 
 class AccEnhancer(ItemEnhancer):
@@ -96,7 +314,7 @@ class AccEnhancer(ItemEnhancer):
         Attributes:
             self._enhancement_levels: list with possible accessory enhancement levels
             self._enhancement_cost_dict: dictionary with minimum average cost required to enhance to particular level
-            self._enhancement_cost_df: pandas.DataFrame with average cost of enhancing item
+            self._enhancement_cost_table: lib.enhance._tables.Table with average cost of enhancing item
 
         """
         super(AccEnhancer, self).__init__(strategy)
@@ -117,7 +335,7 @@ class AccEnhancer(ItemEnhancer):
             "TET" : 0,
             "PEN" : 0,         
         }
-        self._enhancement_cost_df = pd.DataFrame()
+        self._enhancement_cost_table = None
     
     def enhance_cost(self, gear_type : str, gear_goal_level : str, base_cost : int, failstack : int = 0) -> tuple:
         """Returns cost of self-enhancing an accessory to 'gear_goal_level' of enhancement.
@@ -144,261 +362,278 @@ class AccEnhancer(ItemEnhancer):
         failstack = int(failstack)
         if (failstack < 0):
             raise ValueError("Failstack number must be non-negative.")
-        
-        # Base cost assignment
-        self._enhancement_cost_dict[0] = base_cost
 
-        # Mean number of tries to enhance
-        mean_clicks_df = self._mean_clicks_to_enchant(gear_type)
+        goal_index = self._enhancement_levels.index(gear_goal_level)
+        costs, min_indices, cost_slices = self._enhance_cost_cascade(gear_type=gear_type, goal_index=goal_index,
+                                                                     base_cost=np.array([base_cost]), keep_slices=True)
+        self._store_cascade(costs[0], min_indices[0], [_slice[0] for _slice in cost_slices])
+        return self._enhancement_min_index_dict[gear_goal_level], self._enhancement_cost_dict[gear_goal_level]
 
-        # Calculations loop
-        # Each iteration it calculates the cost of enhancing in the range of possible failstack number
-        # Each iteration represents a single enhancement level
-        # Each iteration it finds the lowest price, considering failstack building cost, base cost
-        #   and cost of the already enhanced accessory
-        
-        failstack_cost = self._strategy._all_failstack_price()
+    def enhance_cost_strategies(self, gear_type : str, gear_goal_level : str, base_cost : int, strategies : list) -> tuple:
+        """Returns cost of self-enhancing an accessory to every level up to 'gear_goal_level' with each of 'strategies'.
 
-        for _index, _level in enumerate(self._enhancement_levels[1:]):
-            # enhancement_chance_slice contains a column of enhancement probabilities for the accessory
-            # REPLACED by mean number of tries to enhance
-            # enhancement_chance_slice = self._enhance_chance_all_failstacks(gear_type=gear_type, gear_goal_level=_level)
+        The failstack costs of the strategies are stacked into a matrix, which is one row of
+        scenarios each in a single run of the cost cascade of self.enhance_cost().
 
-            # mean_clicks_slice contains a column of mean number of tries required to average one success
-            mean_clicks_slice = mean_clicks_df[_level]
+        Args:
+            gear_type: type of the gear
+            gear_goal_level: level of enhancement desired
+            base_cost: price of accessory at +0 enhancement level
+            strategies: names of the failstacking strategies, keys of STRATEGIES
 
-            # total cost = (failstack building cost) + (cost of enhancing gear to preceding level + price of base accessory
-            #   needed for enchanting) * number of times needed to average one success
-            total_cost = (failstack_cost) + (self._enhancement_cost_dict[self._enhancement_levels[_index]]
-                             + self._enhancement_cost_dict[0]) * mean_clicks_slice
-            self._enhancement_cost_df[_level] = total_cost
+        Returns:
+            Tuple of np.ndarrays of shape (len(strategies), levels), one column for every level
+            from PRI up to 'gear_goal_level'
+            [0]: number of failstacks at which enhancement is least expensive
+            [1]: number of silvers needed to enhance, as returned by self.enhance_cost()
+        """
+        if (gear_goal_level not in "PRI DUO TRI TET PEN".split()):
+            raise ValueError("Gear goal level should be PRI | DUO | TRI | TET | PEN for accessories.")
 
-            # Finding out the minimal price for a _level enhancement level
-            self._enhancement_cost_dict[_level] = min(total_cost)
-            self._enhancement_min_index_dict[_level] = np.argmin(total_cost)
+        goal_index = self._enhancement_levels.index(gear_goal_level)
+        failstack_cost = self._strategies_failstack_cost(strategies, self._cascade_terms(gear_type)["mean_clicks"].shape[1])
+        costs, min_indices, _slices = self._enhance_cost_cascade(gear_type=gear_type, goal_index=goal_index,
+                                                                 base_cost=np.full(len(strategies), float(base_cost)),
+                                                                 failstack_cost=failstack_cost)
+        return min_indices[:, 1:], costs[:, 1:]
 
-            # Early stopping - there is no need to fill the whole _enhancement_cost_dict, just up to the point
-            # required by function arguments
-            if(_level == gear_goal_level):
-                return self._enhancement_min_index_dict[_level], self._enhancement_cost_dict[_level]
+    def _enhance_cost_cascade(self, gear_type : str, goal_index : int, base_cost : np.ndarray, keep_slices : bool = False,
+                              sacrifice_cost : np.ndarray = None, purchase_cost : np.ndarray = None,
+                              failstack_cost : np.ndarray = None) -> tuple:
+        """Calculates the cost of enhancing accessories for many base costs at once.
 
-    def _enhance_cost_all_failstacks(self, gear_type : str, gear_goal_level : str, base_cost : int, failstack : int = 0) -> pd.DataFrame:
-        """Returns cost of enhancing for all failstacks number and all enhancement levels 
+        Each iteration represents a single enhancement level and calculates the cost of enhancing
+        in the range of possible failstack number for all base costs. The lowest price considers
+        failstack building cost, the price of the sacrificed accessory and cost of the already
+        enhanced accessory. Where 'purchase_cost' is lower, the level is bought instead and
+        its failstack number is -1.
 
         Args:
-            gear_type: type of gear
-            gear_goal_level: target enhancement level of the equipment
-            base_cost: price of the +0 item
-            failstack: number of failstack
+            gear_type: type of the gear
+            goal_index: index of the goal enhancement level in self._enhancement_levels
+            base_cost: np.ndarray of shape (N,) with prices of the accessory at +0 enhancement level
+            keep_slices: whether to return costs of all failstacks of every level
+            sacrifice_cost: np.ndarray of shape (N, goal_index) with the price of the accessory sacrificed
+                on every try at each enhancement level after the base one [default: 'base_cost']
+            purchase_cost: np.ndarray of shape (N, goal_index) with the price of buying the accessory
+                of each enhancement level after the base one, inf where it cannot be bought
+                [default: never bought]
+            failstack_cost: np.ndarray of shape (N, failstacks) with the cost of building each failstack,
+                e.g. with another strategy in every scenario [default: the strategy of the enhancer]
 
         Returns:
-            pandas.DataFrame with enhancement costs. Rows contain failstack numbers and columns are enhancement levels.
-            Each cell contains cost of enhancing the equipment to the next enhancement level at a given failstack number.
+            Tuple
+            [0]: np.ndarray of shape (N, goal_index + 1) with minimal cost of each enhancement level
+            [1]: np.ndarray of shape (N, goal_index + 1) with failstack numbers of the minimal costs
+            [2]: list of np.ndarrays of shape (N, failstacks) with cost of every failstack for every
+                enhancement level after the base one. Empty if 'keep_slices' is False.
         """
-        self.enhance_cost(gear_type=gear_type, gear_goal_level=gear_goal_level, base_cost=base_cost)
-        return self._enhancement_cost_df[gear_goal_level]
+        terms = self._cascade_terms(gear_type, goal_index)
+        base_cost = np.asarray(base_cost, dtype=float)
+        scenarios = np.arange(base_cost.shape[0])
+        if sacrifice_cost is None:
+            sacrifice_cost = np.broadcast_to(base_cost[:, np.newaxis], (base_cost.shape[0], goal_index))
+        if failstack_cost is None:
+            failstack_cost = terms["failstack_cost"]
+
+        costs = np.zeros((base_cost.shape[0], goal_index + 1))
+        min_indices = np.zeros((base_cost.shape[0], goal_index + 1), dtype=int)
+        costs[:, 0] = base_cost
+        cost_slices = []
+        for _index in range(1, goal_index + 1):
+            # total cost = (failstack building cost) + (cost of enhancing gear to preceding level + price of base accessory
+            #   needed for enchanting) * number of times needed to average one success
+            total_cost = (failstack_cost + (costs[:, _index - 1] + sacrifice_cost[:, _index - 1])[:, np.newaxis]
+                            * terms["mean_clicks"][_index - 1])
+            min_indices[:, _index] = np.argmin(total_cost, axis=1)
+            costs[:, _index] = total_cost[scenarios, min_indices[:, _index]]
+            if purchase_cost is not None:
+                bought = purchase_cost[:, _index - 1] < costs[:, _index]
+                costs[bought, _index] = purchase_cost[bought, _index - 1]
+                min_indices[bought, _index] = -1
+            if keep_slices:
+                cost_slices.append(total_cost)
+        return costs, min_indices, cost_slices
+
+    def enhance_cost_exact(self, gear_type : str, gear_goal_level : str, base_cost : int) -> tuple:
+        """Returns cost of self-enhancing an accessory with exact expected numbers of clicks.
+
+        Accessories are destroyed on failure, so enhancement levels are not coupled and every try
+        costs the accessory of the previous level and the base one. The cost cascade is the same
+        as in self.enhance_cost(), but the mean clicks come from lib.enhance.markov instead of
+        the simulated tables.
 
-    def single_enhancement_cost(self, gear_type : str, gear_goal_level : str, base_cost : int, current_level_cost : int, failstack : int = 0, verbose=False) -> float:
-        """Returns cost of enhancing gear in a scenario of a single enhancement.
+        Returns:
+            Tuple
+            [0]: number of failstacks at which enhancement is least expensive
+            [1]: number of silvers needed to enhance
+        """
+        if (gear_goal_level not in "PRI DUO TRI TET PEN".split()):
+            raise ValueError("Gear goal level should be PRI | DUO | TRI | TET | PEN for accessories.")
+
+        terms = self._cascade_terms(gear_type, self._enhancement_levels.index(gear_goal_level))
+        cost = base_cost
+        for _index in range(1, self._enhancement_levels.index(gear_goal_level) + 1):
+            clicks = lib.enhance.markov.expected_costs(
+                chances=terms["chances"][[_index - 1]], start_failstacks=0,
+                failstack_increase=self._failstack_increase(self._enhancement_levels[_index]),
+                click_cost=1, failure_cost=0, failure_levels=0, failstack_cost=terms["failstack_cost"])[0]
+            total_cost = terms["failstack_cost"] + (cost + base_cost) * clicks
+            min_index = int(np.argmin(total_cost))
+            cost = total_cost[min_index]
+        return min_index, cost
+
+    def enhance_cost_sourced(self, gear_type : str, gear_goal_level : str, base_cost, sacrifice_cost=None,
+                             purchase_cost=None) -> tuple:
+        """Returns cost of getting accessories of 'gear_goal_level' for many price scenarios at once.
+
+        Like self.enhance_cost(), but every try at each level may sacrifice an accessory of another
+        price and each level may be bought instead of enhanced, whichever is cheaper.
+        Level arguments have one column for each level after the base one: PRI, DUO, TRI, TET, PEN.
+        Columns past 'gear_goal_level' are ignored. A single row applies to all scenarios.
 
-        Assumes the gear has a price of 'current_level_cost' and is enhanced to the 'gear_goal_level' using
-        'failstack' number of failstacks.
+        Args:
+            gear_type: type of the gear
+            gear_goal_level: level of enhancement desired
+            base_cost: prices of the accessory at +0 enhancement level, shape (N,)
+            sacrifice_cost: price of the accessory sacrificed on every try at each level,
+                shape (N, 5) or (5,) [default: 'base_cost']
+            purchase_cost: price of buying the accessory of each level, shape (N, 5) or (5,),
+                inf or NaN where it cannot be bought [default: never bought]
 
         Returns:
-            Estimated cost of enhancement.
+            Tuple
+            [0]: np.ndarray of shape (N,) with the failstack to enhance to 'gear_goal_level' on,
+                -1 where buying it is cheaper
+            [1]: np.ndarray of shape (N,) with the cost of 'gear_goal_level'
+            [2]: np.ndarray of shape (N, levels up to 'gear_goal_level') with True for levels
+                which are bought
         """
-        if verbose:
-            enhancement_probability = self._enhance_chance_all_failstacks(gear_type=gear_type, gear_goal_level=gear_goal_level)
-        else:
-            enhancement_probability = self.enhance_chance(gear_type=gear_type, gear_goal_level=gear_goal_level, failstack=failstack)
+        if (gear_goal_level not in "PRI DUO TRI TET PEN".split()):
+            raise ValueError("Gear goal level should be PRI | DUO | TRI | TET | PEN for accessories.")
 
-        return (current_level_cost + base_cost) / enhancement_probability
+        goal_index = self._enhancement_levels.index(gear_goal_level)
+        base_cost = np.atleast_1d(np.asarray(base_cost, dtype=float))
+        shape = (base_cost.shape[0], len(self._enhancement_levels) - 1)
+        if sacrifice_cost is not None:
+            sacrifice_cost = np.broadcast_to(np.asarray(sacrifice_cost, dtype=float), shape)[:, :goal_index]
+        if purchase_cost is not None:
+            purchase_cost = np.broadcast_to(np.asarray(purchase_cost, dtype=float), shape)[:, :goal_index]
+            purchase_cost = np.where(np.isnan(purchase_cost), np.inf, purchase_cost)
 
+        costs, min_indices, _slices = self._enhance_cost_cascade(gear_type=gear_type, goal_index=goal_index,
+                                                                 base_cost=base_cost, sacrifice_cost=sacrifice_cost,
+                                                                 purchase_cost=purchase_cost)
+        return min_indices[:, goal_index], costs[:, goal_index], min_indices[:, 1:] == -1
 
-class WeaponEnhancer(ItemEnhancer):
-
-    def __init__(self, strategy : str) -> None:
-        """Deal with enhancing chance and cost calculations of weapons
-        
-        Attributes:
-            self._enhancement_levels: list with possible weapon enhancement levels
-            self._enhancement_cost_dict: dictionary with minimum average cost required to enhance to particular level
-            self._enhancement_cost_df: pandas.DataFrame with average cost of enhancing item
+    def _calculate_cascade_terms(self, gear_type : str) -> dict:
+        """Returns the parts of the accessory cost cascade which do not depend on the price of the accessory
 
+        Returns:
+            Dictionary with:
+            "failstack_cost": np.ndarray with the cost of building each failstack
+            "mean_clicks": np.ndarray of shape (levels, failstacks) with mean number of tries required
+                to average one success for each enhancement level after the base one
+            "chances": np.ndarray of shape (levels, failstacks) with enhancement chances
         """
-        super(WeaponEnhancer, self).__init__(strategy)  
-        self._enhancement_levels = [0, 1, 2, 3, 4, 5, 6, 7, 8 , 9, 10, 11, 12, 
-            13, 14, 15, "PRI", "DUO", "TRI", "TET", "PEN"]
-        self._enhancement_cost_dict = {
-            0 : 0,
-            1 : 0,
-            2 : 0,
-            3 : 0,
-            4 : 0,
-            5 : 0,
-            6 : 0,
-            7 : 0,
-            8 : 0,
-            9 : 0,
-            10 : 0,
-            11 : 0,
-            12 : 0,
-            13 : 0,
-            14 : 0,
-            15 : 0,
-            "PRI" : 0,
-            "DUO" : 0,
-            "TRI" : 0,
-            "TET" : 0,
-            "PEN" : 0,
-        }
-        self._enhancement_min_index_dict = {
-            0 : 0,
-            1 : 0,
-            2 : 0,
-            3 : 0,
-            4 : 0,
-            5 : 0,
-            6 : 0,
-            7 : 0,
-            8 : 0,
-            9 : 0,
-            10 : 0,
-            11 : 0,
-            12 : 0,
-            13 : 0,
-            14 : 0,
-            15 : 0,
-            "PRI" : 0,
-            "DUO" : 0,
-            "TRI" : 0,
-            "TET" : 0,
-            "PEN" : 0,
+        mean_clicks_table = self._mean_clicks_to_enchant(gear_type)
+        enhancement_table = _tables.read_table(ENHANCE_TABLES_PATH, GEAR_TYPE[gear_type])
+        levels = self._table_levels(gear_type)
+        return {
+            "failstack_cost" : self._strategy.failstack_costs(),
+            "mean_clicks" : mean_clicks_table.stack(levels),
+            "chances" : enhancement_table.stack(levels),
         }
 
-        self._enhancement_cost_df = pd.DataFrame()
-        self._enhancement_probabilities_df = pd.DataFrame()
+    def enhance_cost_sensitivities(self, gear_type : str, gear_goal_level : str, base_cost : int) -> tuple:
+        """Returns cost of self-enhancing an accessory along with its derivatives.
 
-    def enhance_cost(self, gear_type : str, gear_goal_level : str, base_cost : int, failstack : int = 0) -> tuple:
-        """Returns cost of self-enhancing a weapon to 'gear_goal_level' of enhancement.
-
-        Assumes self-enhancing according to the provided strategy from the base enhancement level
-        up to the enhancement level provided in 'gear_goal_level'.
+        Derivatives are carried forward through the cost cascade of self.enhance_cost(), one
+        enhancement level at a time, with the failstack numbers chosen by the cascade kept fixed.
+        Each level costs
+            (failstack building cost) + (previous level cost + base cost) * mean clicks
+        Derivatives of the mean clicks are those of the model simulated in the mean clicks
+        tables, see self._mean_clicks_gradient().
 
         Args:
             gear_type: type of the gear
             gear_goal_level: level of enhancement desired
-            base_cost: price of weapon at +0 enhancement level
-            failstack: number of current failstacks [default: 0]
+            base_cost: price of accessory at +0 enhancement level
 
         Returns:
             Tuple
             [0]: number of failstacks at which enhancement is least expensive
             [1]: number of silvers needed to enhance
-        
-        """      
-        # Argument check
-        if (gear_goal_level not in "1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 PRI DUO TRI TET PEN".split()):
-            raise ValueError("Gear goal level should be 1-15 | PRI | DUO | TRI | TET | PEN for weapons.")
+            [2]: dictionary with derivatives of [1] with respect to
+                "base_cost": 'base_cost'
+                the name of every price in lib.enhance._utils (e.g. "CONCENT_WEAPON_PRICE")
+                "enhancement_probabilities": lib.enhance._tables.Table with the derivative with respect
+                    to each cell of the enhancement table of 'gear_type'
+                "failstack_probabilities": np.ndarray with the derivative with respect to each
+                    enhancement chance used by the failstacking strategy
 
-        failstack = int(failstack)
-        if (failstack < 0):
-            raise ValueError("Failstack number must be non-negative.")
-        
-        if(gear_goal_level in "1 2 3 4 5 6 7 8 9 10 11 12 13 14 15".split()):
-            gear_goal_level = int(gear_goal_level)
-
-
-        # Base cost assignment
-        self._enhancement_cost_dict[0] = base_cost
-
-        # Mean clicks dataframe read
-        mean_clicks_df = self._mean_clicks_to_enchant(GEAR_TYPE[gear_type])
-
-        # Flaggin for repairs using base cost or memory fragments
-        # memory fragments repair durability by:
-        # 10 on white weapons
-        # 5 on green weapons
-        # 2 on blue weapons
-        # 1 on yellow weapons (boss weapons)
-        memory_durability_multiplier_dict = {
-            "white-weapon" : 10,
-            "green-weapon" : 5,
-            "blue-weapon" : 2,
-            "yellow-weapon" : 1
-        }
-        memory_repair_multiplier = memory_durability_multiplier_dict[gear_type]
-
-        if base_cost > (10 / memory_repair_multiplier * MEMORY_FRAGMENT_PRICE):
-            one_durability_cost = MEMORY_FRAGMENT_PRICE
-        else :
-            one_durability_cost = base_cost / 10
-
-
-        # Data needed: failstack building cost and enhancement probabilities
-        # Failstack building is in failstack_cost
-        # Enhancement probabilities are in self._enhancement_probabilities_df
-        # The latter contains probabilities for all enhancement levels (columns)
-        # and failstacks (verses)
-
-        # Failstack read
-        failstack_cost = self._strategy._all_failstack_price()
-        # Enhancement probabilities read
-        for _index, __level in enumerate("1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 PRI DUO TRI TET PEN".split(" ")):
-            self._enhancement_probabilities_df[self._enhancement_levels[_index + 1]] = self._enhance_chance_all_failstacks(gear_type, __level)
-
-        # Calculations loop
-        # Each iteration represents one enhancement level
-        # Each iteration the cost of enhancement is calculated for all failstacks
-        # and the lowest cost is pushed into cost dictionary along with failstack number
-        # at which the min cost occured
-        for __enhancement_level in self._enhancement_levels[1:]:
-            self._enhance_cost_one_level(_enhancement_level_goal=__enhancement_level, _failstack_cost=failstack_cost,
-                 one_durability_cost=one_durability_cost, mean_number_tries=mean_clicks_df)
-            if (__enhancement_level == (gear_goal_level)):
-                break
+        """
+        min_failstack, cost = self.enhance_cost(gear_type=gear_type, gear_goal_level=gear_goal_level, base_cost=base_cost)
+        terms = self._cascade_terms(gear_type)
+        failstack_gradients = self._strategy._failstack_cost_gradients(terms["chances"].shape[1] - 1)
+
+        base_gradients = self._zero_gradients(terms, failstack_gradients)
+        base_gradients["base_cost"] = 1.0
+        gradients = base_gradients
+        for _index in range(1, self._enhancement_levels.index(gear_goal_level) + 1):
+            _level = self._enhancement_levels[_index]
+            failstack = self._enhancement_min_index_dict[_level]
+            mean_clicks = terms["mean_clicks"][_index - 1, failstack]
+            used_items_cost = self._enhancement_cost_dict[self._enhancement_levels[_index - 1]] + base_cost
+
+            level_gradients = self._failstack_cost_gradients_at(terms, failstack_gradients, failstack)
+            self._add_gradients(level_gradients, gradients, mean_clicks)
+            self._add_gradients(level_gradients, base_gradients, mean_clicks)
+            level_gradients["enhancement_probabilities"][:, _index - 1] += used_items_cost * self._mean_clicks_gradient(
+                terms["chances"][_index - 1], failstack, self._failstack_increase(_level))
+            gradients = level_gradients
+        return min_failstack, cost, self._format_gradients(gear_type, gradients)
+
+    def enhance_ladder(self, gear_type : str, gear_goal_level : str, base_cost : int) -> list:
+        """Returns the cost of self-enhancing an accessory to every level up to 'gear_goal_level'.
+
+        All levels come from a single cost cascade, the same one as in self.enhance_cost().
+        Costs of accessories are cumulative, each one includes the cost of the previous level.
 
-        return self._enhancement_min_index_dict[gear_goal_level], self._enhancement_cost_dict[gear_goal_level] 
+        Args:
+            gear_type: type of the gear
+            gear_goal_level: level of enhancement desired
+            base_cost: price of accessory at +0 enhancement level
 
-    def _enhance_cost_one_level(self, _enhancement_level_goal : str, _failstack_cost : pd.DataFrame, one_durability_cost : float, mean_number_tries : pd.DataFrame):
-        """Helper function for self.enhance_cost()
-        It updates the attributes of self with enhancement cost calculated
-        inside this function along with failstack numbers resulting in
-        the minimal cost.
-
-        """
-        _level = _enhancement_level_goal
-        _failstack_cost = _failstack_cost
-        mean_clicks_slice = mean_number_tries[_level]
-
-        _failstack_probability_slice = self._enhancement_probabilities_df[_level]
-        tries_needed_to_enhance_slice = mean_clicks_slice
-        # previous level cost is read from enhancement cost dict with a key
-        # of previous enhancement level
-
-        if(_level in [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15]):
-            gems_cost_slice = BLACK_STONE_WEAPON_PRICE * tries_needed_to_enhance_slice
-            repair_cost_slice = (tries_needed_to_enhance_slice - 1) * 5 * one_durability_cost
-            total_cost_slice = _failstack_cost + gems_cost_slice + repair_cost_slice # + previous_level_cost
-
-        if(_level in "PRI DUO".split()):
-            gems_cost_slice = CONCENT_WEAPON_PRICE * tries_needed_to_enhance_slice
-            repair_cost_slice = (tries_needed_to_enhance_slice - 1) * 10 * one_durability_cost
-            total_cost_slice = _failstack_cost + gems_cost_slice + repair_cost_slice
-
-        if(_level in "TRI TET PEN".split()):
-            gems_cost_slice = CONCENT_WEAPON_PRICE * tries_needed_to_enhance_slice
-            repair_cost_slice = (tries_needed_to_enhance_slice - 1) * 10 * one_durability_cost
-            previous_level_cost = self._enhancement_cost_dict[self._enhancement_levels[self._enhancement_levels.index(_level) - 1]]
-            reenhance_to_current_level_cost_slice = (tries_needed_to_enhance_slice - 1) * previous_level_cost
-            total_cost_slice = _failstack_cost + gems_cost_slice + repair_cost_slice + reenhance_to_current_level_cost_slice
-
-
-        self._enhancement_cost_df[_level] = total_cost_slice
-        self._enhancement_cost_dict[_level] = np.min(total_cost_slice)
-        self._enhancement_min_index_dict[_level] = np.argmin(total_cost_slice)
-            
-    def _enhance_cost_all_failstacks(self, gear_type : str, gear_goal_level : str, base_cost : int, failstack : int = 0) -> pd.DataFrame:
+        Returns:
+            List of dictionaries, one for each enhancement level from PRI up to 'gear_goal_level', with:
+            "level": enhancement level
+            "cost": number of silvers needed to enhance to the level
+            "failstack": number of failstacks at which enhancement is least expensive
+            "clicks": mean number of tries
+            "failstack_cost": cost of building the failstack
+            "materials": number of +0 accessories used up
+            "materials_cost": cost of the +0 accessories
+            "repair_cost": always 0, accessories are not repaired
+            "previous_level_cost": cost of the accessories of the previous level used up
+        """
+        self.enhance_cost(gear_type=gear_type, gear_goal_level=gear_goal_level, base_cost=base_cost)
+        goal_index = self._enhancement_levels.index(gear_goal_level)
+        terms = self._cascade_terms(gear_type)
+        failstacks = self._ladder_failstacks(goal_index)
+        clicks = terms["mean_clicks"][np.arange(goal_index), failstacks]
+        previous_level_cost = np.array([self._enhancement_cost_dict[_level] for _level in self._enhancement_levels[:goal_index]])
+        return self._ladder(goal_index, {
+            "failstack" : failstacks,
+            "clicks" : clicks,
+            "failstack_cost" : terms["failstack_cost"][failstacks],
+            "materials" : clicks,
+            "materials_cost" : base_cost * clicks,
+            "repair_cost" : np.zeros(goal_index),
+            "previous_level_cost" : previous_level_cost * clicks,
+        })
+
+    def _enhance_cost_all_failstacks(self, gear_type : str, gear_goal_level : str, base_cost : int, failstack : int = 0) -> np.ndarray:
         """Returns cost of enhancing for all failstacks number and all enhancement levels 
 
         Args:
@@ -408,43 +643,47 @@ class WeaponEnhancer(ItemEnhancer):
             failstack: number of failstack
 
         Returns:
-            pandas.DataFrame with enhancement costs. Rows contain failstack numbers and columns are enhancement levels.
-            Each cell contains cost of enhancing the equipment to the next enhancement level at a given failstack number.
+            np.ndarray with the cost of enhancing the equipment to 'gear_goal_level' at each failstack number.
         """
-
         self.enhance_cost(gear_type=gear_type, gear_goal_level=gear_goal_level, base_cost=base_cost)
-        return self._enhancement_cost_df[ENHANCEMENT_LEVEL[gear_goal_level]]
-
-    def single_enhancement_cost(self, gear_type : str, gear_goal_level : str, base_cost : int, current_level_cost : int, failstack : int = 0, verbose=False) -> float:
-        """Returns cost of enhancing gear in a scenario of a single enhancement.
+        return self._enhancement_cost_table[gear_goal_level]
 
-        Assumes the gear has a price of 'current_level_cost' and is enhanced to the 'gear_goal_level' using
-        'failstack' number of failstacks.
+    def _single_enhancement_costs(self, gear_type : str, gear_goal_level : str, base_cost : int,
+                                  current_level_cost : int) -> np.ndarray:
+        """Returns cost of a single enhancement at every failstack, without building the failstack
 
-        Returns:
-            Estimated cost of enhancement.
+        Every try uses up a +0 accessory and the enhanced one is lost on failure, so
+            cost = (current level cost + base cost) * mean clicks
         """
-        # TO-DO (konrad.pagacz@gmail.com) implement this function for weapons and armors
-        print("Currently implemented propoerly only for accessories")
-        if verbose:
-            enhancement_probability = self._enhance_chance_all_failstacks(gear_type=gear_type, gear_goal_level=gear_goal_level)
-        else:
-            enhancement_probability = self.enhance_chance(gear_type=gear_type, gear_goal_level=gear_goal_level, failstack=failstack)
+        if (gear_goal_level not in "PRI DUO TRI TET PEN".split()):
+            raise ValueError("Gear goal level should be PRI | DUO | TRI | TET | PEN for accessories.")
 
-        return (current_level_cost + base_cost) / enhancement_probability
+        goal_index = self._enhancement_levels.index(gear_goal_level)
+        mean_clicks = self._cascade_terms(gear_type, goal_index)["mean_clicks"][goal_index - 1]
+        return (current_level_cost + base_cost) * mean_clicks
 
 
-class ArmorEnhancer(ItemEnhancer):
-    def __init__(self, strategy : str) -> None:
-        """Deal with enhancing chance and cost calculations of armors
-        
-        Attributes:
-            self._enhancement_levels: list with possible armor enhancement levels
-            self._enhancement_cost_dict: dictionary with minimum average cost required to enhance to particular level
-            self._enhancement_cost_df: pandas.DataFrame with average cost of enhancing item
+class GearEnhancer(ItemEnhancer):
+    """Common part of weapon and armor enhancers.
 
-        """
-        super(ArmorEnhancer, self).__init__(strategy)  
+    Weapons and armor share enhancement rules and differ only in the prices of
+    the materials and the repairs. Child classes provide them in the class attributes.
+
+    Attributes:
+        _BLACK_STONE_PRICE: price of the black stone used for enhancing to +1 - +15
+        _CONCENT_PRICE: price of the concentrated black stone used for enhancing to PRI - PEN
+        _BLACK_STONE_PRICE_NAME: name of _BLACK_STONE_PRICE in lib.enhance._utils
+        _CONCENT_PRICE_NAME: name of _CONCENT_PRICE in lib.enhance._utils
+        _MEMORY_DURABILITY_MULTIPLIER: durability restored by a single memory fragment for each gear type
+    """
+    _BLACK_STONE_PRICE = None
+    _CONCENT_PRICE = None
+    _BLACK_STONE_PRICE_NAME = None
+    _CONCENT_PRICE_NAME = None
+    _MEMORY_DURABILITY_MULTIPLIER = {}
+
+    def __init__(self, strategy : str) -> None:
+        super(GearEnhancer, self).__init__(strategy)
         self._enhancement_levels = [0, 1, 2, 3, 4, 5, 6, 7, 8 , 9, 10, 11, 12, 
             13, 14, 15, "PRI", "DUO", "TRI", "TET", "PEN"]
         self._enhancement_cost_dict = {
@@ -494,11 +733,10 @@ class ArmorEnhancer(ItemEnhancer):
             "PEN" : 0,
         }
 
-        self._enhancement_cost_df = pd.DataFrame()
-        self._enhancement_probabilities_df = pd.DataFrame()
+        self._enhancement_cost_table = None
 
     def enhance_cost(self, gear_type : str, gear_goal_level : str, base_cost : int, failstack : int = 0) -> tuple:
-        """Returns cost of self-enhancing a piece of armor to 'gear_goal_level' of enhancement.
+        """Returns cost of self-enhancing a piece of gear to 'gear_goal_level' of enhancement.
 
         Assumes self-enhancing according to the provided strategy from the base enhancement level
         up to the enhancement level provided in 'gear_goal_level'.
@@ -506,7 +744,7 @@ class ArmorEnhancer(ItemEnhancer):
         Args:
             gear_type: type of the gear
             gear_goal_level: level of enhancement desired
-            base_cost: price of weapon at +0 enhancement level
+            base_cost: price of the gear at +0 enhancement level
             failstack: number of current failstacks [default: 0]
 
         Returns:
@@ -517,106 +755,301 @@ class ArmorEnhancer(ItemEnhancer):
         """      
         # Argument check
         if (gear_goal_level not in "1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 PRI DUO TRI TET PEN".split()):
-            raise ValueError("Gear goal level should be 1-15 | PRI | DUO | TRI | TET | PEN for weapons.")
+            raise ValueError("Gear goal level should be 1-15 | PRI | DUO | TRI | TET | PEN for weapons and armor.")
 
         failstack = int(failstack)
         if (failstack < 0):
             raise ValueError("Failstack number must be non-negative.")
         
-        if(gear_goal_level in "1 2 3 4 5 6 7 8 9 10 11 12 13 14 15".split()):
-            gear_goal_level = int(gear_goal_level)
-
-
-        # Base cost assignment
-        self._enhancement_cost_dict[0] = base_cost
-
-        # Mean clicks dataframe read
-        mean_clicks_df = self._mean_clicks_to_enchant(GEAR_TYPE[gear_type])
-
-        # Flaggin for repairs using base cost or memory fragments
-        # memory fragments repair durability by:
-        # 10 on white weapons
-        # 5 on green weapons
-        # 2 on blue weapons
-        # 1 on yellow weapons (boss weapons)
-        memory_durability_multiplier_dict = {
-            "white-armor" : 10,
-            "green-armor" : 5,
-            "blue-armor" : 2,
-            "yellow-armor" : 1
+        gear_goal_level = ENHANCEMENT_LEVEL[gear_goal_level]
+        goal_index = self._enhancement_levels.index(gear_goal_level)
+
+        one_durability_cost = self._one_durability_cost(gear_type, base_cost)
+        costs, min_indices, cost_slices = self._enhance_cost_cascade(gear_type=gear_type, goal_index=goal_index,
+                                                                     base_cost=np.array([base_cost]),
+                                                                     one_durability_cost=np.array([one_durability_cost]),
+                                                                     keep_slices=True)
+        self._store_cascade(costs[0], min_indices[0], [_slice[0] for _slice in cost_slices])
+        return self._enhancement_min_index_dict[gear_goal_level], self._enhancement_cost_dict[gear_goal_level] 
+
+    def enhance_cost_strategies(self, gear_type : str, gear_goal_level : str, base_cost : int, strategies : list) -> tuple:
+        """Returns cost of self-enhancing a piece of gear to every level up to 'gear_goal_level' with each of 'strategies'.
+
+        The failstack costs of the strategies are stacked into a matrix, which is one row of
+        scenarios each in a single run of the cost cascade of self.enhance_cost().
+
+        Args:
+            gear_type: type of the gear
+            gear_goal_level: level of enhancement desired
+            base_cost: price of the gear at +0 enhancement level
+            strategies: names of the failstacking strategies, keys of STRATEGIES
+
+        Returns:
+            Tuple of np.ndarrays of shape (len(strategies), levels), one column for every level
+            from +1 up to 'gear_goal_level'
+            [0]: number of failstacks at which enhancement is least expensive
+            [1]: number of silvers needed to enhance, as returned by self.enhance_cost()
+        """
+        if (gear_goal_level not in "1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 PRI DUO TRI TET PEN".split()):
+            raise ValueError("Gear goal level should be 1-15 | PRI | DUO | TRI | TET | PEN for weapons and armor.")
+
+        goal_index = self._enhancement_levels.index(ENHANCEMENT_LEVEL[gear_goal_level])
+        failstack_cost = self._strategies_failstack_cost(strategies, self._cascade_terms(gear_type)["mean_clicks"].shape[1])
+        one_durability_cost = self._one_durability_cost(gear_type, base_cost)
+        costs, min_indices, _slices = self._enhance_cost_cascade(gear_type=gear_type, goal_index=goal_index,
+                                                                 base_cost=np.full(len(strategies), float(base_cost)),
+                                                                 one_durability_cost=np.full(len(strategies),
+                                                                                             one_durability_cost),
+                                                                 failstack_cost=failstack_cost)
+        return min_indices[:, 1:], costs[:, 1:]
+
+    def _enhance_cost_cascade(self, gear_type : str, goal_index : int, base_cost : np.ndarray,
+                              one_durability_cost : np.ndarray, keep_slices : bool = False,
+                              failstack_cost : np.ndarray = None) -> tuple:
+        """Calculates the cost of enhancing gear for many price scenarios at once.
+
+        Each iteration represents one enhancement level. Each iteration the cost of enhancement
+        is calculated for all failstacks and all scenarios, and the lowest cost is found for
+        every scenario along with failstack number at which the min cost occured.
+        Only the cost of repairs and downgrades depends on the scenario, everything else
+        comes from self._cascade_terms().
+
+        Args:
+            gear_type: type of the gear
+            goal_index: index of the goal enhancement level in self._enhancement_levels
+            base_cost: np.ndarray of shape (N,) with prices of the gear at +0 enhancement level
+            one_durability_cost: np.ndarray of shape (N,) with the cost of repairing one point of durability
+            keep_slices: whether to return costs of all failstacks of every level
+            failstack_cost: np.ndarray of shape (N, failstacks) with the cost of building each failstack,
+                e.g. with another strategy in every scenario [default: the strategy of the enhancer]
+
+        Returns:
+            Tuple
+            [0]: np.ndarray of shape (N, goal_index + 1) with minimal cost of each enhancement level
+            [1]: np.ndarray of shape (N, goal_index + 1) with failstack numbers of the minimal costs
+            [2]: list of np.ndarrays of shape (N, failstacks) with cost of every failstack for every
+                enhancement level after the base one. Empty if 'keep_slices' is False.
+        """
+        terms = self._cascade_terms(gear_type, goal_index)
+        base_cost = np.asarray(base_cost, dtype=float)
+        one_durability_cost = np.asarray(one_durability_cost, dtype=float)[:, np.newaxis]
+        scenarios = np.arange(base_cost.shape[0])
+
+        costs = np.zeros((base_cost.shape[0], goal_index + 1))
+        min_indices = np.zeros((base_cost.shape[0], goal_index + 1), dtype=int)
+        costs[:, 0] = base_cost
+        cost_slices = []
+        for _index in range(1, goal_index + 1):
+            # failstack and gems cost are shared by all scenarios (unless the failstack
+            # costs are given per scenario), repairs and re-enhancing to the current
+            # level after a downgrade are not
+            if failstack_cost is None:
+                fixed_cost = terms["fixed_cost"][_index - 1]
+            else:
+                fixed_cost = failstack_cost + terms["gem_price"][_index - 1] * terms["mean_clicks"][_index - 1]
+            total_cost = (fixed_cost + one_durability_cost * terms["repair_clicks"][_index - 1]
+                            + costs[:, _index - 1, np.newaxis] * terms["downgrade_clicks"][_index - 1])
+            min_indices[:, _index] = np.argmin(total_cost, axis=1)
+            costs[:, _index] = total_cost[scenarios, min_indices[:, _index]]
+            if keep_slices:
+                cost_slices.append(total_cost)
+        return costs, min_indices, cost_slices
+
+    def enhance_cost_exact(self, gear_type : str, gear_goal_level : str, base_cost : int) -> tuple:
+        """Returns cost of enhancing gear from the previous level to 'gear_goal_level' without approximations.
+
+        On TRI - PEN a failure drops the gear one level down, where it is enhanced back, possibly
+        dropping again. Instead of pricing a downgrade as the cost of the previous level, the
+        levels down to the first one without downgrades are solved together as an absorbing Markov
+        chain, see lib.enhance.markov. Failstacks gained on failures are kept and used on the lower
+        levels. Every level starts from the failstack chosen by self.enhance_cost().
+
+        Args:
+            gear_type: type of the gear
+            gear_goal_level: level of enhancement desired
+            base_cost: price of the gear at +0 enhancement level
+
+        Returns:
+            Tuple
+            [0]: number of failstacks at which enhancement is least expensive
+            [1]: number of silvers needed to enhance, comparable with self.enhance_cost()
+        """
+        self.enhance_cost(gear_type=gear_type, gear_goal_level=gear_goal_level, base_cost=base_cost)
+        terms = self._cascade_terms(gear_type)
+        goal_index = self._enhancement_levels.index(ENHANCEMENT_LEVEL[gear_goal_level])
+
+        # Levels the gear can drop to, each clicked towards the next one
+        lowest_index = goal_index - 1
+        while terms["downgrades"][lowest_index]:
+            lowest_index -= 1
+        indices = np.arange(lowest_index, goal_index)
+        next_levels = [self._enhancement_levels[_index + 1] for _index in indices]
+
+        costs = lib.enhance.markov.expected_costs(
+            chances=terms["chances"][indices],
+            start_failstacks=[self._enhancement_min_index_dict[_level] for _level in next_levels],
+            failstack_increase=[self._failstack_increase(_level) for _level in next_levels],
+            click_cost=terms["gem_price"][indices],
+            failure_cost=terms["durability_loss"][indices] * self._one_durability_cost(gear_type, base_cost),
+            failure_levels=np.arange(indices.shape[0]) - terms["downgrades"][indices],
+            failstack_cost=terms["failstack_cost"])
+        return self._enhancement_min_index_dict[next_levels[-1]], costs[-1, 0]
+
+    def _cascade_prices(self) -> tuple:
+        """Returns the gem prices in the cascade terms"""
+        return self._BLACK_STONE_PRICE, self._CONCENT_PRICE
+
+    def _calculate_cascade_terms(self, gear_type : str) -> dict:
+        """Returns the parts of the gear cost cascade which do not depend on the price of the gear
+
+        Each enhancement level costs (failstack building cost) + (gems cost) + (repair cost)
+        + (re-enhancing cost after downgrades, TRI - PEN only), where
+            gems cost = gem price * tries
+            repair cost = (tries - 1) * durability lost on failure * one durability cost
+            re-enhancing cost = (tries - 1) * previous level cost
+
+        Returns:
+            Dictionary of np.ndarrays of shape (levels, failstacks), one row for each enhancement level
+            after the base one:
+            "fixed_cost": failstack building cost and gems cost
+            "repair_clicks": (tries - 1) * durability lost on failure
+            "downgrade_clicks": (tries - 1) on levels with downgrades, zero otherwise
+            "mean_clicks": tries
+            "chances": enhancement chances
+            np.ndarray with the cost of building each failstack in "failstack_cost"
+            and np.ndarrays of shape (levels,) with "gem_price", "durability_loss" and "downgrades"
+        """
+        mean_clicks_table = self._mean_clicks_to_enchant(gear_type)
+        enhancement_table = _tables.read_table(ENHANCE_TABLES_PATH, GEAR_TYPE[gear_type])
+        failstack_cost = self._strategy.failstack_costs()
+        levels = self._table_levels(gear_type)
+        tries_needed_to_enhance = mean_clicks_table.stack(levels)
+
+        gem_price = np.array([self._BLACK_STONE_PRICE if isinstance(_level, int) else self._CONCENT_PRICE
+                              for _level in levels])
+        durability_loss = np.array([5 if isinstance(_level, int) else 10 for _level in levels])
+        downgrades = np.array([_level in "TRI TET PEN".split() for _level in levels])
+
+        return {
+            "fixed_cost" : failstack_cost + gem_price[:, np.newaxis] * tries_needed_to_enhance,
+            "repair_clicks" : (tries_needed_to_enhance - 1) * durability_loss[:, np.newaxis],
+            "downgrade_clicks" : (tries_needed_to_enhance - 1) * downgrades[:, np.newaxis],
+            "mean_clicks" : tries_needed_to_enhance,
+            "chances" : enhancement_table.stack(levels),
+            "failstack_cost" : failstack_cost,
+            "gem_price" : gem_price,
+            "durability_loss" : durability_loss,
+            "downgrades" : downgrades,
         }
-        memory_repair_multiplier = memory_durability_multiplier_dict[gear_type]
-
-        if base_cost > (10 / memory_repair_multiplier * MEMORY_FRAGMENT_PRICE):
-            one_durability_cost = MEMORY_FRAGMENT_PRICE
-        else :
-            one_durability_cost = base_cost / 10
-
-
-        # Data needed: failstack building cost and enhancement probabilities
-        # Failstack building is in failstack_cost
-        # Enhancement probabilities are in self._enhancement_probabilities_df
-        # The latter contains probabilities for all enhancement levels (columns)
-        # and failstacks (verses)
-
-        # Failstack read
-        failstack_cost = self._strategy._all_failstack_price()
-        # Enhancement probabilities read
-        for _index, __level in enumerate("1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 PRI DUO TRI TET PEN".split(" ")):
-            self._enhancement_probabilities_df[self._enhancement_levels[_index + 1]] = self._enhance_chance_all_failstacks(gear_type, __level)
-
-        # Calculations loop
-        # Each iteration represents one enhancement level
-        # Each iteration the cost of enhancement is calculated for all failstacks
-        # and the lowest cost is pushed into cost dictionary along with failstack number
-        # at which the min cost occured
-        for __enhancement_level in self._enhancement_levels[1:]:
-            self._enhance_cost_one_level(_enhancement_level_goal=__enhancement_level, _failstack_cost=failstack_cost,
-                 one_durability_cost=one_durability_cost, mean_number_tries=mean_clicks_df)
-            if (__enhancement_level == (gear_goal_level)):
-                break
 
-        return self._enhancement_min_index_dict[gear_goal_level], self._enhancement_cost_dict[gear_goal_level] 
+    def enhance_cost_sensitivities(self, gear_type : str, gear_goal_level : str, base_cost : int) -> tuple:
+        """Returns cost of self-enhancing a piece of gear along with its derivatives.
+
+        Derivatives are carried forward through the cost cascade of self.enhance_cost(), one
+        enhancement level at a time, with the failstack numbers chosen by the cascade kept fixed.
+        Each level costs (see self._calculate_cascade_terms())
+            (failstack building cost) + gem price * tries + (tries - 1) * durability lost * one durability cost
+            + (tries - 1) * previous level cost (TRI - PEN only)
+        Derivatives of the tries are those of the model simulated in the mean clicks tables,
+        see self._mean_clicks_gradient().
 
-    def _enhance_cost_one_level(self, _enhancement_level_goal : str, _failstack_cost : pd.DataFrame, one_durability_cost : float, mean_number_tries : pd.DataFrame):
-        """Helper function for self.enhance_cost()
-        It updates the attributes of self with enhancement cost calculated
-        inside this function along with failstack numbers resulting in
-        the minimal cost.
-
-        """
-        _level = _enhancement_level_goal
-        _failstack_cost = _failstack_cost
-        mean_clicks_slice = mean_number_tries[_level]
-
-        _failstack_probability_slice = self._enhancement_probabilities_df[_level]
-        tries_needed_to_enhance_slice = mean_clicks_slice
-        # previous level cost is read from enhancement cost dict with a key
-        # of previous enhancement level
-
-        if(_level in [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15]):
-            gems_cost_slice = BLACK_STONE_ARMOR_PRICE * tries_needed_to_enhance_slice
-            repair_cost_slice = (tries_needed_to_enhance_slice - 1) * 5 * one_durability_cost
-            total_cost_slice = _failstack_cost + gems_cost_slice + repair_cost_slice # + previous_level_cost
-
-        if(_level in "PRI DUO".split()):
-            gems_cost_slice = CONCENT_ARMOR_PRICE * tries_needed_to_enhance_slice
-            repair_cost_slice = (tries_needed_to_enhance_slice - 1) * 10 * one_durability_cost
-            total_cost_slice = _failstack_cost + gems_cost_slice + repair_cost_slice
-
-        if(_level in "TRI TET PEN".split()):
-            gems_cost_slice = CONCENT_ARMOR_PRICE * tries_needed_to_enhance_slice
-            repair_cost_slice = (tries_needed_to_enhance_slice - 1) * 10 * one_durability_cost
-            previous_level_cost = self._enhancement_cost_dict[self._enhancement_levels[self._enhancement_levels.index(_level) - 1]]
-            reenhance_to_current_level_cost_slice = (tries_needed_to_enhance_slice - 1) * previous_level_cost
-            total_cost_slice = _failstack_cost + gems_cost_slice + repair_cost_slice + reenhance_to_current_level_cost_slice
-
-
-        self._enhancement_cost_df[_level] = total_cost_slice
-        self._enhancement_cost_dict[_level] = np.min(total_cost_slice)
-        self._enhancement_min_index_dict[_level] = np.argmin(total_cost_slice)
-            
-    def _enhance_cost_all_failstacks(self, gear_type : str, gear_goal_level : str, base_cost : int, failstack : int = 0) -> pd.DataFrame:
+        Args:
+            gear_type: type of the gear
+            gear_goal_level: level of enhancement desired
+            base_cost: price of the gear at +0 enhancement level
+
+        Returns:
+            Tuple
+            [0]: number of failstacks at which enhancement is least expensive
+            [1]: number of silvers needed to enhance
+            [2]: dictionary with derivatives of [1] with respect to
+                "base_cost": 'base_cost'
+                the name of every price in lib.enhance._utils (e.g. "CONCENT_WEAPON_PRICE")
+                "enhancement_probabilities": lib.enhance._tables.Table with the derivative with respect
+                    to each cell of the enhancement table of 'gear_type'
+                "failstack_probabilities": np.ndarray with the derivative with respect to each
+                    enhancement chance used by the failstacking strategy
+
+        """
+        min_failstack, cost = self.enhance_cost(gear_type=gear_type, gear_goal_level=gear_goal_level, base_cost=base_cost)
+        terms = self._cascade_terms(gear_type)
+        failstack_gradients = self._strategy._failstack_cost_gradients(terms["chances"].shape[1] - 1)
+
+        one_durability_cost = self._one_durability_cost(gear_type, base_cost)
+        one_durability_gradients = lib.enhance.repair.one_durability_cost_gradients(
+            base_cost, self._MEMORY_DURABILITY_MULTIPLIER[gear_type])
+        repair_gradients = self._zero_gradients(terms, failstack_gradients)
+        repair_gradients["base_cost"] = float(one_durability_gradients["base_cost"])
+        repair_gradients["MEMORY_FRAGMENT_PRICE"] = float(one_durability_gradients["fragment_price"])
+
+        gradients = self._zero_gradients(terms, failstack_gradients)
+        gradients["base_cost"] = 1.0
+        for _index in range(1, self._enhancement_levels.index(ENHANCEMENT_LEVEL[gear_goal_level]) + 1):
+            _level = self._enhancement_levels[_index]
+            failstack = self._enhancement_min_index_dict[_level]
+            tries = terms["mean_clicks"][_index - 1, failstack]
+            durability_loss = terms["durability_loss"][_index - 1]
+            downgrades = terms["downgrades"][_index - 1]
+            previous_level_cost = self._enhancement_cost_dict[self._enhancement_levels[_index - 1]]
+
+            level_gradients = self._failstack_cost_gradients_at(terms, failstack_gradients, failstack)
+            gem_price_name = self._BLACK_STONE_PRICE_NAME if isinstance(_level, int) else self._CONCENT_PRICE_NAME
+            level_gradients[gem_price_name] += tries
+            self._add_gradients(level_gradients, repair_gradients, (tries - 1) * durability_loss)
+            if downgrades:
+                self._add_gradients(level_gradients, gradients, tries - 1)
+            tries_cost = (terms["gem_price"][_index - 1] + one_durability_cost * durability_loss
+                          + previous_level_cost * downgrades)
+            level_gradients["enhancement_probabilities"][:, _index - 1] += tries_cost * self._mean_clicks_gradient(
+                terms["chances"][_index - 1], failstack, self._failstack_increase(_level))
+            gradients = level_gradients
+        return min_failstack, cost, self._format_gradients(gear_type, gradients)
+
+    def _failstack_increase(self, level) -> int:
+        """Returns the number of failstacks gained after a failed attempt at enhancing to 'level'"""
+        return GEAR_FAILSTACK_INCREASE.get(level, 1)
+
+    def enhance_ladder(self, gear_type : str, gear_goal_level : str, base_cost : int) -> list:
+        """Returns the cost of self-enhancing a piece of gear to every level up to 'gear_goal_level'.
+
+        All levels come from a single cost cascade, the same one as in self.enhance_cost().
+        Like in self.enhance_cost(), the cost of a level is the cost of enhancing from the previous one.
+
+        Args:
+            gear_type: type of the gear
+            gear_goal_level: level of enhancement desired
+            base_cost: price of the gear at +0 enhancement level
+
+        Returns:
+            List of dictionaries, one for each enhancement level from +1 up to 'gear_goal_level', with:
+            "level": enhancement level
+            "cost": number of silvers needed to enhance from the previous level
+            "failstack": number of failstacks at which enhancement is least expensive
+            "clicks": mean number of tries
+            "failstack_cost": cost of building the failstack
+            "materials": number of black stones (+1 - +15) or concentrated black stones (PRI - PEN) used
+            "materials_cost": cost of the stones
+            "repair_cost": cost of repairing the durability lost on failures
+            "previous_level_cost": cost of enhancing to the previous level again after downgrades
+        """
+        self.enhance_cost(gear_type=gear_type, gear_goal_level=gear_goal_level, base_cost=base_cost)
+        goal_index = self._enhancement_levels.index(ENHANCEMENT_LEVEL[gear_goal_level])
+        terms = self._cascade_terms(gear_type)
+        failstacks = self._ladder_failstacks(goal_index)
+        levels = np.arange(goal_index)
+        clicks = terms["mean_clicks"][levels, failstacks]
+        previous_level_cost = np.array([self._enhancement_cost_dict[_level] for _level in self._enhancement_levels[:goal_index]])
+        return self._ladder(goal_index, {
+            "failstack" : failstacks,
+            "clicks" : clicks,
+            "failstack_cost" : terms["failstack_cost"][failstacks],
+            "materials" : clicks,
+            "materials_cost" : terms["gem_price"][levels] * clicks,
+            "repair_cost" : self._one_durability_cost(gear_type, base_cost) * terms["repair_clicks"][levels, failstacks],
+            "previous_level_cost" : previous_level_cost * terms["downgrade_clicks"][levels, failstacks],
+        })
+
+    def _enhance_cost_all_failstacks(self, gear_type : str, gear_goal_level : str, base_cost : int, failstack : int = 0) -> np.ndarray:
         """Returns cost of enhancing for all failstacks number and all enhancement levels 
 
         Args:
@@ -626,30 +1059,101 @@ class ArmorEnhancer(ItemEnhancer):
             failstack: number of failstack
 
         Returns:
-            pandas.DataFrame with enhancement costs. Rows contain failstack numbers and columns are enhancement levels.
-            Each cell contains cost of enhancing the equipment to the next enhancement level at a given failstack number.
+            np.ndarray with the cost of enhancing the equipment to 'gear_goal_level' at each failstack number.
         """
 
         self.enhance_cost(gear_type=gear_type, gear_goal_level=gear_goal_level, base_cost=base_cost)
-        return self._enhancement_cost_df[ENHANCEMENT_LEVEL[gear_goal_level]]
+        return self._enhancement_cost_table[ENHANCEMENT_LEVEL[gear_goal_level]]
 
-    def single_enhancement_cost(self, gear_type : str, gear_goal_level : str, base_cost : int, current_level_cost : int, failstack : int = 0, verbose=False) -> float:
-        """Returns cost of enhancing gear in a scenario of a single enhancement.
+    def _one_durability_cost(self, gear_type : str, base_cost : int) -> float:
+        """Returns the cost of repairing a single point of durability.
 
-        Assumes the gear has a price of 'current_level_cost' and is enhanced to the 'gear_goal_level' using
-        'failstack' number of failstacks.
+        Repairs use base cost or memory fragments, whichever is cheaper.
+        Memory fragments repair as much durability as in self._MEMORY_DURABILITY_MULTIPLIER.
 
-        Returns:
-            Estimated cost of enhancement.
         """
-        # TO-DO (konrad.pagacz@gmail.com) implement this function for weapons and armors
-        print("Currently implemented propoerly only for accessories")
-        if verbose:
-            enhancement_probability = self._enhance_chance_all_failstacks(gear_type=gear_type, gear_goal_level=gear_goal_level)
-        else:
-            enhancement_probability = self.enhance_chance(gear_type=gear_type, gear_goal_level=gear_goal_level, failstack=failstack)
+        return float(lib.enhance.repair.one_durability_cost(base_cost, self._MEMORY_DURABILITY_MULTIPLIER[gear_type]))
+
+    def _single_enhancement_costs(self, gear_type : str, gear_goal_level : str, base_cost : int,
+                                  current_level_cost : int) -> np.ndarray:
+        """Returns cost of a single enhancement at every failstack, without building the failstack
+
+        Uses the gems, repairs and downgrades terms of self._calculate_cascade_terms(). A downgrade
+        (TRI - PEN) costs the cheaper of enhancing back from the lower level, as priced by the
+        cost cascade, and buying the item of the current level.
+        """
+        if (gear_goal_level not in "1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 PRI DUO TRI TET PEN".split()):
+            raise ValueError("Gear goal level should be 1-15 | PRI | DUO | TRI | TET | PEN for weapons and armor.")
+
+        goal_index = self._enhancement_levels.index(ENHANCEMENT_LEVEL[gear_goal_level])
+        terms = self._cascade_terms(gear_type, goal_index)
+        one_durability_cost = self._one_durability_cost(gear_type, base_cost)
+
+        downgrade_cost = 0
+        if terms["downgrades"][goal_index - 1]:
+            costs, _min_indices, _slices = self._enhance_cost_cascade(gear_type=gear_type, goal_index=goal_index - 1,
+                                                                      base_cost=np.array([base_cost]),
+                                                                      one_durability_cost=np.array([one_durability_cost]))
+            downgrade_cost = min(costs[0, -1], current_level_cost)
+
+        return (terms["gem_price"][goal_index - 1] * terms["mean_clicks"][goal_index - 1]
+                + one_durability_cost * terms["repair_clicks"][goal_index - 1]
+                + downgrade_cost * terms["downgrade_clicks"][goal_index - 1])
+
+
+class WeaponEnhancer(GearEnhancer):
+    """Deal with enhancing chance and cost calculations of weapons
+
+    Memory fragments repair durability by:
+    10 on white weapons
+    5 on green weapons
+    2 on blue weapons
+    1 on yellow weapons (boss weapons)
+
+    """
+    _BLACK_STONE_PRICE = BLACK_STONE_WEAPON_PRICE
+    _CONCENT_PRICE = CONCENT_WEAPON_PRICE
+    _BLACK_STONE_PRICE_NAME = "BLACK_STONE_WEAPON_PRICE"
+    _CONCENT_PRICE_NAME = "CONCENT_WEAPON_PRICE"
+    _MEMORY_DURABILITY_MULTIPLIER = {
+        "white-weapon" : 10,
+        "green-weapon" : 5,
+        "blue-weapon" : 2,
+        "yellow-weapon" : 1
+    }
+
+
+class ArmorEnhancer(GearEnhancer):
+    """Deal with enhancing chance and cost calculations of armors
+
+    Memory fragments repair durability by:
+    10 on white armor
+    5 on green armor
+    2 on blue armor
+    1 on yellow armor (boss armor)
+
+    """
+    _BLACK_STONE_PRICE = BLACK_STONE_ARMOR_PRICE
+    _CONCENT_PRICE = CONCENT_ARMOR_PRICE
+    _BLACK_STONE_PRICE_NAME = "BLACK_STONE_ARMOR_PRICE"
+    _CONCENT_PRICE_NAME = "CONCENT_ARMOR_PRICE"
+    _MEMORY_DURABILITY_MULTIPLIER = {
+        "white-armor" : 10,
+        "green-armor" : 5,
+        "blue-armor" : 2,
+        "yellow-armor" : 1
+    }
+
+ENHANCERS = {
+    "blue-bound-acc" : AccEnhancer,
+    "gold-blue-acc" : AccEnhancer,
+    "white-blue-yellow-weapon-life-tool" : WeaponEnhancer,
+    "green-armor" : ArmorEnhancer,
+    "white-blue-yellow-armor" : ArmorEnhancer,
+    "silver-clothes" : AccEnhancer,
+    "green-weapon" : WeaponEnhancer,
+}
 
-        return (current_level_cost + base_cost) / enhancement_probability
 
 class Enhancer(object):
     """" Interface class interacting with ItemEnhancer class
@@ -657,26 +1161,25 @@ class Enhancer(object):
         eng = Enhancer(strategy="reblath", gear_type="gold-blue-acc", goal_level="PRI", base_cost=1000, failstack=0)
         print(eng.enhance_cost())
 
+    'strategy' can also be a list of strategies to compare with self.enhance_cost_comparison(),
+    all other methods use the first one.
+
     """
-    def __init__(self, strategy : str, gear_type : str, goal_level : str, base_cost : int = None, current_level_cost : int = None, failstack : int = 0) -> None:
+    def __init__(self, strategy, gear_type : str, goal_level : str, base_cost : int = None, current_level_cost : int = None, failstack : int = 0) -> None:
         self._gear_type = GEAR_TYPE[gear_type]
         self._gear_type_specific = gear_type
         self._goal_level = goal_level
         self._failstack = failstack
-        self._strategy = strategy
+        self._strategies = [strategy] if isinstance(strategy, str) else list(strategy)
+        if not self._strategies:
+            raise ValueError("At least one strategy is needed.")
+        self._strategy = self._strategies[0]
         self._base_cost = base_cost
         self._current_level_cost = current_level_cost
-        self._ENHANCERS = {
-            "blue-bound-acc" : AccEnhancer,
-            "gold-blue-acc" : AccEnhancer,
-            "white-blue-yellow-weapon-life-tool" : WeaponEnhancer,
-            "green-armor" : ArmorEnhancer,
-            "white-blue-yellow-armor" : ArmorEnhancer,
-            "silver-clothes" : AccEnhancer,
-            "green-weapon" : WeaponEnhancer,
-        }
+        self._ENHANCERS = ENHANCERS
         self._enhancer = self._ENHANCERS[self._gear_type](self._strategy)
 
+    @lib.stats.metrics.ENTRY_POINT_SECONDS.timed("enhance_chance")
     def enhance_chance(self) -> float: 
         """Returns probability of enhancing gear to 'goal_level'
         
@@ -688,6 +1191,7 @@ class Enhancer(object):
         """
         return self._enhancer.enhance_chance(self._gear_type, self._goal_level, self._failstack)
 
+    @lib.stats.metrics.ENTRY_POINT_SECONDS.timed("enhance_cost")
     def enhance_cost(self) -> float:
         """ Returns cost of enhancing gear from +0 to 'goal level'.
         Assumes using only self-enhanced gear, black stones bought at central market,
@@ -698,14 +1202,101 @@ class Enhancer(object):
         """
         return self._enhancer.enhance_cost(self._gear_type_specific, self._goal_level, self._base_cost, self._failstack)
 
-    def single_enhancement(self) -> float:
+    def enhance_cost_sourced(self, sacrifice_cost=None, purchase_cost=None) -> tuple:
+        """Returns cost of getting an accessory of 'goal level', buying levels where it is cheaper.
+
+        Args:
+            sacrifice_cost: price of the accessory sacrificed at each level PRI - PEN [default: 'base_cost']
+            purchase_cost: price of buying the accessory of each level PRI - PEN, inf or NaN where it
+                cannot be bought [default: never bought]
+
+        Returns:
+            Tuple
+            [0]: number of failstacks at which enhancement is least expensive, -1 if buying is cheaper
+            [1]: number of silvers needed
+        """
+        failstacks, costs, _bought = self._enhancer.enhance_cost_sourced(self._gear_type_specific, self._goal_level,
+                                                                          self._base_cost, sacrifice_cost, purchase_cost)
+        return int(failstacks[0]), costs[0]
+
+    def enhance_cost_exact(self) -> tuple:
+        """Returns the same as self.enhance_cost(), with downgrades modelled exactly.
+
+        See ItemEnhancer.enhance_cost_exact() of the child classes.
+
+        Returns:
+            Tuple
+            [0]: number of failstacks at which enhancement is least expensive
+            [1]: number of silvers needed to enhance
+        """
+        return self._enhancer.enhance_cost_exact(self._gear_type_specific, self._goal_level, self._base_cost)
+
+    def enhance_ladder(self) -> list:
+        """Returns cost of enhancing gear to every level from the first one up to 'goal level'.
+
+        Calculated in one pass, with the same assumptions as self.enhance_cost().
+
+        Returns:
+            List of dictionaries, one for each enhancement level, with the optimal failstack,
+            expected cost, expected number of clicks and the breakdown of the cost into
+            failstacks, materials, repairs and items of the previous level,
+            see ItemEnhancer.enhance_ladder() of the child classes.
+        """
+        return self._enhancer.enhance_ladder(self._gear_type_specific, self._goal_level, self._base_cost)
+
+    def enhance_cost_comparison(self) -> dict:
+        """Returns cost of enhancing gear to every level up to 'goal level' with each of the strategies.
+
+        All strategies are priced in a single run of the cost cascade, with the same assumptions
+        as self.enhance_cost().
+
+        Returns:
+            Dictionary with:
+            "strategies": names of the strategies, one for each row
+            "levels": enhancement levels, one for each column
+            "failstack": np.ndarray of shape (strategies, levels) with the failstacks at which
+                enhancement is least expensive
+            "cost": np.ndarray of shape (strategies, levels) with the number of silvers needed to
+                enhance, as returned by self.enhance_cost() for each level
+        """
+        failstacks, costs = self._enhancer.enhance_cost_strategies(self._gear_type_specific, self._goal_level,
+                                                                   self._base_cost, self._strategies)
+        levels = self._enhancer._enhancement_levels[1:costs.shape[1] + 1]
+        return {
+            "strategies" : self._strategies,
+            "levels" : [str(_level) for _level in levels],
+            "failstack" : failstacks,
+            "cost" : costs,
+        }
+
+    @lib.stats.metrics.ENTRY_POINT_SECONDS.timed("single_enhancement")
+    def single_enhancement(self) -> tuple:
         """Returns cost of enhancing gear from the level lower than the goal level.
 
-        Assumes failstacks given as 'failstack' argument. Takes repairs into account.
+        Assumes failstacks given as 'failstack' argument are already built. Takes failstack building,
+        repairs and downgrades into account.
 
         Returns:
-            Cost of enhancing gear.
+            Tuple
+            [0]: number of failstacks at which enhancement is least expensive
+            [1]: number of silvers needed to enhance
         """
         return self._enhancer.single_enhancement_cost(self._gear_type_specific, self._goal_level, self._base_cost,
             self._current_level_cost, self._failstack)
+
+    def enhance_cost_sensitivities(self) -> tuple:
+        """Returns cost of enhancing gear from +0 to 'goal level' along with its derivatives.
+
+        Shows which inputs drive the cost, e.g. a 1% move of the price of concentrated black stones
+        changes the cost by about 0.01 * CONCENT_WEAPON_PRICE * gradients["CONCENT_WEAPON_PRICE"].
+
+        Returns:
+            Tuple
+            [0]: number of failstacks at which enhancement is least expensive
+            [1]: number of silvers needed to enhance, the same as returned by self.enhance_cost()
+            [2]: dictionary with derivatives of [1] with respect to the base cost, every price,
+                every enhancement chance and every chance used by the failstacking strategy,
+                see ItemEnhancer.enhance_cost_sensitivities() of the child classes
+        """
+        return self._enhancer.enhance_cost_sensitivities(self._gear_type_specific, self._goal_level, self._base_cost)
         
@@ -1,7 +1,8 @@
 """
 Usage:
-    crone enhance [options] [--prob | --cost] [--strategy <strategy>] <gear-type> <goal-enhancement-level> [<base-cost>] [<current-level-cost>]
+    crone enhance [options] [--prob | --cost | --ladder] [--strategy <strategy>] <gear-type> <goal-enhancement-level> [<base-cost>] [<current-level-cost>]
     crone enhance [--strategy <strategy>] --stack-cost <fail-stack-number>
+    crone enhance [--strategy <strategy>] [--budget <silver>] [--processes <processes>] --simulate <sessions> <gear-type> <goal-enhancement-level> <base-cost>
 
 Displays the optimal # TO-DO (konrad.pagacz@gmail.com) finish this docstring
 
@@ -15,10 +16,24 @@ Specific options:
     -f <stacks>, --fail-stacks <stacks>
                         Designate the number of starting fail stacks [default: 0]
     -c, --cost          Display the cost of enhancing from +0 using only Reblath-built failstacks
+    -e, --exact         With --cost, display also the cost with downgrades modelled exactly
+                            as a Markov chain, where failstacks gained on failures are used
+                            to enhance the downgraded gear back
+    -l, --ladder        Display the cost of every enhancement level up to <goal-enhancement-level>
+                            along with the expected clicks and the breakdown of the cost
     -s, --strategy <strategy>
                         Specify the desired fail stacking strategy [default: reblath]
+                            With --cost, a comma separated list of strategies displays the cost
+                            of every enhancement level with each of them side by side
                             Possible values:
                                 reblath         Using only +14 Reblath armor piece to failstack
+    -m, --simulate <sessions>
+                        Simulate <sessions> sessions of enhancing from +0 click by click and display
+                            how often they get to <goal-enhancement-level> and how much they spend
+    -b, --budget <silver>
+                        Silver each simulated session may spend [default: inf]
+    -j, --processes <processes>
+                        Number of processes simulating the sessions [default: 1]
     -i, --stack-cost <fail-stack-number>
                         Displays the cost of making a single stack given the number of failstacks
                             instead of calculating item cost.
@@ -52,20 +67,44 @@ Positional arguments:
                             than the goal level
 
 """
-import pandas as pd
 from docopt import docopt
 
-import lib.enhance.enhance
-import lib.enhance.strategy
+
+def _print_column(column, name) -> None:
+    """Prints values for all failstacks, formatted by pandas if it is installed"""
+    try:
+        import pandas as pd
+    except ImportError:
+        for _failstack, _value in enumerate(column):
+            print("{:<6} {}".format(_failstack, _value))
+        print("Name: {}".format(name))
+        return
+    pd.set_option("display.max_rows", len(column) + 1)
+    print(pd.Series(column, name=name))
+
 
 def main(**kwargs):
+    # The engine is imported here and not at the top of the module, so that crone
+    # can parse the options using __doc__ without loading the tables
+    import numpy as np
+
+    from lib.enhance._utils import ENHANCEMENT_LEVEL
+    import lib.enhance.cube
+    import lib.enhance.enhance
+    import lib.enhance.session
+    import lib.enhance.strategy
+
     # Variables assignment
     verbose = kwargs["--verbose"]
     prob = kwargs["--prob"]
     cost = kwargs["--cost"]
     if kwargs["--fail-stacks"] is not None:
         fail_stacks = int(kwargs["--fail-stacks"])
-    strategy = kwargs["--strategy"]
+    strategies = kwargs["--strategy"].split(",")
+    for _strategy in strategies:
+        if _strategy not in lib.enhance.enhance.STRATEGIES:
+            exit("{} is not a failstacking strategy. See 'crone enhance --help'.".format(_strategy))
+    strategy = strategies[0]
     gear_type = kwargs["<gear-type>"]
     goal = kwargs["<goal-enhancement-level>"]
     if kwargs["<base-cost>"] is not None:
@@ -73,6 +112,20 @@ def main(**kwargs):
     if kwargs["<current-level-cost>"] is not None:
         current_level_cost = int(kwargs["<current-level-cost>"])
 
+    # Comparison of strategies pipeline
+    if len(strategies) > 1:
+        if not cost or verbose or kwargs["--exact"] or kwargs["<current-level-cost>"] is not None:
+            exit("Strategies can be compared only with --cost from +0. See 'crone enhance --help'.")
+        comparison = lib.enhance.enhance.Enhancer(strategy=strategies, gear_type=gear_type, goal_level=goal,
+                                                  base_cost=base_cost).enhance_cost_comparison()
+        print("{:<6}".format("") + "".join("{:>26}".format(_strategy) for _strategy in strategies))
+        print("{:<6}".format("Level") + "{:>6}{:>20}".format("FS", "Cost") * len(strategies))
+        for _column, _level in enumerate(comparison["levels"]):
+            print("{:<6}".format(_level) + "".join(
+                "{:>6}{:>20.0f}".format(_failstack, _cost)
+                for _failstack, _cost in zip(comparison["failstack"][:, _column], comparison["cost"][:, _column])))
+        exit()
+
     # Probability pipeline
     if prob:
         # Probability output
@@ -80,12 +133,25 @@ def main(**kwargs):
                                                 goal_level=goal, failstack=fail_stacks)
         if verbose:
             result = enhancer._enhancer._enhance_chance_all_failstacks(gear_type=gear_type, gear_goal_level=goal)
-            pd.set_option('display.max_rows', result.shape[0] + 1)
-            print(result)
+            _print_column(result, ENHANCEMENT_LEVEL[goal])
         else :
             print(enhancer.enhance_chance())
         exit()
 
+    # Enhancement ladder pipeline
+    if kwargs["--ladder"]:
+        enhancer = lib.enhance.enhance.Enhancer(strategy=strategy, gear_type=gear_type,
+                                                goal_level=goal, base_cost=base_cost, failstack=fail_stacks)
+        row_format = "{:<6}{:>4}{:>18}{:>9}{:>18}{:>12}{:>18}{:>18}{:>18}"
+        print(row_format.format("Level", "FS", "Cost", "Clicks", "Failstacks", "Materials", "Materials cost",
+                                "Repairs", "Previous level"))
+        for _step in enhancer.enhance_ladder():
+            print(row_format.format(_step["level"], _step["failstack"], "{:.0f}".format(_step["cost"]),
+                                    "{:.2f}".format(_step["clicks"]), "{:.0f}".format(_step["failstack_cost"]),
+                                    "{:.2f}".format(_step["materials"]), "{:.0f}".format(_step["materials_cost"]),
+                                    "{:.0f}".format(_step["repair_cost"]), "{:.0f}".format(_step["previous_level_cost"])))
+        exit()
+
     # Cost pipeline
     if cost:
         # Single enhancement case
@@ -96,10 +162,10 @@ def main(**kwargs):
             if verbose:
                 result = (enhancer._enhancer.single_enhancement_cost(gear_type=gear_type, gear_goal_level=goal,
                     base_cost=base_cost, current_level_cost=current_level_cost, verbose=verbose))
-                pd.set_option("display.max_rows", result.shape[0] + 1)
-                print(result)
+                _print_column(result, ENHANCEMENT_LEVEL[goal])
             else:
-                print(enhancer.single_enhancement())
+                out = enhancer.single_enhancement()
+                print("Total cost: {} \nEnhance on {} fs.".format(out[1], out[0]))
             exit()
         
         # Cost tables
@@ -107,17 +173,38 @@ def main(**kwargs):
                                                 goal_level=goal, base_cost=base_cost, failstack=fail_stacks)
         if verbose:
             result = enhancer._enhancer._enhance_cost_all_failstacks(gear_type=gear_type, gear_goal_level=goal, base_cost=base_cost)
-            pd.set_option("display.max_rows", result.shape[0] + 1)
-            print(result)
-        else:
+            _print_column(result, ENHANCEMENT_LEVEL[goal])
+        elif kwargs["--exact"]:
             out = enhancer.enhance_cost()
+            exact = enhancer.enhance_cost_exact()
             print("Total cost: {} \nEnhance on {} fs.".format(out[1], out[0]))
+            print("Exact cost: {} ({:+.2%})".format(exact[1], exact[1] / out[1] - 1))
+        else:
+            # Answered from the precomputed cube if there is one, see lib/utils/build-answer-cube.py
+            out = lib.enhance.cube.enhance_cost(strategy=strategy, gear_type=gear_type, goal_level=goal, base_cost=base_cost)
+            print("Total cost: {} \nEnhance on {} fs.".format(out[1], out[0]))
+        exit()
+
+    # Session simulation pipeline
+    if kwargs["--simulate"]:
+        results = lib.enhance.session.simulate_sessions(strategy=strategy, gear_type=gear_type, goal_level=goal,
+                                                        base_cost=base_cost, sessions=int(kwargs["--simulate"]),
+                                                        budget=float(kwargs["--budget"]),
+                                                        processes=int(kwargs["--processes"]))
+        print("Success rate: {:.2%}".format(results.success_rate))
+        print("Mean spend: {:.0f}".format(np.mean(results.spent)))
+        for _quantile, _spent in zip([0.1, 0.5, 0.9, 0.99], results.spend_quantiles([0.1, 0.5, 0.9, 0.99])):
+            print("{:>4.0%} of sessions spend at most {:.0f}".format(_quantile, _spent))
+        counts, edges = results.spend_histogram(bins=10)
+        for _count, _left, _right in zip(counts, edges[:-1], edges[1:]):
+            print("{:>18.0f} - {:<18.0f}{:>8.2%} {}".format(_left, _right, _count / counts.sum(),
+                                                            "#" * int(round(50 * _count / counts.max()))))
         exit()
 
     # Cost of buidling failstacks pipeline
     if kwargs["--stack-cost"]:
         # Output only failstack building cost
-        print(lib.enhance.strategy.Reblath14().fs_cost(int(kwargs["--stack-cost"])))
+        print(lib.enhance.enhance.STRATEGIES[strategy].fs_cost(int(kwargs["--stack-cost"])))
         exit()
 
 
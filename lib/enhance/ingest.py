@@ -0,0 +1,180 @@
+"""Ingesting the enhancement chance spreadsheets into the enhancement tables.
+
+Every data/*.xlsx spreadsheet with a failstack column is one enhancement table,
+named after the file. Spreadsheets are parsed in a pool of processes, each of
+them is:
+    1. normalized: column labels are turned into the keys of ENHANCEMENT_LEVEL
+       ("+7", 7, "7.0" -> "7"; "pri", "I" -> "PRI"), the failstack column into "FS"
+    2. validated: consecutive non-negative failstacks, levels in the order of
+       enhancement, chances between 0 and 1 which do not fall as failstacks grow
+    3. typed: failstacks as int64, chances as float64, so the engine never needs
+       to convert them
+Spreadsheets without a failstack column (e.g. the tables of life skill levels)
+are not enhancement tables and are skipped.
+
+The tables are saved in the .npz archive the engine reads and in the HDF5 file
+the tools in lib/utils read, both with metadata about the source spreadsheet.
+
+Usage::
+    results = lib.enhance.ingest.ingest(pathlib.Path("data").glob("*.xlsx"))
+    lib.enhance.ingest.save_tables(ENHANCE_TABLES_PATH, results)
+
+"""
+import collections
+import concurrent.futures
+import hashlib
+import os
+import pathlib
+import warnings
+
+import numpy as np
+
+from lib.enhance import _tables
+from lib.enhance._utils import ENHANCEMENT_LEVEL
+
+FAILSTACK_LABEL = "FS"
+FAILSTACK_ALIASES = {"FS", "FAILSTACK", "FAILSTACKS", "FAIL STACK", "FAIL STACKS", "STACKS"}
+# Roman numerals used for the levels past +15 in some sources
+ROMAN_LEVELS = {"I" : "PRI", "II" : "DUO", "III" : "TRI", "IV" : "TET", "V" : "PEN"}
+# Chances may fall by this much between failstacks, to allow for rounding in the spreadsheets
+MONOTONICITY_TOLERANCE = 1e-9
+
+# Outcome of ingesting a spreadsheet. 'table' is None if the spreadsheet is not an
+# enhancement table, 'problems' lists everything the validation found wrong with it.
+Ingested = collections.namedtuple("Ingested", ["key", "path", "table", "problems"])
+
+
+def normalize_label(label) -> str:
+    """Returns the ENHANCEMENT_LEVEL key or FAILSTACK_LABEL of the column 'label', None if it is neither"""
+    text = str(label).strip().upper().lstrip("+")
+    if text in FAILSTACK_ALIASES:
+        return FAILSTACK_LABEL
+    if text in ROMAN_LEVELS:
+        return ROMAN_LEVELS[text]
+    try:
+        number = float(text)
+    except ValueError:
+        return text if text in ENHANCEMENT_LEVEL else None
+    if number.is_integer() and str(int(number)) in ENHANCEMENT_LEVEL:
+        return str(int(number))
+    return None
+
+
+def validate(failstacks : np.ndarray, levels : list, chances : np.ndarray) -> list:
+    """Returns the problems of an enhancement table, empty if there are none
+
+    Args:
+        failstacks: np.ndarray of floats with the failstack of each row
+        levels: ENHANCEMENT_LEVEL keys of the columns
+        chances: np.ndarray of floats of shape (rows, levels)
+    """
+    problems = []
+    if chances.shape[0] == 0 or not levels:
+        return ["has no failstacks or no enhancement levels"]
+
+    if np.isnan(failstacks).any() or not np.all(np.mod(failstacks, 1) == 0) or failstacks.min() < 0:
+        problems.append("failstacks are not non-negative integers")
+    elif np.any(np.diff(failstacks) != 1):
+        problems.append("failstacks are not consecutive")
+
+    order = [list(ENHANCEMENT_LEVEL).index(_level) for _level in levels]
+    if len(set(levels)) != len(levels):
+        problems.append("enhancement levels {} appear more than once".format(
+            sorted({_level for _level in levels if levels.count(_level) > 1})))
+    elif np.any(np.diff(order) <= 0):
+        problems.append("enhancement levels are not in the order of enhancement")
+
+    for _column, _level in enumerate(levels):
+        column = chances[:, _column]
+        missing = np.isnan(column)
+        if missing.any():
+            problems.append("{}: no chance at {} of {} failstacks".format(_level, np.count_nonzero(missing),
+                                                                         column.shape[0]))
+        present = column[~missing]
+        if np.any((present < 0) | (present > 1)):
+            problems.append("{}: chances outside of [0, 1]".format(_level))
+        falling = np.flatnonzero(np.diff(present) < -MONOTONICITY_TOLERANCE)
+        if falling.shape[0]:
+            problems.append("{}: chance falls after failstacks {}".format(
+                _level, failstacks[~missing][falling].astype(int).tolist()))
+    return problems
+
+
+def read_spreadsheet(path) -> Ingested:
+    """Reads, normalizes and validates the spreadsheet 'path'"""
+    import pandas as pd
+
+    path = pathlib.Path(path)
+    sheet = pd.read_excel(path)
+    labels = [normalize_label(_label) for _label in sheet.columns]
+    if FAILSTACK_LABEL not in labels:
+        return Ingested(path.stem, str(path), None, ["not an enhancement table, there is no failstack column"])
+
+    problems = ["column {!r} is not an enhancement level".format(_original)
+                for _original, _label in zip(sheet.columns, labels) if _label is None]
+    if labels.count(FAILSTACK_LABEL) > 1:
+        problems.append("more than one failstack column")
+    failstack_column = labels.index(FAILSTACK_LABEL)
+    level_columns = [_column for _column, _label in enumerate(labels)
+                     if _label is not None and _label != FAILSTACK_LABEL]
+    levels = [labels[_column] for _column in level_columns]
+
+    numeric = sheet.apply(pd.to_numeric, errors="coerce")
+    non_numeric = numeric.isna() & sheet.notna()
+    if non_numeric.to_numpy().any():
+        problems.append("cells which are not numbers in columns {}".format(
+            [str(_label) for _label in sheet.columns[non_numeric.any().to_numpy()]]))
+    failstacks = numeric.iloc[:, failstack_column].to_numpy(dtype=float)
+    chances = numeric.iloc[:, level_columns].to_numpy(dtype=float)
+    problems += validate(failstacks, levels, chances)
+
+    with open(path, "rb") as spreadsheet_file:
+        digest = hashlib.sha256(spreadsheet_file.read()).hexdigest()
+    columns = {FAILSTACK_LABEL : np.nan_to_num(failstacks, nan=-1).astype(np.int64)}
+    for _column, _level in enumerate(levels):
+        # Labels of the levels are the values of ENHANCEMENT_LEVEL, as used by the engine
+        columns[ENHANCEMENT_LEVEL[_level]] = np.ascontiguousarray(chances[:, _column])
+    metadata = {
+        "source" : path.name,
+        "sha256" : digest,
+        "levels" : levels,
+        "problems" : problems,
+    }
+    table = _tables.Table(np.arange(failstacks.shape[0], dtype=np.int64), columns, metadata)
+    return Ingested(path.stem, str(path), table, problems)
+
+
+def ingest(paths, processes : int = None) -> list:
+    """Reads the spreadsheets 'paths' in a pool of 'processes' processes [default: number of CPUs]
+
+    Returns:
+        List of Ingested, in the order of the file names
+    """
+    paths = sorted(pathlib.Path(_path) for _path in paths)
+    if not paths:
+        return []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(processes or os.cpu_count(), len(paths))) as executor:
+        return list(executor.map(read_spreadsheet, paths))
+
+
+def save_tables(hdf_path, results : list) -> None:
+    """Saves the enhancement tables of 'results' as the tables file 'hdf_path' and its .npz archive
+
+    Both files are replaced as a whole. The HDF5 file needs PyTables.
+    """
+    import pandas as pd
+
+    tables = {_result.key : _result.table for _result in results if _result.table is not None}
+    temporary_path = pathlib.Path(hdf_path).with_name(pathlib.Path(hdf_path).name + ".tmp")
+    if temporary_path.exists():
+        # Left over by an interrupted run, to_hdf() would add to it
+        temporary_path.unlink()
+    with warnings.catch_warnings():
+        # PyTables warns about the dashes in the keys and pickles the mixed int and str column labels,
+        # both as in the tables built before
+        warnings.simplefilter("ignore")
+        for _key, _table in tables.items():
+            frame = pd.DataFrame({_label : _table[_label] for _label in _table.columns}, index=_table.index)
+            frame.to_hdf(temporary_path, key=_key)
+    _tables.save_tables(hdf_path, tables)
+    os.replace(temporary_path, hdf_path)
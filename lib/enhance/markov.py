@@ -0,0 +1,84 @@
+"""Exact expected cost of enhancing as an absorbing Markov chain.
+
+The cost cascade prices every enhancement level on its own, with the mean
+clicks tables. On levels with downgrades (TRI - PEN of weapons and armor) a
+failure is priced as buying the previous level again, while in fact the gear
+drops one level, keeping the failstack gained, and has to be enhanced back,
+possibly failing and dropping again. The levels are coupled.
+
+Here the gear is a Markov chain over (level, failstack) states. From every state
+the gear is clicked towards the next level, after building the failstack up to
+the starting failstack of that level if it is lower:
+    success: the next level with no failstack, absorbing after the goal level
+    failure: the same level, or the previous one on levels with downgrades,
+        with the failstack increased by the failstack increase of the level
+The failstack does not grow past the last row of the tables. The expected costs
+of all states solve one sparse linear system (I - T) c = r, where T holds the
+transition probabilities and r the expected cost of a single click. It is
+solved with scipy if it is installed and as a dense system otherwise.
+
+"""
+import numpy as np
+
+try:
+    import scipy.sparse
+    import scipy.sparse.linalg
+except ImportError:
+    scipy = None
+
+
+def expected_costs(chances : np.ndarray, start_failstacks, failstack_increase, click_cost, failure_cost,
+                   failure_levels, failstack_cost : np.ndarray) -> np.ndarray:
+    """Returns the expected cost of enhancing past the last level of the chain from every state.
+
+    Level i of the chain is clicked towards level i + 1, the last level towards the goal level.
+
+    Args:
+        chances: np.ndarray of shape (levels, failstacks) with the chance of enhancing from each state
+        start_failstacks: failstack built before clicking on each level, shape (levels,)
+        failstack_increase: failstacks gained on a failure on each level, shape (levels,)
+        click_cost: cost of every click on each level, e.g. the stones, shape (levels,)
+        failure_cost: additional cost of a failure on each level, e.g. repairs, shape (levels,)
+        failure_levels: level of the chain after a failure on each level, shape (levels,)
+        failstack_cost: np.ndarray of shape (failstacks,) with the cost of building each failstack
+
+    Returns:
+        np.ndarray of shape (levels, failstacks) with the expected cost from every state
+    """
+    chances = np.asarray(chances, dtype=float)
+    levels, failstacks = chances.shape
+    failstack_cost = np.asarray(failstack_cost, dtype=float)[:failstacks]
+    start_failstacks = np.broadcast_to(np.asarray(start_failstacks, dtype=int), (levels,))
+    failstack_increase = np.broadcast_to(np.asarray(failstack_increase, dtype=int), (levels,))
+    click_cost = np.broadcast_to(np.asarray(click_cost, dtype=float), (levels,))
+    failure_cost = np.broadcast_to(np.asarray(failure_cost, dtype=float), (levels,))
+    failure_levels = np.broadcast_to(np.asarray(failure_levels, dtype=int), (levels,))
+
+    # Failstack clicked at from every state, after building up to the starting failstack
+    failstack = np.arange(failstacks)
+    clicked = np.maximum(failstack, start_failstacks[:, np.newaxis])
+    level = np.repeat(np.arange(levels)[:, np.newaxis], failstacks, axis=1)
+    chance = chances[level, clicked]
+
+    rewards = (failstack_cost[clicked] - failstack_cost[failstack] + click_cost[:, np.newaxis]
+               + (1 - chance) * failure_cost[:, np.newaxis])
+
+    states = level * failstacks + failstack
+    failure_states = (failure_levels[:, np.newaxis] * failstacks
+                      + np.minimum(clicked + failstack_increase[:, np.newaxis], failstacks - 1))
+    rows = [states.ravel(), states[:-1].ravel()]
+    columns = [failure_states.ravel(), (states[:-1] // failstacks + 1).ravel() * failstacks]
+    probabilities = [(1 - chance).ravel(), chance[:-1].ravel()]
+
+    size = levels * failstacks
+    rows = np.concatenate(rows)
+    columns = np.concatenate(columns)
+    probabilities = np.concatenate(probabilities)
+    if scipy is not None:
+        transitions = scipy.sparse.csr_matrix((probabilities, (rows, columns)), shape=(size, size))
+        costs = scipy.sparse.linalg.spsolve(scipy.sparse.identity(size, format="csr") - transitions, rewards.ravel())
+    else:
+        system = np.identity(size)
+        np.subtract.at(system, (rows, columns), probabilities)
+        costs = np.linalg.solve(system, rewards.ravel())
+    return costs.reshape(levels, failstacks)
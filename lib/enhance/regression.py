@@ -0,0 +1,194 @@
+"""Comparing the optimized engines with the reference implementation.
+
+The reference is Enhancer, called once for every case. Every other engine
+(batch cascade, answer cube, enhancement ladder, sourced accessory cascade,
+vectorized chances) is run on the same cases and compared with it. The
+cases are every gear type in GEAR_TYPE, every level in ENHANCEMENT_LEVEL and
+a grid of base costs (costs) or failstacks (chances). Cases the reference
+cannot calculate (e.g. levels +1 - +15 of accessories) are left out, and
+every engine is compared only on the cases it covers.
+
+The answer cube is built for the comparison in a temporary directory (or read
+from a given one) and compared through AnswerCube.lookup(), so cases it cannot
+answer are not covered instead of being passed on to the reference.
+
+Gear types are compared in a pool of processes.
+
+Usage::
+    for _comparison in lib.enhance.regression.compare("reblath"):
+        print(_comparison)
+
+"""
+import collections
+import concurrent.futures
+import os
+import tempfile
+
+import numpy as np
+
+import lib.enhance.batch
+import lib.enhance.cube
+import lib.enhance.enhance
+from lib.enhance._utils import GEAR_TYPE
+from lib.enhance._utils import ENHANCEMENT_LEVEL
+
+BASE_COSTS = np.logspace(3, 10, 15)
+FAILSTACKS = np.arange(0, 121, 5)
+# Largest relative error accepted by passed(), the answer cube is the least accurate engine
+MAX_RELATIVE_ERROR = lib.enhance.cube.MAX_RELATIVE_ERROR
+
+Comparison = collections.namedtuple("Comparison", ["engine", "quantity", "cases", "max_relative_error",
+                                                   "argmin_mismatches"])
+
+
+def _batch_costs(strategy : str, cases : list, cube_path) -> tuple:
+    return lib.enhance.batch.BatchPlanner(strategy).enhance_cost_arrays(cases)
+
+
+def _cube_costs(strategy : str, cases : list, cube_path) -> tuple:
+    """Answers of the cube in 'cube_path', NaN where it cannot answer or is missing or out of date"""
+    failstacks = np.full(len(cases), -1)
+    costs = np.full(len(cases), np.nan)
+    cube = lib.enhance.cube.load_cube(cube_path)
+    if cube is None or not cube.is_current(strategy):
+        return failstacks, costs
+    for _row, (_gear_type, _goal_level, _base_cost) in enumerate(cases):
+        answer = cube.lookup(_gear_type, _goal_level, _base_cost)
+        if answer is not None:
+            failstacks[_row], costs[_row] = answer[0], answer[1]
+    return failstacks, costs
+
+
+def _ladder_costs(strategy : str, cases : list, cube_path) -> tuple:
+    steps = [lib.enhance.enhance.Enhancer(strategy=strategy, gear_type=_gear_type, goal_level=_goal_level,
+                                          base_cost=_base_cost).enhance_ladder()[-1]
+             for _gear_type, _goal_level, _base_cost in cases]
+    return np.array([_step["failstack"] for _step in steps]), np.array([_step["cost"] for _step in steps])
+
+
+def _sourced_costs(strategy : str, cases : list, cube_path) -> tuple:
+    """Accessory cascade with the default sourcing, NaN for weapons and armor"""
+    failstacks = np.full(len(cases), -1)
+    costs = np.full(len(cases), np.nan)
+    rows = [_row for _row, _case in enumerate(cases)
+            if issubclass(lib.enhance.enhance.ENHANCERS[GEAR_TYPE[_case[0]]], lib.enhance.enhance.AccEnhancer)]
+    if rows:
+        failstacks[rows], costs[rows], _bought = lib.enhance.batch.BatchPlanner(strategy).accessory_cost(
+            [cases[_row] for _row in rows])
+    return failstacks, costs
+
+
+def _all_failstacks_chances(strategy : str, cases : list, cube_path) -> tuple:
+    chances = []
+    for _gear_type, _goal_level, _failstack in cases:
+        item_enhancer = lib.enhance.enhance.Enhancer(strategy=strategy, gear_type=_gear_type,
+                                                     goal_level=_goal_level)._enhancer
+        chances.append(item_enhancer._enhance_chance_all_failstacks(_gear_type, _goal_level)[_failstack])
+    return None, np.array(chances)
+
+
+# Candidate engines, each returning failstacks (None for chances) and values (NaN where not covered)
+# for a list of cases
+COST_ENGINES = {
+    "batch" : _batch_costs,
+    "cube" : _cube_costs,
+    "ladder" : _ladder_costs,
+    "sourced" : _sourced_costs,
+}
+CHANCE_ENGINES = {
+    "all-failstacks" : _all_failstacks_chances,
+}
+
+
+def _reference(strategy : str, cases : list, quantity : str) -> tuple:
+    """Returns the cases the reference can calculate with its failstacks (None for chances) and values"""
+    supported = []
+    failstacks = []
+    values = []
+    for _gear_type, _goal_level, _argument in cases:
+        try:
+            if quantity == "cost":
+                failstack, value = lib.enhance.enhance.Enhancer(strategy=strategy, gear_type=_gear_type,
+                                                                goal_level=_goal_level,
+                                                                base_cost=_argument).enhance_cost()
+            else:
+                failstack, value = None, lib.enhance.enhance.Enhancer(strategy=strategy, gear_type=_gear_type,
+                                                                      goal_level=_goal_level,
+                                                                      failstack=_argument).enhance_chance()
+        except (KeyError, ValueError):
+            continue
+        supported.append((_gear_type, _goal_level, _argument))
+        failstacks.append(failstack)
+        values.append(value)
+    return supported, (None if quantity == "chance" else np.array(failstacks)), np.array(values, dtype=float)
+
+
+def _compare_gear_type(strategy : str, gear_type : str, base_costs : np.ndarray, failstacks : np.ndarray,
+                       cube_path) -> list:
+    """Returns Comparisons of all engines for the cases of 'gear_type'"""
+    comparisons = []
+    for _quantity, _engines, _arguments in [("cost", COST_ENGINES, base_costs), ("chance", CHANCE_ENGINES, failstacks)]:
+        cases = [(gear_type, _level, _argument.item()) for _level in ENHANCEMENT_LEVEL for _argument in _arguments]
+        cases, reference_failstacks, reference_values = _reference(strategy, cases, _quantity)
+        for _name, _engine in _engines.items():
+            if not cases:
+                comparisons.append(Comparison(_name, _quantity, 0, 0.0, 0))
+                continue
+            engine_failstacks, engine_values = _engine(strategy, cases, cube_path)
+            covered = ~np.isnan(engine_values)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                errors = np.abs(engine_values - reference_values) / np.abs(reference_values)
+            # Zero references are compared absolutely
+            errors = np.where(reference_values == 0, np.abs(engine_values), errors)[covered]
+            mismatches = 0
+            if reference_failstacks is not None:
+                mismatches = int(np.count_nonzero(engine_failstacks[covered] != reference_failstacks[covered]))
+            comparisons.append(Comparison(_name, _quantity, int(np.count_nonzero(covered)),
+                                          float(errors.max()) if errors.shape[0] else 0.0, mismatches))
+    return comparisons
+
+
+def compare(strategy : str = "reblath", base_costs=BASE_COSTS, failstacks=FAILSTACKS, processes : int = None,
+            cube_path=None) -> list:
+    """Compares every engine with the reference on the full matrix of cases.
+
+    Args:
+        strategy: failstacking strategy
+        base_costs: base costs of the cost cases
+        failstacks: failstacks of the chance cases
+        processes: number of processes [default: number of CPUs]
+        cube_path: directory with the answer cube to compare [default: a cube built for the comparison]
+
+    Returns:
+        List of Comparisons, one for each engine and quantity, with the number of cases covered,
+        the largest relative error and the number of cases where the failstack differs
+    """
+    if cube_path is None:
+        with tempfile.TemporaryDirectory() as cube_path:
+            lib.enhance.cube.build_cube(cube_path, strategy)
+            return compare(strategy, base_costs, failstacks, processes, cube_path)
+
+    base_costs = np.asarray(base_costs, dtype=float)
+    failstacks = np.asarray(failstacks, dtype=int)
+    gear_types = list(GEAR_TYPE)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as executor:
+        results = executor.map(_compare_gear_type, [strategy] * len(gear_types), gear_types,
+                               [base_costs] * len(gear_types), [failstacks] * len(gear_types),
+                               [str(cube_path)] * len(gear_types))
+        merged = collections.OrderedDict()
+        for _comparison in (_comparison for _comparisons in results for _comparison in _comparisons):
+            key = (_comparison.engine, _comparison.quantity)
+            if key in merged:
+                _comparison = Comparison(_comparison.engine, _comparison.quantity,
+                                         merged[key].cases + _comparison.cases,
+                                         max(merged[key].max_relative_error, _comparison.max_relative_error),
+                                         merged[key].argmin_mismatches + _comparison.argmin_mismatches)
+            merged[key] = _comparison
+    return list(merged.values())
+
+
+def passed(comparisons : list, max_relative_error : float = MAX_RELATIVE_ERROR) -> bool:
+    """Returns True if every engine covers some cases and matches the reference on them within
+    'max_relative_error' and on every failstack"""
+    return all(_comparison.cases > 0 and _comparison.max_relative_error <= max_relative_error
+               and _comparison.argmin_mismatches == 0 for _comparison in comparisons)
@@ -0,0 +1,93 @@
+"""Cost of repairing durability lost on failed enhancement attempts.
+
+Weapons and armor lose durability on every failed attempt. It is restored
+either with copies of the +0 item (10 durability each) or with memory
+fragments, which restore a gear type specific amount of durability. Used
+together with an Artisan's Memory, a memory fragment restores
+ARTISAN_MEMORY_MULTIPLIER times more durability, at the cost of the
+Artisan's Memory.
+
+All functions take NumPy arrays (or scalars) and broadcast them against each
+other, so one call prices repairs for any number of scenarios.
+
+"""
+import numpy as np
+
+from lib.enhance._utils import MEMORY_FRAGMENT_PRICE
+from lib.enhance._utils import ARTISAN_MEMORY_PRICE
+
+# Durability restored by sacrificing a copy of the item
+ITEM_COPY_DURABILITY = 10
+# How many times more durability a memory fragment restores with an Artisan's Memory
+ARTISAN_MEMORY_MULTIPLIER = 5
+
+
+def fragment_durability_cost(memory_multiplier, fragment_price=MEMORY_FRAGMENT_PRICE, artisan_memory=False,
+                             artisan_memory_price=ARTISAN_MEMORY_PRICE) -> np.ndarray:
+    """Returns the cost of restoring a single point of durability with memory fragments.
+
+    Args:
+        memory_multiplier: durability restored by a single memory fragment
+        fragment_price: price of a memory fragment
+        artisan_memory: whether each memory fragment is used together with an Artisan's Memory
+        artisan_memory_price: price of an Artisan's Memory
+
+    Returns:
+        np.ndarray with the cost of one point of durability.
+    """
+    artisan_memory = np.asarray(artisan_memory, dtype=bool)
+    restored = np.asarray(memory_multiplier, dtype=float) * np.where(artisan_memory, ARTISAN_MEMORY_MULTIPLIER, 1)
+    return (np.asarray(fragment_price, dtype=float) + np.where(artisan_memory, artisan_memory_price, 0)) / restored
+
+
+def copy_durability_cost(base_cost) -> np.ndarray:
+    """Returns the cost of restoring a single point of durability with copies of the +0 item."""
+    return np.asarray(base_cost, dtype=float) / ITEM_COPY_DURABILITY
+
+
+def one_durability_cost(base_cost, memory_multiplier, fragment_price=MEMORY_FRAGMENT_PRICE, artisan_memory=False,
+                        artisan_memory_price=ARTISAN_MEMORY_PRICE, fragment_share=None) -> np.ndarray:
+    """Returns the cost of restoring a single point of durability.
+
+    Args:
+        base_cost: price of the item at +0 enhancement level
+        memory_multiplier: durability restored by a single memory fragment
+        fragment_price: price of a memory fragment
+        artisan_memory: whether each memory fragment is used together with an Artisan's Memory
+        artisan_memory_price: price of an Artisan's Memory
+        fragment_share: share of the durability restored with memory fragments, the rest is
+            restored with copies of the item. None to use whichever is cheaper.
+
+    Returns:
+        np.ndarray with the cost of one point of durability, broadcast over all arguments.
+    """
+    with_fragments = fragment_durability_cost(memory_multiplier, fragment_price, artisan_memory, artisan_memory_price)
+    with_copies = copy_durability_cost(base_cost)
+    if fragment_share is None:
+        return np.where(with_copies > with_fragments, with_fragments, with_copies)
+
+    fragment_share = np.clip(np.asarray(fragment_share, dtype=float), 0, 1)
+    return fragment_share * with_fragments + (1 - fragment_share) * with_copies
+
+
+def one_durability_cost_gradients(base_cost, memory_multiplier, fragment_price=MEMORY_FRAGMENT_PRICE, artisan_memory=False,
+                                  artisan_memory_price=ARTISAN_MEMORY_PRICE, fragment_share=None) -> dict:
+    """Returns derivatives of one_durability_cost() with respect to the base cost and the fragment price.
+
+    Takes the same arguments as one_durability_cost(). When memory fragments and item copies
+    cost exactly the same, the derivatives of the one picked by one_durability_cost() are returned.
+
+    Returns:
+        Dictionary of np.ndarrays with the derivatives with respect to "base_cost" and "fragment_price".
+    """
+    with_fragments = fragment_durability_cost(memory_multiplier, fragment_price, artisan_memory, artisan_memory_price)
+    with_copies = copy_durability_cost(base_cost)
+    fragments_gradient = fragment_durability_cost(memory_multiplier, 1, artisan_memory, 0)
+    if fragment_share is None:
+        fragment_share = (with_copies > with_fragments).astype(float)
+    else:
+        fragment_share = np.clip(np.asarray(fragment_share, dtype=float), 0, 1)
+    return {
+        "base_cost" : (1 - fragment_share) / ITEM_COPY_DURABILITY,
+        "fragment_price" : fragment_share * fragments_gradient,
+    }
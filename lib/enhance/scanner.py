@@ -0,0 +1,170 @@
+"""Scanning central market listings for items cheaper to buy than to enhance.
+
+MarketScanner is an asyncio pipeline stage. It consumes Listing events,
+prices them in batches and puts a Signal downstream for every listing whose
+price is lower than the expected cost of getting the item by enhancing a +0 one.
+Listings of +0 items (level "0") are not priced, they set the base cost used
+for their gear type.
+
+Listings are gathered for up to 'window' seconds or 'max_batch' listings and each
+batch is priced with BatchPlanner.total_cost(), which runs one vectorized cost
+cascade per gear table. Pricing, including checking that the engine can price a
+listing, runs in a worker thread, so the event loop keeps serving other tasks
+meanwhile and only the worker touches the caches of the engine. Both queues of the stage are bounded: when pricing
+falls behind, putting listings into the scanner waits, which slows the source
+down instead of piling a burst of listings up in memory.
+
+Usage::
+    scanner = MarketScanner(strategy="reblath")
+    asyncio.ensure_future(scanner.run())
+    await scanner.put(Listing("gold-acc", "0", 1.2e7))
+    await scanner.put(Listing("gold-acc", "TRI", 3.5e8))
+    signal = await scanner.signals.get()
+
+"""
+import asyncio
+import collections
+import concurrent.futures
+
+import lib.enhance.batch
+
+Listing = collections.namedtuple("Listing", ["gear_type", "level", "price"])
+Signal = collections.namedtuple("Signal", ["gear_type", "level", "price", "enhance_cost", "saving"])
+
+WINDOW = 0.05
+MAX_BATCH = 4096
+QUEUE_SIZE = 16384
+
+
+class MarketScanner(object):
+    def __init__(self, strategy : str, window : float = WINDOW, max_batch : int = MAX_BATCH,
+                 queue_size : int = QUEUE_SIZE, min_saving : float = 0) -> None:
+        """Flags listings which are cheaper than enhancing with the failstacking 'strategy'
+
+        Attributes:
+            self.signals: bounded asyncio.Queue with the Signals for the downstream stages
+            self.skipped: number of listings skipped, because of an unknown gear type or level, because
+                there was no +0 listing of their gear type yet or because read_listings() could not parse them
+            self._listings: bounded asyncio.Queue with listings waiting to be priced
+            self._base_costs: latest price of the +0 item of each gear type
+            self._planner: BatchPlanner pricing the batches
+            self._window: number of seconds to gather a batch for
+            self._max_batch: the largest number of listings in a batch
+            self._min_saving: the lowest saving, relative to the enhancing cost, worth a signal
+
+        """
+        self.signals = asyncio.Queue(maxsize=queue_size)
+        self.skipped = 0
+        self._listings = asyncio.Queue(maxsize=queue_size)
+        self._base_costs = {}
+        self._planner = lib.enhance.batch.BatchPlanner(strategy)
+        self._window = window
+        self._max_batch = max_batch
+        self._min_saving = min_saving
+
+    async def put(self, listing : Listing) -> None:
+        """Passes a listing to the scanner, waiting while the scanner is full"""
+        await self._listings.put(listing)
+
+    async def consume(self, source) -> None:
+        """Passes all listings of the asynchronous iterable 'source' to the scanner"""
+        async for _listing in source:
+            await self.put(_listing)
+
+    async def run(self) -> None:
+        """Prices listings until cancelled"""
+        loop = asyncio.get_running_loop()
+        # A single worker keeps the batches in order and the cascade caches free of races
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            while True:
+                batch = await self._next_batch(loop)
+                scenarios, listings = self._scenarios(batch)
+                if not scenarios:
+                    continue
+                listings, costs, invalid = await loop.run_in_executor(executor, self._price, scenarios, listings)
+                self.skipped += invalid
+                for _listing, _cost in zip(listings, costs):
+                    saving = _cost - _listing.price
+                    if saving > self._min_saving * _cost:
+                        await self.signals.put(Signal(_listing.gear_type, _listing.level, _listing.price,
+                                                      _cost, saving))
+
+    async def _next_batch(self, loop) -> list:
+        """Waits for a listing and gathers the ones following it for up to self._window seconds"""
+        batch = [await self._listings.get()]
+        deadline = loop.time() + self._window
+        while len(batch) < self._max_batch:
+            if self._listings.empty():
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._listings.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            else:
+                batch.append(self._listings.get_nowait())
+        return batch
+
+    def _scenarios(self, batch : list) -> tuple:
+        """Turns listings into BatchPlanner scenarios, updating base costs with the +0 listings
+
+        Whether the engine can price the scenarios is checked by self._price(), in the worker.
+
+        Returns:
+            Tuple
+            [0]: list of (gear type, goal level, base cost) scenarios
+            [1]: list of listings of the scenarios
+        """
+        scenarios = []
+        listings = []
+        for _listing in batch:
+            if _listing.level == "0":
+                self._base_costs[_listing.gear_type] = _listing.price
+            elif _listing.gear_type in self._base_costs:
+                scenarios.append((_listing.gear_type, _listing.level, self._base_costs[_listing.gear_type]))
+                listings.append(_listing)
+            else:
+                self.skipped += 1
+        return scenarios, listings
+
+    def _price(self, scenarios : list, listings : list) -> tuple:
+        """Prices the scenarios the engine can price, run in the worker thread
+
+        Returns:
+            Tuple
+            [0]: list of the listings priced
+            [1]: np.ndarray with the cost of enhancing the item of each of them
+            [2]: number of listings the engine cannot price
+        """
+        valid = [_index for _index, _scenario in enumerate(scenarios) if self._planner.can_price(*_scenario[:2])]
+        costs = self._planner.total_cost([scenarios[_index] for _index in valid]) if valid else []
+        return [listings[_index] for _index in valid], costs, len(scenarios) - len(valid)
+
+
+async def read_listings(reader : asyncio.StreamReader, scanner : MarketScanner = None):
+    """Yields Listings from lines "<gear-type> <level> <price>" of 'reader', e.g. a local socket or pipe
+
+    Lines which are not listings are skipped and counted in scanner.skipped, if 'scanner' is given.
+    """
+    while True:
+        line = await reader.readline()
+        if not line:
+            return
+        listing = _parse(line)
+        if listing is not None:
+            yield listing
+        elif line.strip() and scanner is not None:
+            scanner.skipped += 1
+
+
+def _parse(line : bytes) -> Listing:
+    """Returns the listing on 'line', None if it is not one"""
+    fields = line.decode("utf-8").split()
+    if len(fields) != 3:
+        return None
+    try:
+        return Listing(fields[0], fields[1], float(fields[2]))
+    except ValueError:
+        # Malformed price
+        return None
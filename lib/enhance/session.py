@@ -0,0 +1,201 @@
+"""Simulating whole enhancing sessions click by click.
+
+The engines in lib.enhance.enhance give expected costs. A session simulation
+answers questions about their spread, e.g. how often a budget is enough to get
+to the goal level. Every session starts by buying the +0 item and follows the
+policy of the cost cascade of Enhancer.enhance_cost():
+    1. The failstack chosen for the next level is built with the strategy
+       (see Strategy._sample_failstack_building()).
+    2. With the failstack built, or a higher one left from failures, the gear is
+       clicked. Success raises the level and uses the failstack up.
+    3. A failure raises the failstack and, for weapons and armor, costs the repair
+       of the durability lost and drops the gear one level on TRI - PEN. Accessories
+       are destroyed on failure, a new +0 accessory is bought.
+A session ends on the goal level or once it has spent the budget. It is
+successful if it got to the goal level within the budget.
+
+All sessions are simulated at once: their states are kept in np.ndarrays and each
+step builds the failstacks where needed and clicks the gear of every running
+session. Sessions are split into chunks, which can run in a pool of processes.
+
+The failstacking runs are simulated click by click too, so building a failstack
+costs less on average than the strategy's estimate, which charges every failed
+run as if it got through the whole failstack.
+
+Usage::
+    results = lib.enhance.session.simulate_sessions("reblath", "blue-weapon", "TET", 2e7,
+                                                    sessions=1000000, budget=5e9, processes=4)
+    print(results.success_rate)
+
+"""
+import concurrent.futures
+
+import numpy as np
+
+import lib.enhance.enhance
+from lib.enhance._utils import ENHANCEMENT_LEVEL
+
+# Number of sessions simulated in a single task, bounds the memory used by a process
+CHUNK_SIZE = 250000
+
+
+class SessionSimulator(object):
+    def __init__(self, strategy : str, gear_type : str, goal_level : str, base_cost : float,
+                 budget : float = np.inf) -> None:
+        """Simulates sessions of enhancing 'gear_type' from +0 to 'goal_level'
+
+        Arrays below have one element (row) for every level the gear is clicked from,
+        from +0 up to the level before 'goal_level'.
+
+        Attributes:
+            self._strategy: failstacking strategy
+            self._base_cost: price of the item at +0 enhancement level
+            self._budget: silver a session may spend
+            self._goal_index: number of levels to enhance
+            self._chances: np.ndarray of shape (levels, failstacks) with enhancement chances
+            self._start_failstacks: failstack built before clicking on each level
+            self._failstack_increase: failstacks gained on a failure on each level
+            self._click_cost: cost of every click on each level
+            self._failure_cost: additional cost of a failure on each level
+            self._failure_levels: level after a failure on each level
+
+        """
+        enhancer = lib.enhance.enhance.Enhancer(strategy=strategy, gear_type=gear_type, goal_level=goal_level,
+                                                base_cost=base_cost)
+        item_enhancer = enhancer._enhancer
+        # Fills in the failstacks of the cost cascade, which make up the policy
+        enhancer.enhance_cost()
+
+        terms = item_enhancer._cascade_terms(gear_type)
+        levels = item_enhancer._enhancement_levels
+        self._goal_index = levels.index(ENHANCEMENT_LEVEL[goal_level])
+        next_levels = levels[1:self._goal_index + 1]
+        indices = np.arange(self._goal_index)
+
+        self._strategy = lib.enhance.enhance.STRATEGIES[strategy]
+        self._base_cost = float(base_cost)
+        self._budget = float(budget)
+        self._chances = terms["chances"][:self._goal_index]
+        self._start_failstacks = np.array([item_enhancer._enhancement_min_index_dict[_level] for _level in next_levels])
+        self._failstack_increase = np.array([item_enhancer._failstack_increase(_level) for _level in next_levels])
+        if isinstance(item_enhancer, lib.enhance.enhance.AccEnhancer):
+            # Every click uses up a +0 accessory, a failure also the enhanced one
+            self._click_cost = np.full(self._goal_index, self._base_cost)
+            self._failure_cost = np.full(self._goal_index, self._base_cost)
+            self._failure_levels = np.zeros(self._goal_index, dtype=int)
+        else:
+            self._click_cost = terms["gem_price"][:self._goal_index].astype(float)
+            self._failure_cost = (terms["durability_loss"][:self._goal_index]
+                                  * item_enhancer._one_durability_cost(gear_type, base_cost))
+            self._failure_levels = indices - terms["downgrades"][:self._goal_index]
+
+    def run(self, sessions : int, rng : np.random.Generator) -> tuple:
+        """Simulates 'sessions' sessions
+
+        Returns:
+            Tuple of np.ndarrays of shape (sessions,)
+            [0]: silver spent by each session
+            [1]: whether each session got to the goal level within the budget
+        """
+        spent = np.empty(sessions)
+        finished_level = np.empty(sessions, dtype=int)
+
+        # State of the running sessions
+        running = np.arange(sessions)
+        level = np.zeros(sessions, dtype=int)
+        failstack = np.zeros(sessions, dtype=int)
+        running_spent = np.full(sessions, self._base_cost)
+        last_row = self._chances.shape[1] - 1
+
+        while running.shape[0]:
+            target = self._start_failstacks[level]
+            builders = np.flatnonzero(failstack < target)
+            if builders.shape[0]:
+                running_spent[builders] += self._strategy._sample_failstack_building(failstack[builders],
+                                                                                      target[builders], rng)
+                failstack[builders] = target[builders]
+
+            success = rng.random(running.shape[0]) < self._chances[level, np.minimum(failstack, last_row)]
+            running_spent += self._click_cost[level] + ~success * self._failure_cost[level]
+            failstack = np.where(success, 0, failstack + self._failstack_increase[level])
+            level = np.where(success, level + 1, self._failure_levels[level])
+
+            finished = (level == self._goal_index) | (running_spent >= self._budget)
+            if finished.any():
+                spent[running[finished]] = running_spent[finished]
+                finished_level[running[finished]] = level[finished]
+                keep = ~finished
+                running, level, failstack, running_spent = (running[keep], level[keep], failstack[keep],
+                                                            running_spent[keep])
+
+        return spent, (finished_level == self._goal_index) & (spent <= self._budget)
+
+
+class SessionResults(object):
+    def __init__(self, spent : np.ndarray, reached : np.ndarray) -> None:
+        """Outcome of simulated sessions
+
+        Attributes:
+            self.spent: np.ndarray with the silver spent by each session
+            self.reached: np.ndarray with True for sessions which got to the goal level within the budget
+
+        """
+        self.spent = spent
+        self.reached = reached
+
+    @property
+    def success_rate(self) -> float:
+        return float(np.mean(self.reached))
+
+    def spend_histogram(self, bins : int = 20) -> tuple:
+        """Returns np.histogram() of the silver spent, see its documentation for 'bins'"""
+        return np.histogram(self.spent, bins=bins)
+
+    def spend_quantiles(self, quantiles) -> np.ndarray:
+        """Returns the silver spent at 'quantiles' (numbers between 0 and 1)"""
+        return np.quantile(self.spent, quantiles)
+
+
+def _simulate_chunk(strategy : str, gear_type : str, goal_level : str, base_cost : float, budget : float,
+                    sessions : int, seed : np.random.SeedSequence) -> tuple:
+    simulator = SessionSimulator(strategy=strategy, gear_type=gear_type, goal_level=goal_level,
+                                 base_cost=base_cost, budget=budget)
+    return simulator.run(sessions, np.random.default_rng(seed))
+
+
+def simulate_sessions(strategy : str, gear_type : str, goal_level : str, base_cost : float, sessions : int,
+                      budget : float = np.inf, processes : int = 1, seed : int = None) -> SessionResults:
+    """Simulates 'sessions' sessions of enhancing 'gear_type' from +0 to 'goal_level'.
+
+    Sessions are simulated in chunks of CHUNK_SIZE, each with its own stream of random numbers,
+    so the results for a given 'seed' do not depend on the number of processes.
+
+    Args:
+        strategy: failstacking strategy
+        gear_type: type of the gear
+        goal_level: level of enhancement desired
+        base_cost: price of the item at +0 enhancement level
+        sessions: number of sessions
+        budget: silver a session may spend [default: no limit]
+        processes: number of processes simulating the chunks [default: 1, the calling process]
+        seed: seed of the random numbers [default: fresh entropy]
+
+    Returns:
+        SessionResults
+    """
+    if sessions <= 0:
+        raise ValueError("Number of sessions must be positive.")
+
+    chunks = [min(CHUNK_SIZE, sessions - _start) for _start in range(0, sessions, CHUNK_SIZE)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    arguments = [(strategy, gear_type, goal_level, base_cost, budget, _chunk, _seed)
+                 for _chunk, _seed in zip(chunks, seeds)]
+
+    if processes > 1 and len(chunks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_simulate_chunk, *zip(*arguments)))
+    else:
+        results = [_simulate_chunk(*_arguments) for _arguments in arguments]
+
+    return SessionResults(np.concatenate([_result[0] for _result in results]),
+                          np.concatenate([_result[1] for _result in results]))
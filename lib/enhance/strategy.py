@@ -1,37 +1,123 @@
+import pathlib
+
 import numpy as np 
-import pandas as pd
 
 
+import lib.stats.metrics
+from lib.enhance import _cache
+from lib.enhance import _tables
 from lib.enhance._utils import GEAR_TYPE
 from lib.enhance._utils import ENHANCEMENT_LEVEL
 from lib.enhance._utils import ENHANCE_TABLES_PATH
 from lib.enhance._utils import BLACK_STONE_ARMOR_PRICE
-from lib.enhance._utils import REBLATH_FAILSTACK_COSTS_TABLE_KEY
+from lib.enhance._utils import STRATEGY_COSTS_PATH
 
 CLEANSING_COST = 1e5
+# Cost assigned to failstacks which are practically impossible to build
+MAX_FAILSTACK_COST = 1e300
+# Version of the failstack cost calculations, part of the fingerprint of the cached
+# costs. Increase it after changing how the costs are calculated.
+FAILSTACK_COSTS_VERSION = 1
+# The largest number of failed failstacking runs sampled at once in simulations
+MAX_SAMPLED_RUNS = 1 << 22
 
 class Strategy(object):
     """An abstract base class for a strategy class.
-    
+
+    Child classes calculate the failstack costs, the public methods serve them from
+    read-only vectors cached once per process and per snapshot of the prices the
+    costs depend on, so a query is a single array lookup.
+
     """
+    # Failstack cost vectors keyed by (strategy class, price snapshot, variant)
+    _COST_VECTORS = {}
+
     def __init__(self):
         pass
-    
-    def fs_cost(self, failstack_goal: int) -> float:
+
+    def failstack_costs(self) -> np.ndarray:
+        """Returns read-only np.ndarray with the cost of building each failstack from zero
+
+        The costs are cumulative: element n is the cost of getting all n stacks.
+        """
+        return self._cost_vector("cumulative", self._load_failstack_costs)
+
+    def marginal_failstack_costs(self) -> np.ndarray:
+        """Returns read-only np.ndarray with the cost of each failstack on top of the previous one
+
+        Element n is failstack_costs()[n] - failstack_costs()[n - 1], element 0 is zero.
+        """
+        return self._cost_vector("marginal", lambda: np.diff(self.failstack_costs(), prepend=0.0))
+
+    @lib.stats.metrics.ENTRY_POINT_SECONDS.timed("fs_cost")
+    def fs_cost(self, failstack_goal):
+        """Returns cost of building 'failstack_goal' stacks from zero
+
+        Args:
+            failstack_goal: number of failstacks or np.ndarray of them
+
+        Raises:
+            ValueError: When the number of failstacks is lower than 0
+        """
+        lowest, highest = ((failstack_goal, failstack_goal) if np.ndim(failstack_goal) == 0
+                           else (np.min(failstack_goal), np.max(failstack_goal)))
+        if lowest < 0:
+            raise ValueError("fs_cost accepts only non-negative integers. Passed {}.".format(failstack_goal))
+        costs = self.failstack_costs()
+        if highest >= costs.shape[0]:
+            # Stacks past the enhancement table, calculated on demand
+            costs = self._failstack_costs(int(highest))
+        return costs[failstack_goal]
+
+    def _cost_vector(self, variant : str, calculate) -> np.ndarray:
+        key = (type(self), self._price_snapshot(), variant)
+        if key not in Strategy._COST_VECTORS:
+            lib.stats.metrics.CACHE_REQUESTS.increment("strategy_costs", "miss")
+            vector = np.ascontiguousarray(calculate(), dtype=float)
+            vector.setflags(write=False)
+            Strategy._COST_VECTORS[key] = vector
+        else:
+            lib.stats.metrics.CACHE_REQUESTS.increment("strategy_costs", "hit")
+        return Strategy._COST_VECTORS[key]
+
+    def _price_snapshot(self) -> tuple:
         raise NotImplementedError(
-        "{} needs to be overloaded"
-        "in the child classes.".format("fs_cost()")
-    )
+            "{} needs to be overloaded"
+            "in the child classes.".format("_price_snapshot()"))
+
+    def _load_failstack_costs(self) -> np.ndarray:
+        raise NotImplementedError(
+            "{} needs to be overloaded"
+            "in the child classes.".format("_load_failstack_costs()"))
+
+    def _failstack_costs_fingerprint(self) -> str:
+        raise NotImplementedError(
+            "{} needs to be overloaded"
+            "in the child classes.".format("_failstack_costs_fingerprint()"))
+
+    def _failstack_costs(self, max_failstack: int) -> np.ndarray:
+        raise NotImplementedError(
+            "{} needs to be overloaded"
+            "in the child classes.".format("_failstack_costs()"))
 
     def _cost_of_failstack(self, failstack_goal: int) -> float:
         raise NotImplementedError(
             "{} needs to be overloaded"
             "in the child classes.".format("_cost_of_failstack()"))
 
-    def _all_failstack_price(self) -> pd.DataFrame:
+    def _failstack_cost_gradients(self, max_failstack: int) -> dict:
+        raise NotImplementedError(
+            "{} needs to be overloaded"
+            "in the child classes.".format("_failstack_cost_gradients()"))
+
+    def _all_failstack_price(self) -> np.ndarray:
+        """Returns cost of failstack building for all failstack value, the same as self.failstack_costs()"""
+        return self.failstack_costs()
+
+    def _sample_failstack_building(self, failstacks : np.ndarray, targets : np.ndarray, rng : np.random.Generator) -> np.ndarray:
         raise NotImplementedError(
             "{} needs to be overloaded"
-            "in the child classes.".format("_all_failstack_price()"))
+            "in the child classes.".format("_sample_failstack_building()"))
 
 
 
@@ -46,22 +132,10 @@ class Reblath14(Strategy):
     def __init__(self):
         """
         Attributes:
-            enhance_table: pd.DataFrame containing ehancement chances for green color armor
+            reblath_enhancement: lib.enhance._tables.Table containing ehancement chances for green color armor
                 depending on number of failstacks
         """
-        self.reblath_enhancement = pd.read_hdf(ENHANCE_TABLES_PATH, GEAR_TYPE["green-armor"])
-        self.reblath_fs_costs = None
-        with pd.HDFStore(ENHANCE_TABLES_PATH, "r") as hdf:
-            if "/" + REBLATH_FAILSTACK_COSTS_TABLE_KEY in hdf.keys():
-                self.reblath_fs_costs = hdf.get(REBLATH_FAILSTACK_COSTS_TABLE_KEY)
-    
-    def fs_cost(self, failstack_goal : int) -> float:
-        if self.reblath_fs_costs is not None:
-            return self.reblath_fs_costs.loc[failstack_goal, "Cost"]
-        else:
-            self.reblath_fs_costs = self._recalculate_failstack_costs()
-            return self.reblath_fs_costs.loc[failstack_goal, "Cost"]
-
+        self.reblath_enhancement = _tables.read_table(ENHANCE_TABLES_PATH, GEAR_TYPE["green-armor"])
 
     def _cost_of_failstack(self, failstack_goal: int) -> float:
         """Calculates cost of failstack building.
@@ -82,13 +156,73 @@ class Reblath14(Strategy):
         # Raise ValueError, when the argument is not appropriate
         if (failstack_goal < 0):
             raise ValueError("_cost_of_failstack accepts only non-negative integers. Passed {}.".format(failstack_goal))
-            
-        # Calculate the cost of stack
-        # First component is cost of black stones, second is cost of cleansing
-        cost = (failstack_goal * BLACK_STONE_ARMOR_PRICE / self._failstack_proba(failstack_goal) + 
-                    CLEANSING_COST * (1 / self._failstack_proba(failstack_goal) - 1))
-        return cost
 
+        return self._failstack_costs(failstack_goal)[failstack_goal]
+
+    def _failstack_costs(self, max_failstack: int) -> np.ndarray:
+        """Calculates cost of failstack building for all failstacks up to 'max_failstack'.
+
+        The cost of a failstack of n stacks is
+            n * BLACK_STONE_ARMOR_PRICE / P(n) + CLEANSING_COST * (1 / P(n) - 1),
+        where P(n) is the probability of failing n times in a row. 1 / P(n) is taken
+        as exp(-log P(n)), so the value is accurate for as long as it is representable.
+        Costs which are not (the stack is practically unreachable) saturate at
+        MAX_FAILSTACK_COST, so that they never turn into inf or nan further down the line.
+
+        Args:
+            max_failstack: the highest failstack to calculate the cost of
+
+        Returns:
+            np.ndarray of length max_failstack + 1 with the cost of each failstack.
+        """
+        log_proba = self._log_failstack_probas(max_failstack)
+        stacks = np.arange(max_failstack + 1)
+        with np.errstate(over="ignore"):
+            cost = (stacks * BLACK_STONE_ARMOR_PRICE * np.exp(-log_proba) +
+                        CLEANSING_COST * np.expm1(-log_proba))
+        return np.minimum(cost, MAX_FAILSTACK_COST)
+
+    def _failstack_cost_gradients(self, max_failstack: int) -> dict:
+        """Calculates derivatives of the cost of failstack building for all failstacks up to 'max_failstack'.
+
+        With C(n) = (n * B + K) / P(n) - K, where B is BLACK_STONE_ARMOR_PRICE, K is CLEANSING_COST
+        and P(n) is the product of (1 - p_j) over the first n failstacks:
+            dC(n) / dB = n / P(n)
+            dC(n) / dK = 1 / P(n) - 1
+            dC(n) / dp_j = (n * B + K) / P(n) / (1 - p_j) for every j < n
+        Saturated costs (see self._failstack_costs()) have zero derivatives.
+
+        Args:
+            max_failstack: the highest failstack to calculate the derivatives of
+
+        Returns:
+            Dictionary of np.ndarrays with one row for each failstack:
+            "BLACK_STONE_ARMOR_PRICE": derivative with respect to the black stone price
+            "CLEANSING_COST": derivative with respect to the cleansing cost
+            "failstack_probabilities": derivatives with respect to the chances of enhancing the Reblath
+                to +15, one column for each row of the enhancement table
+        """
+        chances = np.asarray(self.reblath_enhancement[ENHANCEMENT_LEVEL["15"]], dtype=float)
+        stacks = np.arange(max_failstack + 1)
+        with np.errstate(over="ignore"):
+            inverse_proba = np.exp(-self._log_failstack_probas(max_failstack))
+        saturated = self._failstack_costs(max_failstack) >= MAX_FAILSTACK_COST
+
+        # How many of the first n failstacks use each row of the enhancement table,
+        # failstacks past the table use its last row
+        rows = np.arange(chances.shape[0])
+        uses = np.clip(stacks[:, np.newaxis] - rows, 0, 1).astype(float)
+        uses[:, -1] = np.maximum(stacks - (chances.shape[0] - 1), 0)
+
+        gradients = {
+            "BLACK_STONE_ARMOR_PRICE" : stacks * inverse_proba,
+            "CLEANSING_COST" : inverse_proba - 1,
+            "failstack_probabilities" : (((stacks * BLACK_STONE_ARMOR_PRICE + CLEANSING_COST) * inverse_proba)[:, np.newaxis]
+                                         * uses / (1 - chances)),
+        }
+        for _gradient in gradients.values():
+            _gradient[saturated] = 0
+        return gradients
 
     def _failstack_proba(self, failstack_goal: int) -> float:
         """Calculates the probability of getting given failstack.
@@ -106,31 +240,119 @@ class Reblath14(Strategy):
         Returns:
             Probability of getting that failstack. Value between 0 and 1.
         """
-        probability = np.product(1 - self.reblath_enhancement.loc[:failstack_goal - 1, ENHANCEMENT_LEVEL["15"]])
-        return probability
-        
-    def _recalculate_failstack_costs(self) -> pd.DataFrame:
+        return np.exp(self._log_failstack_probas(failstack_goal)[failstack_goal])
+
+    def _log_failstack_probas(self, max_failstack: int) -> np.ndarray:
+        """Calculates the natural logarithm of the probability of getting each failstack.
+
+        The probability of getting n stacks is the product of (1 - p) over the first n
+        failstacks, where p is the chance of enhancing the Reblath to +15. It is summed
+        as log1p(-p) instead, which does not underflow however long the chain is.
+        Failstacks beyond the enhancement table use the chance of its last row.
+
+        Args:
+            max_failstack: the highest failstack to calculate the probability of
+
+        Returns:
+            np.ndarray of length max_failstack + 1. Element n is log P(n), so element 0 is 0.
+        """
+        chances = np.asarray(self.reblath_enhancement[ENHANCEMENT_LEVEL["15"]], dtype=float)
+        failstacks = np.minimum(np.arange(max_failstack), chances.shape[0] - 1)
+        with np.errstate(divide="ignore"):
+            log_fail_chances = np.log1p(-chances[failstacks])
+        return np.concatenate(([0.0], np.cumsum(log_fail_chances)))
+
+    def _sample_failstack_building(self, failstacks : np.ndarray, targets : np.ndarray, rng : np.random.Generator) -> np.ndarray:
+        """Simulates building failstacks up to 'targets' for many failstacks at once.
+
+        Reblath is clicked in runs, each going on until the Reblath enhances to +15, which
+        costs cleansing it and leaves no failstack, or the target failstack is reached.
+        A run from n stacks gets past m stacks with the probability P(m) / P(n), see
+        self._log_failstack_probas(), so where a run ends is sampled in a single draw.
+        After the first run, from the current failstack, runs start from zero and
+        the number of failed ones is geometric. Failed runs are sampled in blocks of at
+        most MAX_SAMPLED_RUNS.
+
+        Args:
+            failstacks: np.ndarray with the current failstacks
+            targets: np.ndarray with the failstacks to build, higher than 'failstacks'
+            rng: source of random numbers
+
+        Returns:
+            np.ndarray with the cost of building each failstack
+        """
+        log_probas = self._log_failstack_probas(int(targets.max()))
+        # A run gets past m stacks as long as log P(m) >= threshold
+        threshold = log_probas[failstacks] + np.log(rng.random(failstacks.shape[0]))
+        reached = log_probas[targets] >= threshold
+        enhanced_at = np.searchsorted(-log_probas, -threshold, side="right")
+        costs = (np.where(reached, targets, enhanced_at) - failstacks) * BLACK_STONE_ARMOR_PRICE
+        costs[~reached] += CLEANSING_COST
+
+        rebuilding = np.flatnonzero(~reached)
+        rebuilt_targets = targets[rebuilding]
+        target_probas = np.exp(log_probas[rebuilt_targets])
+        failed_runs = rng.geometric(target_probas) - 1
+        # The last run reaches the target
+        costs[rebuilding] += rebuilt_targets * BLACK_STONE_ARMOR_PRICE
+
+        ends = np.cumsum(failed_runs)
+        start = 0
+        while start < rebuilding.shape[0]:
+            drawn = ends[start - 1] if start else 0
+            stop = max(int(np.searchsorted(ends, drawn + MAX_SAMPLED_RUNS, side="right")), start + 1)
+            runs = np.repeat(np.arange(start, stop), failed_runs[start:stop])
+            # Failed runs only: P(m) < u <= 1 for the target m
+            u = target_probas[runs] + (1 - target_probas[runs]) * (1 - rng.random(runs.shape[0]))
+            run_costs = np.searchsorted(-log_probas, -np.log(u), side="right") * BLACK_STONE_ARMOR_PRICE + CLEANSING_COST
+            costs[rebuilding[start:stop]] += np.bincount(runs - start, weights=run_costs, minlength=stop - start)
+            start = stop
+        return costs
+
+    def _recalculate_failstack_costs(self, max_failstack: int = None) -> np.ndarray:
         """Recalculates costs of failstacking
 
-        Recalculates the cost of failstacking and returns a data-frame
+        Recalculates the cost of failstacking and returns an array
         with costs. 
 
+        Args:
+            max_failstack: the highest failstack to include [default: the last failstack of
+                the enhancement table]
+
         Returns:
-            DataFrame of size (121, 2) with two columns: FS and Cost.
+            np.ndarray of length max_failstack + 1 with the cost of each failstack.
         """
-        fs_costs = [self._cost_of_failstack(fs) for fs in range(self.reblath_enhancement.shape[0])]
-        return pd.DataFrame({"FS" : range(self.reblath_enhancement.shape[0]), "Cost" : fs_costs})
+        if max_failstack is None:
+            max_failstack = self.reblath_enhancement.index.shape[0] - 1
+        return self._failstack_costs(max_failstack)
 
-    def _all_failstack_price(self) -> pd.DataFrame:
+    def _price_snapshot(self) -> tuple:
+        """Returns the prices the failstack costs depend on"""
+        return BLACK_STONE_ARMOR_PRICE, CLEANSING_COST, MAX_FAILSTACK_COST
+
+    def _load_failstack_costs(self) -> np.ndarray:
         """Returns cost of failstack building for all failstack value
 
+        The costs are cached on disk, see lib.enhance._cache, and recalculated
+        whenever self._failstack_costs_fingerprint() changes.
+
         Returns:
-            A column of pd.DataFrame object.
+            np.ndarray with the cost of each failstack.
 
         """
-        if self.reblath_fs_costs is not None:
-            return self.reblath_fs_costs.loc[:, "Cost"]
-        else:
-            self.reblath_fs_costs = self._recalculate_failstack_costs()
-            return self.reblath_fs_costs.loc[:, "Cost"]
-        
\ No newline at end of file
+        return _cache.cached_array(pathlib.Path(STRATEGY_COSTS_PATH, "reblath.npz"),
+                                   self._failstack_costs_fingerprint(),
+                                   lib.stats.metrics.STRATEGY_RECALCULATION_SECONDS.timed(type(self).__name__)(
+                                       self._recalculate_failstack_costs))
+
+    def _failstack_costs_fingerprint(self) -> str:
+        """Returns the fingerprint of everything the failstack costs are calculated from"""
+        return _cache.fingerprint({
+            "strategy" : type(self).__name__,
+            "version" : FAILSTACK_COSTS_VERSION,
+            "BLACK_STONE_ARMOR_PRICE" : float(BLACK_STONE_ARMOR_PRICE),
+            "CLEANSING_COST" : float(CLEANSING_COST),
+            "MAX_FAILSTACK_COST" : float(MAX_FAILSTACK_COST),
+            "chances" : _cache.array_digest(np.asarray(self.reblath_enhancement[ENHANCEMENT_LEVEL["15"]], dtype=float)),
+            "failstacks" : int(self.reblath_enhancement.index.shape[0]),
+        })
@@ -0,0 +1,4 @@
+"""Short description of the module stats
+This module is responsible for operational metrics of the calculation engine.
+
+"""
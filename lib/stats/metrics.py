@@ -0,0 +1,215 @@
+"""Operational metrics of the calculation engine.
+
+Metrics are kept in the memory of the process which runs the calculations. When
+crone runs as a service, that is the daemon (lib.daemon.server), so 'crone stats'
+forwarded to it shows what the service has done since it started. Metrics are
+exported in the Prometheus text exposition format by render_prometheus().
+
+Counters and histograms are plain Python numbers updated without locks, so an
+update costs a dictionary lookup and an addition. The daemon answers requests in
+threads, an update racing with another one of the same metric may be lost, which
+does not matter for monitoring. Processes of a pool (e.g. session simulations)
+keep their own metrics, which are not sent back.
+
+Metrics:
+    crone_entry_point_seconds: histogram of the latency of the entry points of the
+        engine, by entry point
+    crone_table_load_seconds: histogram of the time of reading an enhancement or
+        mean clicks table from disk, by tables file; its count is the number of loads
+    crone_strategy_recalculation_seconds: histogram of the time of recalculating
+        failstack costs of a strategy, by strategy
+    crone_cache_requests_total: counter of cache lookups, by cache and result (hit or miss)
+
+Usage::
+    with lib.stats.metrics.ENTRY_POINT_SECONDS.time("enhance_cost"):
+        ...
+    lib.stats.metrics.CACHE_REQUESTS.increment("tables", "hit")
+    print(lib.stats.metrics.render_prometheus())
+
+"""
+import bisect
+import contextlib
+import functools
+import math
+import time
+
+# Upper bounds of the latency buckets in seconds, from a cached lookup to a full table rebuild
+LATENCY_BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2, 5e-2, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+# True in the daemon, whose metrics cover every forwarded command, set by lib.daemon.server
+SERVING = False
+
+_METRICS = []
+
+
+class Counter(object):
+    _type = "counter"
+
+    def __init__(self, name : str, description : str, labels : tuple = ()) -> None:
+        """Monotonic counter with one value for every combination of label values, 'name' ends with _total
+
+        Attributes:
+            self.name: name of the metric
+            self.description: help text of the metric
+            self.labels: names of the labels
+            self._values: dictionary of the values keyed by tuples of label values
+
+        """
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        _METRICS.append(self)
+
+    def increment(self, *label_values, amount : float = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def reset(self) -> None:
+        self._values = {}
+
+    def _samples(self) -> list:
+        """Returns (suffix, labels, value) tuples in the order they are exported"""
+        return [("", _labels, _value) for _labels, _value in sorted(self._values.items())]
+
+
+class Histogram(object):
+    _type = "histogram"
+
+    def __init__(self, name : str, description : str, labels : tuple = (), buckets : tuple = LATENCY_BUCKETS) -> None:
+        """Histogram of observed values with one set of buckets for every combination of label values
+
+        Attributes:
+            self.name: name of the metric
+            self.description: help text of the metric
+            self.labels: names of the labels
+            self.buckets: sorted upper bounds of the buckets, +Inf is added
+            self._counts: dictionary of lists with the number of observations in each bucket
+                (not cumulative), keyed by tuples of label values
+            self._sums: dictionary of the sums of observations, keyed the same way
+
+        """
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts = {}
+        self._sums = {}
+        _METRICS.append(self)
+
+    def observe(self, value : float, *label_values) -> None:
+        counts = self._counts.get(label_values)
+        if counts is None:
+            counts = self._counts[label_values] = [0] * len(self.buckets)
+            self._sums[label_values] = 0.0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[label_values] += value
+
+    @contextlib.contextmanager
+    def time(self, *label_values):
+        """Observes the number of seconds the block takes, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def timed(self, *label_values):
+        """Decorator observing the number of seconds each call of the function takes"""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.time(*label_values):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, *label_values) -> int:
+        return sum(self._counts.get(label_values, ()))
+
+    def sum(self, *label_values) -> float:
+        return self._sums.get(label_values, 0.0)
+
+    def quantile(self, quantile : float, *label_values) -> float:
+        """Returns the upper bound of the bucket holding the 'quantile' (between 0 and 1) of observations"""
+        counts = self._counts.get(label_values)
+        if not counts:
+            return math.nan
+        rank = quantile * sum(counts)
+        cumulative = 0
+        for _bound, _count in zip(self.buckets, counts):
+            cumulative += _count
+            if cumulative >= rank and cumulative > 0:
+                return _bound
+        return math.inf
+
+    def reset(self) -> None:
+        self._counts = {}
+        self._sums = {}
+
+    def _samples(self) -> list:
+        """Returns (suffix, labels, value) tuples in the order they are exported"""
+        samples = []
+        for _labels in sorted(self._counts):
+            cumulative = 0
+            for _bound, _count in zip(self.buckets, self._counts[_labels]):
+                cumulative += _count
+                samples.append(("_bucket", _labels + (_format_value(_bound),), cumulative))
+            samples.append(("_sum", _labels, self._sums[_labels]))
+            samples.append(("_count", _labels, cumulative))
+        return samples
+
+
+ENTRY_POINT_SECONDS = Histogram("crone_entry_point_seconds", "Latency of the entry points of the engine.",
+                                ("entry_point",))
+TABLE_LOAD_SECONDS = Histogram("crone_table_load_seconds", "Time of reading a table from disk.", ("tables",))
+STRATEGY_RECALCULATION_SECONDS = Histogram("crone_strategy_recalculation_seconds",
+                                           "Time of recalculating the failstack costs of a strategy.", ("strategy",))
+CACHE_REQUESTS = Counter("crone_cache_requests_total", "Lookups in the caches of the engine.", ("cache", "result"))
+
+
+def cache_hit_ratio(cache : str) -> float:
+    """Returns the share of lookups in 'cache' which were hits, NaN if there were none"""
+    hits = CACHE_REQUESTS.value(cache, "hit")
+    lookups = hits + CACHE_REQUESTS.value(cache, "miss")
+    return hits / lookups if lookups else math.nan
+
+
+def caches() -> list:
+    """Returns the names of the caches looked up so far"""
+    return sorted({_labels[0] for _labels in CACHE_REQUESTS._values})
+
+
+def reset() -> None:
+    """Sets all metrics back to zero"""
+    for _metric in _METRICS:
+        _metric.reset()
+
+
+def render_prometheus() -> str:
+    """Returns all metrics in the Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for _metric in _METRICS:
+        lines.append("# HELP {} {}".format(_metric.name, _metric.description))
+        lines.append("# TYPE {} {}".format(_metric.name, _metric._type))
+        label_names = _metric.labels
+        for _suffix, _labels, _value in _metric._samples():
+            names = label_names + ("le",) if _suffix == "_bucket" else label_names
+            label_text = ",".join('{}="{}"'.format(_name, _escape(_label)) for _name, _label in zip(names, _labels))
+            lines.append("{}{}{} {}".format(_metric.name, _suffix, "{" + label_text + "}" if label_text else "",
+                                            _format_value(_value)))
+    return "\n".join(lines) + "\n"
+
+
+def _format_value(value : float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(label : str) -> str:
+    return str(label).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
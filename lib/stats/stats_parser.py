@@ -0,0 +1,87 @@
+"""
+Usage:
+    crone stats [--format <format>] [--output <file>] [--reset]
+
+Displays the operational metrics of the calculation engine: latency of its entry
+points, table loads, strategy recalculations and cache hit ratios. The metrics
+are those of the crone daemon, collected since it started. Without a daemon
+(e.g. CRONE_NO_DAEMON set, or the first call, which starts it) the command runs
+in a fresh process, which has not calculated anything yet, so the metrics are
+nearly empty. A note on the standard error says so.
+
+Options:
+    -h, --help          Display this help page
+    -f, --format <format>
+                        Format of the metrics [default: prometheus]
+                            Possible values:
+                                prometheus      Prometheus text exposition format
+                                summary         Human readable tables
+    -o, --output <file>
+                        Write the metrics to <file> instead of displaying them, replacing it
+                            atomically (e.g. for the textfile collector of node_exporter)
+    -r, --reset         Set all metrics back to zero after reading them
+
+"""
+import os
+import sys
+
+# Options holding paths, crone.py makes them absolute before forwarding them to the daemon
+PATH_OPTIONS = ["--output"]
+
+
+def _summary() -> str:
+    """Returns the metrics formatted as human readable tables"""
+    import lib.stats.metrics
+    metrics = lib.stats.metrics
+
+    lines = ["{:<24}{:>10}{:>14}{:>14}{:>14}".format("Entry point", "Calls", "Mean [s]", "p50 [s] <=", "p99 [s] <=")]
+    for _entry_point in ["enhance_chance", "enhance_cost", "single_enhancement", "fs_cost"]:
+        calls = metrics.ENTRY_POINT_SECONDS.count(_entry_point)
+        mean = metrics.ENTRY_POINT_SECONDS.sum(_entry_point) / calls if calls else float("nan")
+        lines.append("{:<24}{:>10}{:>14.3g}{:>14.3g}{:>14.3g}".format(
+            _entry_point, calls, mean, metrics.ENTRY_POINT_SECONDS.quantile(0.5, _entry_point),
+            metrics.ENTRY_POINT_SECONDS.quantile(0.99, _entry_point)))
+
+    lines.append("")
+    lines.append("{:<24}{:>10}{:>14}".format("Tables", "Loads", "Total [s]"))
+    for (_tables,) in sorted(metrics.TABLE_LOAD_SECONDS._counts):
+        lines.append("{:<24}{:>10}{:>14.3g}".format(_tables, metrics.TABLE_LOAD_SECONDS.count(_tables),
+                                                      metrics.TABLE_LOAD_SECONDS.sum(_tables)))
+
+    lines.append("")
+    lines.append("{:<24}{:>10}{:>14}".format("Strategy", "Recalcs", "Total [s]"))
+    for (_strategy,) in sorted(metrics.STRATEGY_RECALCULATION_SECONDS._counts):
+        lines.append("{:<24}{:>10}{:>14.3g}".format(_strategy, metrics.STRATEGY_RECALCULATION_SECONDS.count(_strategy),
+                                                      metrics.STRATEGY_RECALCULATION_SECONDS.sum(_strategy)))
+
+    lines.append("")
+    lines.append("{:<24}{:>10}{:>14}".format("Cache", "Lookups", "Hit ratio"))
+    for _cache in metrics.caches():
+        lookups = metrics.CACHE_REQUESTS.value(_cache, "hit") + metrics.CACHE_REQUESTS.value(_cache, "miss")
+        lines.append("{:<24}{:>10}{:>14.3f}".format(_cache, lookups, metrics.cache_hit_ratio(_cache)))
+    return "\n".join(lines) + "\n"
+
+
+def main(**kwargs):
+    import lib.stats.metrics
+
+    if kwargs["--format"] == "prometheus":
+        text = lib.stats.metrics.render_prometheus()
+    elif kwargs["--format"] == "summary":
+        text = _summary()
+    else:
+        exit("{} is not a format of the metrics. See 'crone stats --help'.".format(kwargs["--format"]))
+
+    if not lib.stats.metrics.SERVING:
+        print("No crone daemon is running, these are the nearly empty metrics of this call only.", file=sys.stderr)
+
+    if kwargs["--output"] is not None:
+        temporary_path = "{}.{}.tmp".format(kwargs["--output"], os.getpid())
+        with open(temporary_path, "w") as output_file:
+            output_file.write(text)
+        os.replace(temporary_path, kwargs["--output"])
+    else:
+        print(text, end="")
+
+    if kwargs["--reset"]:
+        lib.stats.metrics.reset()
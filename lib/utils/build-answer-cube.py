@@ -0,0 +1,10 @@
+import lib.enhance.cube
+
+# RUN ONLY FROM PACKAGE LEVEL
+# This module evaluates the engine for every gear type, goal level and base cost
+# of the grid in lib.enhance.cube and saves the answer cube next to the tables.
+# Rerun it after changing prices, regenerating the tables or changing the engine,
+# an out of date cube is not used.
+
+if __name__ == "__main__":
+    lib.enhance.cube.build_cube()
@@ -1,51 +1,78 @@
-import pandas as pd 
+import concurrent.futures
+import os
+
+import pandas as pd
 import numpy as np
-import random
 import tqdm
 
+from lib.enhance import _tables
 from lib.enhance import _utils
+from lib.enhance import _click_kernel
 
 # RUN ONLY FROM PACKAGE LEVEL
 # This module simulates enhancing process to determine mean clicks to enhance to next level
+# Each cell is simulated in batches until the confidence interval of its mean is narrow enough
+# Cells are simulated in a pool of threads, which run in parallel if numba is installed
+
+# Target half-width of the confidence interval relative to the mean
+RELATIVE_PRECISION = 0.005
+# Quantile of the normal distribution for the confidence interval (95%)
+CONFIDENCE_Z = 1.96
+MIN_REPETITIONS = 100
+MAX_REPETITIONS = 1000000
+# The control variate is used only after the real and control enhancements differed this many times,
+# before that the estimate of its coefficient is not reliable
+MIN_CONTROL_DIFFERENCES = 30
+NUMBER_OF_THREADS = os.cpu_count()
+
 
-def simulate_enhancement(probability_df : pd.DataFrame, row : int, column : int) -> float:
-    mean_clicks_to_enhance = 0
-    # set failstack increase
-    # print("Row {} Column {}".format(row, column))
-    # print("Shape of probability df {}".format(probability_df.shape))
-    if probability_df.shape[1] < 15:
-        failstack_increase = 1
-    else:
-        failstack_increase = np.max([1, column - 14])
-    
-    clicks_to_enhance_array = []
-
-    # print("failstack increase: {}".format(failstack_increase))
-    # print("Start probability: {}".format(probability_df.iloc[row, column]))
-
-    for _repetition in range(NUMBER_OF_REPETITIONS):
-        # print("Start new simulation")
-        _simulation_row = row
-        clicks_to_enhance = 0
-        succesfully_enhanced = False
-        while (succesfully_enhanced == False):
-            # print("Simulation row: {}".format(_simulation_row))
-            random_number = random.uniform(0, 1)
-            if (random_number <= probability_df.iloc[_simulation_row, column]):
-                succesfully_enhanced = True
-                clicks_to_enhance = clicks_to_enhance + 1
-                clicks_to_enhance_array.append(clicks_to_enhance)
-                # print("Success. Clicks to enhance: {}. Simulation row still: {}".format(clicks_to_enhance, _simulation_row))
-            else:
-                clicks_to_enhance = clicks_to_enhance + 1
-                _simulation_row = np.min([failstack_increase + _simulation_row, probability_df.shape[0] - 1])
-                # print("Failure. Clicks to enhance: {}. New simulation row: {}".format(clicks_to_enhance, _simulation_row))
-
-    mean_clicks_to_enhance = np.mean(clicks_to_enhance_array)
-    # print("Mean clicks to enhance: {}".format(mean_clicks_to_enhance))
-    return mean_clicks_to_enhance
-
-def calculate_one_table(probability_table : pd.DataFrame) -> pd.DataFrame:
+def simulate_enhancement(probabilities : np.ndarray, row : int, column : int, failstack_increase : int,
+                         rng : np.random.Generator) -> tuple:
+    """Estimates the mean number of clicks needed to enhance 'column' starting at failstack 'row'.
+
+    Simulates in batches until the half-width of the confidence interval is lower than
+    RELATIVE_PRECISION of the mean or MAX_REPETITIONS is reached. Each batch is only as big
+    as the current estimate of the variance suggests is still needed.
+
+    Returns:
+        Tuple
+        [0]: estimate of the mean number of clicks
+        [1]: standard error of the estimate
+    """
+    starting_chance = probabilities[row, column]
+    if row == probabilities.shape[0] - 1:
+        # Failstack does not grow past the last row, so the number of clicks is geometric
+        return 1 / starting_chance, 0.0
+
+    clicks = np.empty(0)
+    control = np.empty(0)
+    batch_size = MIN_REPETITIONS
+    while True:
+        batch_clicks, batch_control = _click_kernel.simulate_clicks(probabilities, row, column, failstack_increase,
+                                                                    batch_size, rng)
+        clicks = np.concatenate((clicks, batch_clicks))
+        control = np.concatenate((control, batch_control))
+
+        mean, standard_error, deviation = _control_variate_estimate(clicks, control, starting_chance)
+        if standard_error * CONFIDENCE_Z <= RELATIVE_PRECISION * mean or clicks.shape[0] >= MAX_REPETITIONS:
+            return mean, standard_error
+
+        needed = int((CONFIDENCE_Z * deviation / (RELATIVE_PRECISION * mean)) ** 2) + 1
+        batch_size = int(np.clip(needed - clicks.shape[0], MIN_REPETITIONS, MAX_REPETITIONS - clicks.shape[0]))
+
+
+def _control_variate_estimate(clicks : np.ndarray, control : np.ndarray, starting_chance : float) -> tuple:
+    """Returns the control variate estimate of the mean clicks, its standard error and the
+    standard deviation of a single adjusted sample."""
+    adjusted = clicks
+    if starting_chance > 0 and np.count_nonzero(clicks != control) >= MIN_CONTROL_DIFFERENCES:
+        beta = np.cov(clicks, control)[0, 1] / np.var(control, ddof=1)
+        adjusted = clicks - beta * (control - 1 / starting_chance)
+    deviation = np.std(adjusted, ddof=1) if adjusted.shape[0] > 1 else 0.0
+    return np.mean(adjusted), deviation / np.sqrt(adjusted.shape[0]), deviation
+
+
+def calculate_one_table(probability_table : pd.DataFrame, rng : np.random.Generator) -> tuple:
     """Calculates mean number of clicks to enhance to next level
     It works on a pd.DataFrame containing probabilities of enhancement
     depending on the enhancement level (columns) and failstack number (verses).
@@ -53,26 +80,46 @@ def calculate_one_table(probability_table : pd.DataFrame) -> pd.DataFrame:
     Args:
         probability_table: contains probabilities of enhancing given
             enhancement level (columns) and failstack number (verses)
+        rng: source of random numbers
 
     Returns:
-        pd.DataFrame containing mean number of clicks in each cell.
-        Size of the return dataframe is the same as the input dataframe.
-    
+        Tuple of pd.DataFrames of the same size as the input dataframe
+        [0]: mean number of clicks in each cell
+        [1]: standard error of the mean in each cell
+
     """
-    ret = pd.DataFrame(index=probability_table.index, columns=probability_table.columns)
+    ret = pd.DataFrame(index=probability_table.index, columns=probability_table.columns, dtype=float)
     ret["FS"] = probability_table["FS"]
+    standard_errors = ret.copy()
 
     rows_no = ret.shape[0]
     columns_no = ret.shape[1]
-
-    for _i in tqdm.trange(rows_no):
-        for _j in range(1, columns_no):
-            ret.at[ret.index[_i], ret.columns[_j]] = simulate_enhancement(probability_df=probability_table, row=_i, column=_j)
-    
-    return ret
+    probabilities = np.ascontiguousarray(probability_table.to_numpy(dtype=float))
+
+    # Every cell gets its own independent stream of random numbers, so that cells can run in any thread
+    cells = [(_i, _j) for _j in range(1, columns_no) for _i in range(rows_no)]
+    seeds = np.random.SeedSequence(rng.integers(np.iinfo(np.int64).max)).spawn(len(cells))
+
+    def simulate_cell(cell, seed):
+        row, column = cell
+        # set failstack increase
+        if probability_table.shape[1] < 15:
+            failstack_increase = 1
+        else:
+            failstack_increase = np.max([1, column - 14])
+        return simulate_enhancement(probabilities, row=row, column=column, failstack_increase=failstack_increase,
+                                    rng=np.random.default_rng(seed))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=NUMBER_OF_THREADS) as executor:
+        results = executor.map(simulate_cell, cells, seeds)
+        for (_i, _j), (mean, standard_error) in tqdm.tqdm(zip(cells, results), total=len(cells)):
+            ret.iat[_i, _j] = mean
+            standard_errors.iat[_i, _j] = standard_error
+
+    return ret, standard_errors
 
 def main():
-    random.seed()
+    rng = np.random.default_rng()
     # List of table names in the enhance-tables file.
     # Each table contains probabilities of enhancing
     probability_tables_names = [
@@ -88,17 +135,11 @@ def main():
     # Each element is pd.DataFrame
     probability_tables_list = [pd.read_hdf(_utils.ENHANCE_TABLES_PATH, table_name) for table_name in probability_tables_names]
 
-    mean_clicks_tables_list = []
-
-
-    for _table in tqdm.tqdm(probability_tables_list):
-        mean_clicks_df = calculate_one_table(_table)
-        mean_clicks_tables_list.append(mean_clicks_df)
-
-    mean_clicks_dict = {name : table for name, table in zip(probability_tables_names, mean_clicks_tables_list)}
-    for key in mean_clicks_dict:
-        mean_clicks_dict[key].to_hdf(_utils.MEAN_CLICKS_TABLES_PATH, key)
+    for name, _table in zip(probability_tables_names, tqdm.tqdm(probability_tables_list)):
+        mean_clicks_df, standard_errors_df = calculate_one_table(_table, rng)
+        mean_clicks_df.to_hdf(_utils.MEAN_CLICKS_TABLES_PATH, key=name)
+        standard_errors_df.to_hdf(_utils.MEAN_CLICKS_TABLES_PATH, key=name + _utils.STANDARD_ERROR_TABLE_SUFFIX)
+    _tables.export_tables(_utils.MEAN_CLICKS_TABLES_PATH)
 
 if __name__ == "__main__":
-    NUMBER_OF_REPETITIONS = 1000
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,10 @@
+import lib.enhance._tables
+import lib.enhance._utils
+
+# RUN ONLY FROM PACKAGE LEVEL
+# This module saves the enhancement and mean clicks tables as .npz archives,
+# which the engine reads without pandas and PyTables
+
+if __name__ == "__main__":
+    lib.enhance._tables.export_tables(lib.enhance._utils.ENHANCE_TABLES_PATH)
+    lib.enhance._tables.export_tables(lib.enhance._utils.MEAN_CLICKS_TABLES_PATH)
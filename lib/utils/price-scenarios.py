@@ -0,0 +1,16 @@
+import sys
+
+import lib.enhance.chunked
+
+# RUN ONLY FROM PACKAGE LEVEL
+# This module prices a scenario file too large for memory, chunk by chunk, see lib.enhance.chunked
+# Usage: python lib/utils/price-scenarios.py <scenarios.csv> <output-directory> [<chunk-size>]
+# Run it again with the same arguments to continue an interrupted job.
+
+if __name__ == "__main__":
+    if len(sys.argv) not in [3, 4]:
+        exit("Usage: python lib/utils/price-scenarios.py <scenarios.csv> <output-directory> [<chunk-size>]")
+    chunk_size = int(sys.argv[3]) if len(sys.argv) == 4 else lib.enhance.chunked.CHUNK_SIZE
+    manifest = lib.enhance.chunked.ChunkedJob("reblath", sys.argv[1], sys.argv[2], chunk_size).run()
+    print("Priced {} scenarios in {} chunks".format(sum(_chunk["rows"] for _chunk in manifest["chunks"]),
+                                                    len(manifest["chunks"])))
@@ -1,12 +1,13 @@
-import pandas as pd 
+import pathlib
 
 import lib.enhance.strategy
 import lib.enhance._utils
 
 # RUN ONLY FROM PACKAGE LEVEL
-# This module recalculates failstack costs and appends it to enhance-tables.h5
-# for quick access
+# This module recalculates failstack costs and saves them in data/strategy-costs
+# for quick access. It is needed only to prepare the cache in advance, stale costs
+# are recalculated automatically on first use.
 
 if __name__ == "__main__":
-    recalculated_costs = lib.enhance.strategy.Reblath14()._recalculate_failstack_costs()
-    recalculated_costs.to_hdf(lib.enhance._utils.ENHANCE_TABLES_PATH, key=lib.enhance._utils.REBLATH_FAILSTACK_COSTS_TABLE_KEY)
+    pathlib.Path(lib.enhance._utils.STRATEGY_COSTS_PATH, "reblath.npz").unlink(missing_ok=True)
+    print(lib.enhance.strategy.Reblath14().failstack_costs())
@@ -0,0 +1,16 @@
+import lib.enhance.regression
+
+# RUN ONLY FROM PACKAGE LEVEL
+# This module compares every optimized engine with the reference Enhancer on all gear types,
+# enhancement levels, a grid of base costs and failstacks, see lib.enhance.regression.
+# Exits with status 1 if some engine does not match the reference.
+
+if __name__ == "__main__":
+    comparisons = lib.enhance.regression.compare()
+    row_format = "{:<16}{:<8}{:>8}{:>22}{:>24}"
+    print(row_format.format("Engine", "Value", "Cases", "Max relative error", "Failstack mismatches"))
+    for _comparison in comparisons:
+        print(row_format.format(_comparison.engine, _comparison.quantity, _comparison.cases,
+                                "{:.3e}".format(_comparison.max_relative_error), _comparison.argmin_mismatches))
+    if not lib.enhance.regression.passed(comparisons):
+        exit(1)
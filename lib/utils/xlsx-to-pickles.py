@@ -1,10 +1,38 @@
-import pandas as pd
-import glob
+import pathlib
+import sys
 
-file_list = glob.glob("data/*.xlsx")
-data_list = [pd.read_excel(file_path) for file_path in file_list]
+import lib.enhance.ingest
+from lib.enhance._utils import ENHANCE_TABLES_PATH
+from lib.enhance._utils import GEAR_TYPE
 
-data_table_names = [file_name.split(".")[0].split("data\\")[1] for file_name in file_list]
+# RUN ONLY FROM PACKAGE LEVEL
+# This module ingests the data/*.xlsx spreadsheets into the enhancement tables, see lib.enhance.ingest
+# Usage: python lib/utils/xlsx-to-pickles.py [--force]
+# Tables which do not pass the validation stop the ingestion, unless --force is given. Then they are
+# saved anyway, with the problems listed in their metadata.
 
-for id_, table in enumerate(data_list) :
-    table.to_hdf("data/enhance-tables.h5", data_table_names[id_])
\ No newline at end of file
+if __name__ == "__main__":
+    if sys.argv[1:] not in [[], ["--force"]]:
+        exit("Usage: python lib/utils/xlsx-to-pickles.py [--force]")
+    force = sys.argv[1:] == ["--force"]
+
+    results = lib.enhance.ingest.ingest(pathlib.Path(ENHANCE_TABLES_PATH.parent).glob("*.xlsx"))
+    invalid = False
+    for _result in results:
+        if _result.table is None:
+            print("{}: skipped, {}".format(_result.key, _result.problems[0]))
+            continue
+        print("{}: {} failstacks, levels {}".format(_result.key, _result.table.index.shape[0],
+                                                     " ".join(_result.table.metadata["levels"])))
+        for _problem in _result.problems:
+            invalid = True
+            print("    {}".format(_problem))
+
+    keys = {_result.key for _result in results if _result.table is not None}
+    missing = sorted(_gear_type for _gear_type, _key in GEAR_TYPE.items() if _key not in keys)
+    if missing:
+        print("Gear types without an enhancement table: {}".format(", ".join(missing)))
+
+    if invalid and not force:
+        exit("Some tables are not valid, nothing was saved. Fix the spreadsheets or run with --force.")
+    lib.enhance.ingest.save_tables(ENHANCE_TABLES_PATH, results)
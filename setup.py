@@ -11,8 +11,14 @@ setup(
     author_email="konrad.pagacz@gmail.com",
     install_requires=[
         "docopt",
-        "pandas",
         "numpy",
-        "tables",
-    ]
+    ],
+    extras_require={
+        # Building the tables from the spreadsheets and formatting verbose output
+        "tables": ["pandas", "tables", "openpyxl"],
+        # Compiled kernel for regenerating the mean clicks tables
+        "fast": ["numba"],
+        # Sparse solver for the exact cost of enhancing with downgrades
+        "sparse": ["scipy"],
+    }
 )
\ No newline at end of file